@@ -0,0 +1,70 @@
+import json
+import zlib
+from poetry_analyzer import LITERARY_DEVICE_INFO
+
+# Compact storage format for Composition analysis results. The poem's lines
+# are already stored in poem_text and the literary device explanations are
+# constants, so both are dropped before the rest is written as compact JSON
+# behind a one-byte format tag. Larger payloads are also zlib-compressed.
+
+FORMAT_JSON = 1
+FORMAT_ZLIB_JSON = 2
+COMPRESS_MIN_BYTES = 1024  # below this, decompression costs more than the bytes saved
+COMPRESSION_LEVEL = 6
+
+
+def poem_lines(poem_text):
+    """The analysis "lines" of a poem: its non-blank lines, stripped"""
+    return [line for line in map(str.strip, (poem_text or '').split('\n')) if line]
+
+
+def pack_analysis(analysis, poem_text=None):
+    """Encode an analysis dict for storage alongside its poem text"""
+    compact = dict(analysis)
+    if 'lines' in compact and compact['lines'] == poem_lines(poem_text):
+        compact['lines'] = True  # rebuilt from poem_text on decode
+    
+    devices = compact.get('literary_devices')
+    if isinstance(devices, dict):
+        compact['literary_devices'] = {
+            name: {key: value for key, value in result.items()
+                   if LITERARY_DEVICE_INFO.get(name, {}).get(key) != value} if isinstance(result, dict) else result
+            for name, result in devices.items()
+        }
+    
+    payload = json.dumps(compact, separators=(',', ':')).encode('utf-8')
+    if len(payload) < COMPRESS_MIN_BYTES:
+        return bytes([FORMAT_JSON]) + payload
+    return bytes([FORMAT_ZLIB_JSON]) + zlib.compress(payload, COMPRESSION_LEVEL)
+
+
+def unpack_analysis(blob, poem_text=None):
+    """
+    Decode a packed analysis back into the dict analyze_poem returned
+    A blob that cannot be decoded raises ValueError.
+    """
+    if not blob:
+        raise ValueError("Empty analysis blob")
+    version = blob[0]
+    if version == FORMAT_JSON:
+        analysis = json.loads(blob[1:])
+    elif version == FORMAT_ZLIB_JSON:
+        try:
+            analysis = json.loads(zlib.decompress(blob[1:]))
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed analysis: {e}") from e
+    else:
+        raise ValueError(f"Unsupported analysis format: {version}")
+    if not isinstance(analysis, dict):
+        raise ValueError(f"Analysis is a {type(analysis).__name__}, not an object")
+    
+    if analysis.get('lines') is True:
+        analysis['lines'] = poem_lines(poem_text)
+    
+    devices = analysis.get('literary_devices')
+    if isinstance(devices, dict):
+        for name, result in devices.items():
+            if isinstance(result, dict):  # older analyses stored a bare flag
+                for key, value in LITERARY_DEVICE_INFO.get(name, {}).items():
+                    result.setdefault(key, value)
+    return analysis
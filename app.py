@@ -5,8 +5,13 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (LOG_LEVEL=DEBUG for verbose output; per-stage timings are at /metrics).
+# gunicorn_config.py lowers the level and switches to key=value lines in production
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                    format=os.environ.get('LOG_FORMAT', logging.BASIC_FORMAT))
+
+# Request threads per process; gunicorn_config.py sets this from its thread count
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 4))
 
 class Base(DeclarativeBase):
     pass
@@ -18,12 +23,34 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+def engine_options(database_url, threads=WEB_THREADS):
+    """
+    SQLAlchemy pool settings for a database URL
+    Request threads and analysis job threads each hold at most one connection,
+    so the pool keeps that many open; DB_POOL_SIZE and DB_MAX_OVERFLOW override.
+    """
+    if database_url.startswith('sqlite') and (database_url in ('sqlite://', 'sqlite:///') or ':memory:' in database_url):
+        return {}  # one shared in-memory connection, nothing to size
+    connections = threads + int(os.environ.get('ANALYZE_JOB_WORKERS', 2))
+    if database_url.startswith('sqlite'):
+        # A local file never goes stale, so skip the pre-ping round trip; wait on
+        # locks held by other workers' writers instead of failing at once
+        options = {"pool_size": connections, "max_overflow": threads, "connect_args": {"timeout": 15}}
+    else:
+        options = {
+            "pool_size": connections,
+            "max_overflow": threads,  # bursts of streamed responses
+            "pool_timeout": 10,
+            "pool_recycle": 300,
+            "pool_pre_ping": True,
+        }
+    options["pool_size"] = int(os.environ.get('DB_POOL_SIZE', options["pool_size"]))
+    options["max_overflow"] = int(os.environ.get('DB_MAX_OVERFLOW', options["max_overflow"]))
+    return options
+
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///poetry_music.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 
 # Initialize the app with the extension
 db.init_app(app)
@@ -35,6 +62,11 @@ with app.app_context():
     # Import models to ensure tables are created
     import models
     db.create_all()
+    
+    # Bring existing tables up to date with the models
+    from migrations import run_migrations
+    run_migrations(db)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server; production runs gunicorn -c gunicorn_config.py main:app
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG', '1') != '0')
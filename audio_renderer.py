@@ -0,0 +1,327 @@
+import os
+import time
+import wave
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from smf import read_smf
+
+# Server-side MIDI to WAV rendering. A small wavetable synthesizer turns the
+# notes of a composition's MIDI into 16-bit mono PCM; renders run on a bounded
+# process pool and are cached on disk by the MIDI's content hash, evicting the
+# least recently played files once the cache outgrows its size limit. A MIDI
+# file is rendered at most once per renderer version: repeat plays, and
+# concurrent requests for a render in progress, reuse the same file.
+
+# Bump whenever the rendered audio for a given MIDI file changes, so cached renders are replaced
+AUDIO_RENDERER_VERSION = 1
+
+DEFAULT_AUDIO_DIR = os.environ.get(
+    'AUDIO_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'audio_cache')
+)
+DEFAULT_AUDIO_MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+DEFAULT_AUDIO_WORKERS = int(os.environ.get('AUDIO_WORKERS', 2))
+DEFAULT_AUDIO_QUEUE_SIZE = int(os.environ.get('AUDIO_QUEUE_SIZE', 8))  # renders running or waiting per process
+DEFAULT_SAMPLE_RATE = int(os.environ.get('AUDIO_SAMPLE_RATE', 22050))
+DEFAULT_MAX_SECONDS = float(os.environ.get('AUDIO_MAX_SECONDS', 600))  # longer compositions are cut off
+# Files played or rendered this recently are never evicted, so a path handed to
+# send_file (by this or another worker) is still there when the response opens it
+EVICTION_GRACE_SECONDS = 60
+
+TABLE_SIZE = 2048
+MASTER_PEAK = 0.89  # mixes are normalized to this peak, leaving headroom below full scale
+DRUM_CHANNEL = 9
+
+# Instrument families by General MIDI program: harmonic amplitudes of the
+# single-cycle wavetable, then attack (s), decay rate (1/s), sustain level and release (s)
+FAMILIES = {
+    'piano': ((1.0, 0.5, 0.3, 0.2, 0.1, 0.05), 0.005, 3.0, 0.0, 0.08),
+    'guitar': ((1.0, 0.7, 0.45, 0.3, 0.2, 0.12, 0.08), 0.003, 4.5, 0.0, 0.05),
+    'strings': (tuple(1.0 / n for n in range(1, 13)), 0.08, 1.0, 0.7, 0.2),
+    'reed': (tuple(1.0 / n if n % 2 else 0.0 for n in range(1, 10)), 0.03, 1.5, 0.6, 0.1),
+    'pipe': ((1.0, 0.12, 0.05), 0.04, 1.0, 0.8, 0.12),
+}
+PROGRAM_FAMILIES = [('piano', range(0, 24)), ('guitar', range(24, 40)), ('strings', range(40, 64)),
+                    ('reed', range(64, 72)), ('pipe', range(72, 80))]
+
+# Fixed noise for snares and cymbals, so the same MIDI always renders the same samples
+_NOISE = np.random.default_rng(0).uniform(-1.0, 1.0, 2 * 48000)
+
+
+class AudioBusy(RuntimeError):
+    """The render queue is full"""
+
+
+def _wavetable(harmonics):
+    phase = np.arange(TABLE_SIZE) * (2 * np.pi / TABLE_SIZE)
+    table = sum(amplitude * np.sin(phase * (n + 1)) for n, amplitude in enumerate(harmonics) if amplitude)
+    return table / np.abs(table).max()
+
+
+WAVETABLES = {name: _wavetable(harmonics) for name, (harmonics, *_) in FAMILIES.items()}
+
+
+def program_family(program):
+    for name, programs in PROGRAM_FAMILIES:
+        if program in programs:
+            return name
+    return 'piano'
+
+
+def _note_wave(family, pitch, sample_count, sample_rate):
+    """One melodic note at full velocity, sample_count long plus its release"""
+    _, attack, decay, sustain, release = FAMILIES[family]
+    release_count = int(release * sample_rate)
+    t = np.arange(sample_count + release_count) / sample_rate
+    frequency = 440.0 * 2 ** ((pitch - 69) / 12)
+    wave_data = WAVETABLES[family][(t * frequency * TABLE_SIZE).astype(np.int64) % TABLE_SIZE]
+    envelope = np.minimum(t / attack, 1.0) * (sustain + (1 - sustain) * np.exp(-decay * t))
+    held = sample_count / sample_rate
+    if release_count:
+        tail = t >= held
+        envelope[tail] = envelope[sample_count - 1 if sample_count else 0] * (1 - (t[tail] - held) / release)
+    return wave_data * envelope
+
+
+def _drum_wave(pitch, sample_rate):
+    """Percussion hit: a falling sine for kicks, tone and noise for snares, filtered noise otherwise"""
+    if pitch in (35, 36):
+        t = np.arange(int(0.35 * sample_rate)) / sample_rate
+        frequency = 45 + 75 * np.exp(-t * 30)
+        return np.sin(2 * np.pi * np.cumsum(frequency) / sample_rate) * np.exp(-t * 9)
+    if pitch in (38, 40):
+        t = np.arange(int(0.2 * sample_rate)) / sample_rate
+        return (0.6 * _NOISE[:len(t)] + 0.4 * np.sin(2 * np.pi * 185 * t)) * np.exp(-t * 22)
+    t = np.arange(int(0.08 * sample_rate)) / sample_rate
+    return np.diff(_NOISE[:len(t) + 1]) * 0.5 * np.exp(-t * 60)
+
+
+def synthesize(midi_data, sample_rate=DEFAULT_SAMPLE_RATE, max_seconds=DEFAULT_MAX_SECONDS):
+    """Mix every note of a MIDI file into a float array of mono samples"""
+    division, tempo_bpm, tracks, programs = read_smf(midi_data)
+    seconds_per_tick = 60.0 / tempo_bpm / division
+    length = 0
+    for notes in tracks:
+        for note in notes:
+            length = max(length, int(note[3] * seconds_per_tick * sample_rate))
+    limit = int(max_seconds * sample_rate)
+    mix = np.zeros(min(length, limit) + sample_rate)  # room for release tails
+
+    # Repeated notes of the same length share one synthesized waveform
+    waves = {}
+    for notes, program in zip(tracks, programs):
+        family = program_family(program)
+        for channel, pitch, start_tick, end_tick, velocity in notes:
+            start = int(start_tick * seconds_per_tick * sample_rate)
+            if start >= limit:
+                break
+            if channel == DRUM_CHANNEL:
+                key = ('drums', pitch)
+                if key not in waves:
+                    waves[key] = _drum_wave(pitch, sample_rate)
+            else:
+                sample_count = int((end_tick - start_tick) * seconds_per_tick * sample_rate)
+                key = (family, pitch, sample_count)
+                if key not in waves:
+                    waves[key] = _note_wave(family, pitch, sample_count, sample_rate)
+            wave_data = waves[key][:len(mix) - start]
+            mix[start:start + len(wave_data)] += wave_data * (velocity / 127)
+
+    mix = mix[:min(length, limit)]
+    peak = np.abs(mix).max() if len(mix) else 0.0
+    return mix * (MASTER_PEAK / peak) if peak else mix
+
+
+def write_wav(samples, path, sample_rate=DEFAULT_SAMPLE_RATE):
+    with wave.open(path, 'wb') as output_file:
+        output_file.setnchannels(1)
+        output_file.setsampwidth(2)
+        output_file.setframerate(sample_rate)
+        output_file.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes())
+
+
+def _render_file(midi_data, path, sample_rate, max_seconds):
+    """Pool task: render MIDI bytes to a WAV file, written atomically; returns its size"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write_wav(synthesize(midi_data, sample_rate, max_seconds), tmp_path, sample_rate)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+class AudioRenderer:
+    """
+    Renders MIDI to WAV on a bounded process pool, caching files by MIDI content hash
+    At most queue_size renders are running or waiting in each process; beyond
+    that render() raises AudioBusy. The pool is created lazily so it is never
+    inherited across fork. Cache sizes are tracked in memory, from one walk of
+    the cache directory and then the files this process renders or plays.
+    """
+
+    # stats() keys that only ever grow (Prometheus counters); the rest are current sizes
+    COUNTERS = ('hits', 'misses', 'renders', 'failures', 'rejected', 'evictions')
+
+    def __init__(self, root=DEFAULT_AUDIO_DIR, max_bytes=DEFAULT_AUDIO_MAX_BYTES, workers=DEFAULT_AUDIO_WORKERS,
+                 queue_size=DEFAULT_AUDIO_QUEUE_SIZE, sample_rate=DEFAULT_SAMPLE_RATE, max_seconds=DEFAULT_MAX_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.queue_size = queue_size
+        self.sample_rate = sample_rate
+        self.max_seconds = max_seconds
+        self._pool = None
+        self._pool_pid = None
+        self._pending = {}  # MIDI digest -> Future of a render in progress
+        self._files = None  # path -> size, least recently played first; built on first use
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def filename(self, digest):
+        return f"{digest}.wav"
+
+    @property
+    def version(self):
+        """Renderer version and sample rate; renders of each live apart, so old ones are never served"""
+        return f"v{AUDIO_RENDERER_VERSION}-{self.sample_rate}"
+
+    def path(self, digest):
+        return os.path.join(self.root, self.version, digest[:2], self.filename(digest))
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+                self._pending = {}
+            return self._pool
+
+    def cached_path(self, digest):
+        """Path of the cached render of a MIDI file, or None; marks it recently played"""
+        path = self.path(digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(path)
+            return None
+        with self._lock:
+            self._track(path)
+        self._count('hits')
+        return path
+
+    def _index(self):
+        """The cache index, walking the cache directory the first time; call with the lock held"""
+        if self._files is None:
+            files = []
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    if name.endswith('.wav'):
+                        path = os.path.join(directory, name)
+                        try:
+                            stat = os.stat(path)
+                        except FileNotFoundError:
+                            continue
+                        files.append((stat.st_mtime, path, stat.st_size))
+            self._files = OrderedDict((path, size) for _, path, size in sorted(files))
+            self._bytes = sum(self._files.values())
+        return self._files
+
+    def _track(self, path, size=None):
+        """Record a file as the most recently played; call with the lock held"""
+        files = self._index()
+        if path in files and size is None:
+            files.move_to_end(path)
+            return
+        if size is None:
+            try:
+                size = os.path.getsize(path)  # rendered by another worker
+            except FileNotFoundError:
+                return
+        self._bytes += size - files.pop(path, 0)
+        files[path] = size
+
+    def _forget(self, path):
+        """Drop a file from the index; call with the lock held"""
+        if self._files is not None and path in self._files:
+            self._bytes -= self._files.pop(path)
+
+    def submit(self, midi_data, digest):
+        """Future for the render of a MIDI file, joining one already in progress; raises AudioBusy"""
+        executor = self._executor()
+        with self._lock:
+            future = self._pending.get(digest)
+            if future is not None:
+                return future
+            if len(self._pending) >= self.queue_size:
+                self._counters['rejected'] += 1
+                raise AudioBusy(f"{len(self._pending)} audio renders already queued")
+            self._counters['misses'] += 1
+            future = executor.submit(_render_file, midi_data, self.path(digest), self.sample_rate, self.max_seconds)
+            self._pending[digest] = future
+        future.add_done_callback(lambda done: self._finished(digest, done))
+        return future
+
+    def render(self, midi_data, digest, timeout=None):
+        """Path of the WAV for a MIDI file, rendering it if needed; raises AudioBusy or TimeoutError"""
+        path = self.cached_path(digest)
+        if path is not None:
+            return path
+        self.submit(midi_data, digest).result(timeout)
+        return self.path(digest)
+
+    def _finished(self, digest, future):
+        with self._lock:
+            self._pending.pop(digest, None)
+        error = 'cancelled' if future.cancelled() else future.exception()
+        if error is not None:
+            self._count('failures')
+            logging.error(f"Audio render of {digest} failed: {error}")
+            return
+        self._count('renders')
+        logging.info(f"Rendered audio for {digest} ({future.result()} bytes)")
+        with self._lock:
+            self._track(self.path(digest), future.result())
+            self._evict()
+
+    def evict(self):
+        """Delete the least recently played renders until the cache fits in max_bytes; returns the cache size"""
+        with self._lock:
+            return self._evict()
+
+    def _evict(self):
+        files = self._index()
+        cutoff = time.time() - EVICTION_GRACE_SECONDS
+        for path in list(files):
+            if self._bytes <= self.max_bytes:
+                break
+            try:
+                recent = os.stat(path).st_mtime > cutoff
+            except FileNotFoundError:
+                self._forget(path)  # evicted by another worker
+                continue
+            if recent:
+                files.move_to_end(path)  # played since, perhaps by another worker
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._forget(path)
+            self._counters['evictions'] += 1
+        return self._bytes
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = len(self._pending)
+        stats['queue_size'] = self.queue_size
+        stats['workers'] = self.workers
+        return stats
@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from poetry_analyzer import PoetryAnalyzer
+from midi_generator import MIDIGenerator
+from composition_cache import CompositionCache, cache_key
+from midi_store import MidiStore
+
+# Bulk analysis of poem corpora. Poems are fanned out to a process pool in
+# small groups, where each worker owns its own PoetryAnalyzer/MIDIGenerator and
+# scores a group's sentiment in one pass; results are streamed back as they
+# finish and persisted in chunks with one commit per chunk.
+
+DEFAULT_BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 2))
+DEFAULT_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 100))
+DEFAULT_GROUP_SIZE = int(os.environ.get('BATCH_GROUP_SIZE', 8))  # poems per task sent to a worker
+
+# Per-process state, created by _init_worker in each pool process
+_analyzer = None
+_midi_gen = None
+_cache = None
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    global _analyzer, _midi_gen, _cache
+    _analyzer = PoetryAnalyzer()
+    _midi_gen = MIDIGenerator(track_workers=1)  # poems already run in parallel across processes
+    _cache = CompositionCache()
+
+
+def _render_group(group):
+    """Analyze and render (index, params) pairs inside a worker process, analyzing cache misses together"""
+    try:
+        keys = [cache_key(params['poem_text'], params['instruments'], params.get('seed')) for _, params in group]
+        cached = [_cache.get(key) for key in keys]
+        analyses = iter(_analyzer.analyze_poems(
+            [params['poem_text'] for (_, params), hit in zip(group, cached) if not hit]
+        ))
+    except Exception as e:
+        return [(index, params, None, None, str(e)) for index, params in group]
+    return [_render(index, params, key, hit, None if hit else next(analyses))
+            for (index, params), key, hit in zip(group, keys, cached)]
+
+
+def _render(index, params, key, cached, analysis):
+    """Render one analyzed poem, or return its cached render"""
+    try:
+        if cached:
+            analysis, midi_data = cached
+        else:
+            if 'error' in analysis:
+                return index, params, None, None, analysis['error']
+            midi_data = _midi_gen.render_midi(analysis, instruments=params['instruments'], seed=params.get('seed'))
+            _cache.put(key, analysis, midi_data)
+        return index, params, analysis, midi_data, None
+    except Exception as e:
+        return index, params, None, None, str(e)
+
+
+def get_shared_pool(workers=DEFAULT_BATCH_WORKERS):
+    """Process pool reused across batch requests in this web worker"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        return _shared_pool
+
+
+def iter_rendered(items, pool, max_pending=None, group_size=DEFAULT_GROUP_SIZE):
+    """
+    Render (index, params) pairs on the pool and yield results in completion order
+    Poems are sent in groups of group_size and at most max_pending groups are in
+    flight, so huge corpora are never all in memory.
+    """
+    max_pending = max_pending or pool._max_workers * 2
+    items = iter(items)
+    pending = set()
+    exhausted = False
+    while pending or not exhausted:
+        while not exhausted and len(pending) < max_pending:
+            group = list(islice(items, group_size))
+            if len(group) < group_size:
+                exhausted = True
+            if not group:
+                break
+            pending.add(pool.submit(_render_group, group))
+        if not pending:
+            break
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield from future.result()
+
+
+def _persist_chunk(chunk, midi_store):
+    """Store MIDI files and insert a chunk of compositions with a single commit"""
+    from app import db
+    from models import Composition
+
+    compositions = []
+    for index, params, analysis, midi_data in chunk:
+        midi_filename = midi_store.filename(midi_store.put(midi_data))
+        compositions.append(Composition.from_analysis(
+            params['title'], params['poem_text'], params['instruments'], midi_filename, analysis
+        ))
+    db.session.add_all(compositions)
+    db.session.commit()
+
+    return [
+        {'index': index, 'success': True, 'composition_id': composition.id,
+         'title': composition.title, 'midi_filename': composition.midi_filename}
+        for (index, _, _, _), composition in zip(chunk, compositions)
+    ]
+
+
+def run_batch(items, pool, chunk_size=DEFAULT_CHUNK_SIZE, midi_store=None):
+    """
+    Process (index, params) pairs and yield one result dict per poem as it is saved
+    Must run inside an app context. Failed poems are reported immediately.
+    """
+    midi_store = midi_store or MidiStore()
+    chunk = []
+    for index, params, analysis, midi_data, error in iter_rendered(items, pool):
+        if error:
+            yield {'index': index, 'success': False, 'title': params.get('title'), 'error': error}
+            continue
+        chunk.append((index, params, analysis, midi_data))
+        if len(chunk) >= chunk_size:
+            yield from _persist_chunk(chunk, midi_store)
+            chunk = []
+    if chunk:
+        yield from _persist_chunk(chunk, midi_store)
+
+
+def read_jsonl(lines):
+    """Parse JSONL poem records, yielding (index, record or None, error or None)"""
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield index, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield index, None, 'Each line must be a JSON object'
+            continue
+        yield index, record, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a JSONL corpus of poems and store the compositions")
+    parser.add_argument('input', help="JSONL file with one {\"title\", \"poem_text\", \"instruments\"} object per line, or - for stdin")
+    parser.add_argument('-o', '--output', help="write JSONL results here instead of stdout")
+    parser.add_argument('--instruments', default='piano', help="comma-separated default instruments")
+    parser.add_argument('--workers', type=int, default=DEFAULT_BATCH_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    from app import app
+    from routes import _parse_poem_request
+
+    default_instruments = [inst.strip() for inst in args.instruments.split(',') if inst.strip()]
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    counts = {'saved': 0, 'failed': 0, 'invalid': 0}
+
+    def emit(result):
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+
+    def valid_items():
+        for index, record, error in read_jsonl(source):
+            if record is not None:
+                record.setdefault('instruments', default_instruments)
+                params, error = _parse_poem_request(record)
+            if error:
+                counts['invalid'] += 1
+                emit({'index': index, 'success': False, 'error': error})
+                continue
+            yield index, params
+
+    with app.app_context(), ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        for result in run_batch(valid_items(), pool, chunk_size=args.chunk_size):
+            counts['saved' if result['success'] else 'failed'] += 1
+            emit(result)
+
+    if source is not sys.stdin:
+        source.close()
+    if output is not sys.stdout:
+        output.close()
+    logging.info(f"Batch finished: {counts['saved']} saved, {counts['failed']} failed, {counts['invalid']} invalid")
+    return 0 if not (counts['failed'] or counts['invalid']) else 1
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Load test: requests per second against the web app over HTTP
+
+Usage: python benchmarks/load_test.py [--serve gunicorn|dev] [--url URL] [--concurrency 8] [--duration 10]
+Runs each scenario (home page, cached and uncached /analyze, MIDI download,
+conditional MIDI revalidation, composition listing) for --duration seconds
+from --concurrency keep-alive connections and reports requests per second,
+latency percentiles and errors. --serve starts the app on a free port with a
+scratch database and stores: `gunicorn` uses gunicorn_config.py, `dev` the
+Flask development server that main.py runs. Without --serve, --url points at a
+server that is already running. The client is a Python thread pool, so for
+the cheapest routes it can be the bottleneck; compare setups on one machine.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("home", "analyze_cached", "analyze_new", "midi", "midi_revalidate", "compositions")
+
+POEMS = [
+    "The woods are lovely, dark and deep,\nBut I have promises to keep,\n"
+    "And miles to go before I sleep,\nAnd miles to go before I sleep.",
+    "Shall I compare thee to a summer's day?\nThou art more lovely and more temperate:\n"
+    "Rough winds do shake the darling buds of May,\nAnd summer's lease hath all too short a date.",
+    "I wandered lonely as a cloud\nThat floats on high o'er vales and hills,\n"
+    "When all at once I saw a crowd,\nA host, of golden daffodils.",
+]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(kind, workdir):
+    """Start the app in a subprocess with scratch storage; returns (process, base url)"""
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault("POETRY_OFFLINE", "1")
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load_test.db')}",
+        "MIDI_STORE_DIR": os.path.join(workdir, "midi_store"),
+        "COMPOSITION_CACHE_PATH": os.path.join(workdir, "composition_cache.db"),
+        "AUDIO_CACHE_DIR": os.path.join(workdir, "audio_cache"),
+    })
+    if kind == "gunicorn":
+        env["GUNICORN_BIND"] = f"127.0.0.1:{port}"
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn_config.py", "main:app"]
+    else:
+        command = [sys.executable, "-c",
+                   f"from app import app; app.run(host='127.0.0.1', port={port}, debug=False, threaded=True)"]
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_until_up(base_url, process=None, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            status, _, _ = Client(base_url).request("GET", "/healthz/ready")
+            if status == 404:  # a server without the readiness route
+                status, _, _ = Client(base_url).request("GET", "/")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server at {base_url} was not ready within {timeout}s")
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened after errors"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, headers, body) of one request"""
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            self.connection.request(method, path, body=body, headers=headers or {})
+            response = self.connection.getresponse()
+            return response.status, response.headers, response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+
+
+def analyze_body(poem_text):
+    return json.dumps({"poem_text": poem_text, "title": "Load Test", "instruments": ["piano", "strings"]})
+
+
+def prepare(base_url):
+    """Create a composition to download; returns the MIDI path and its ETag"""
+    status, _, body = Client(base_url).request("POST", "/analyze", analyze_body(POEMS[0]),
+                                               {"Content-Type": "application/json"})
+    if status != 200:
+        raise RuntimeError(f"/analyze returned {status}: {body[:200]!r}")
+    midi_path = f"/api/midi/{json.loads(body)['midi_filename']}"
+    status, headers, _ = Client(base_url).request("GET", midi_path)
+    if status != 200:
+        raise RuntimeError(f"{midi_path} returned {status}")
+    return midi_path, headers.get("ETag")
+
+
+def scenario_request(name, client, sequence, context):
+    """Send request number `sequence` of a scenario; returns (status, expected status)"""
+    json_headers = {"Content-Type": "application/json"}
+    if name == "home":
+        return client.request("GET", "/")[0], 200
+    if name == "analyze_cached":
+        return client.request("POST", "/analyze", analyze_body(POEMS[sequence % len(POEMS)]), json_headers)[0], 200
+    if name == "analyze_new":
+        # A unique line per request misses the composition cache: full analysis and rendering
+        poem = f"{POEMS[sequence % len(POEMS)]}\nand load test line {context['run']} {sequence}"
+        return client.request("POST", "/analyze", analyze_body(poem), json_headers)[0], 200
+    if name == "midi":
+        return client.request("GET", context["midi_path"])[0], 200
+    if name == "midi_revalidate":
+        return client.request("GET", context["midi_path"], headers={"If-None-Match": context["etag"]})[0], 304
+    if name == "compositions":
+        return client.request("GET", "/api/compositions?limit=20")[0], 200
+    raise ValueError(f"unknown scenario {name}")
+
+
+def run_scenario(name, base_url, concurrency, duration, context):
+    counter = iter(range(10 ** 12))
+    counter_lock = threading.Lock()
+    latencies, errors = [], []
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        client = Client(base_url)
+        own_latencies, own_errors = [], []
+        while time.perf_counter() < deadline:
+            with counter_lock:
+                sequence = next(counter)
+            mark = time.perf_counter()
+            try:
+                status, expected = scenario_request(name, client, sequence, context)
+                if status != expected:
+                    own_errors.append(f"HTTP {status}")
+            except (OSError, http.client.HTTPException) as e:
+                own_errors.append(type(e).__name__)
+            own_latencies.append(time.perf_counter() - mark)
+        with results_lock:
+            latencies.extend(own_latencies)
+            errors.extend(own_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "errors": len(errors),
+        "error_kinds": sorted(set(errors)),
+    }
+
+
+def print_row(name, stats):
+    print(f"{name:<20}{stats['requests']:>10}{stats['requests_per_s']:>12.1f}{stats['p50_ms'] or 0:>11.2f}"
+          f"{stats['p90_ms'] or 0:>11.2f}{stats['p99_ms'] or 0:>11.2f}{stats['errors']:>8}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--serve", choices=("gunicorn", "dev"), help="start the app here with this server")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server to test when --serve is not given")
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated from {','.join(SCENARIOS)}")
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenarios.split(",")
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        base_url = args.url
+        if args.serve:
+            process, base_url = start_server(args.serve, workdir)
+        try:
+            wait_until_up(base_url, process)
+            midi_path, etag = prepare(base_url)
+            context = {"midi_path": midi_path, "etag": etag, "run": time.time_ns()}
+
+            if not args.json:
+                print(f"{args.serve or base_url}, {args.concurrency} connections, {args.duration:g}s per scenario")
+                print(f"{'scenario':<20}{'requests':>10}{'req/s':>12}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'errors':>8}")
+            results = {}
+            for name in scenarios:
+                results[name] = run_scenario(name, base_url, args.concurrency, args.duration, context)
+                if not args.json:
+                    print_row(name, results[name])
+        finally:
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    if args.json:
+        print(json.dumps({"server": args.serve or base_url, "concurrency": args.concurrency,
+                          "duration_s": args.duration, "results": results}, indent=2))
+    return 1 if any(stats["errors"] for stats in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
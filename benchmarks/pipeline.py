@@ -0,0 +1,262 @@
+"""
+Pipeline benchmark: PoetryAnalyzer and MIDIGenerator over a fixed synthetic corpus
+
+Usage: python benchmarks/pipeline.py [--quick] [--save-baseline] [--compare] [--threshold 0.25]
+Times analyze_poem, every PoetryAnalyzer._detect_* method and
+MIDIGenerator.generate_composition from a haiku up to a 5,000-line poem with
+1 to 9 instruments, reporting throughput, latency percentiles and peak traced
+memory. --save-baseline writes the results to benchmarks/baseline.json;
+--compare checks a run against it and exits 1 if any case regressed. Runs
+offline: the corpus is generated here and no NLTK data is downloaded.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import inspect
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+os.environ.setdefault("POETRY_OFFLINE", "1")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from poetry_analyzer import PoetryAnalyzer  # noqa: E402
+from midi_generator import MIDIGenerator  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# Bump when the corpus or case list changes, so old baselines are not compared against
+CORPUS_VERSION = 1
+
+CORPUS_SIZES = {"haiku": 3, "sonnet": 14, "lines_100": 100, "lines_1000": 1000, "lines_5000": 5000}
+QUICK_SIZES = ("haiku", "sonnet", "lines_100")
+INSTRUMENT_COUNTS = (1, 3, 9)
+INSTRUMENTS = ["piano", "strings", "violin", "cello", "flute", "clarinet",
+               "acoustic_guitar", "electric_guitar", "drums"]
+
+# Regressions smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_MS = 0.05
+
+WORDS = """
+the a of in and under over through silver golden quiet morning evening river mountain
+shadow whisper thunder gentle bright dark soft warm cold tender distant wandering
+heart dream light rain wind stone sea fire leaf bird moon star field road
+falls sings turns burns holds breaks drifts glows fades rises sleeps waits
+like as is are was becomes slowly softly never always again alone together
+""".split()
+END_WORDS = [
+    ("night", "light", "bright", "flight"), ("day", "way", "gray", "stay"),
+    ("sea", "free", "tree", "be"), ("sky", "high", "by", "sigh"),
+    ("rain", "again", "plain", "remain"), ("heart", "apart", "start", "art"),
+]
+
+
+def haiku(rng):
+    return "\n".join(" ".join(rng.choice(WORDS) for _ in range(count)) for count in (3, 5, 3))
+
+
+def poem(line_count, rng):
+    """Quatrains in ABAB from a fixed vocabulary, with a blank line between stanzas"""
+    lines = []
+    for index in range(line_count):
+        if index and index % 4 == 0:
+            lines.append("")
+        rhymes = END_WORDS[(index // 4 * 2 + index % 2) % len(END_WORDS)]
+        body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 8)))
+        lines.append(f"{body} {rng.choice(rhymes)}")
+    return "\n".join(lines)
+
+
+def build_corpus(sizes):
+    rng = random.Random(20250630)
+    return {name: haiku(rng) if name == "haiku" else poem(CORPUS_SIZES[name], rng) for name in sizes}
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(function, lines, min_runs, min_seconds, max_runs):
+    """Latency stats (ms), throughput (lines/s) and traced peak memory (KiB) of a no-argument callable"""
+    function()  # warm caches and lazy loads outside the timed runs
+    durations = []
+    # As timeit does, keep garbage collector pauses out of the timings
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        while len(durations) < max_runs and (len(durations) < min_runs or time.perf_counter() - started < min_seconds):
+            mark = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - mark)
+    finally:
+        gc.enable()
+
+    # Memory is traced in a separate run so tracing overhead does not skew the timings
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    durations.sort()
+    mean = sum(durations) / len(durations)
+    return {
+        "runs": len(durations),
+        "p50_ms": round(percentile(durations, 0.50) * 1000, 4),
+        "p90_ms": round(percentile(durations, 0.90) * 1000, 4),
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 4),
+        "lines_per_s": round(lines / mean, 1) if mean else None,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def detector_cases(analyzer, parsed):
+    """Every _detect_* method, called with the arguments its signature names"""
+    arguments = {"parsed": parsed, "labels": analyzer._rhyme_labels(parsed)}
+    for name, method in inspect.getmembers(analyzer, inspect.ismethod):
+        if name.startswith("_detect_"):
+            parameters = inspect.signature(method).parameters
+            if set(parameters) <= set(arguments):
+                yield name.lstrip("_"), method, [arguments[parameter] for parameter in parameters]
+
+
+def run_suite(sizes, instrument_counts, min_runs, min_seconds, max_runs, report):
+    analyzer = PoetryAnalyzer()
+    generator = MIDIGenerator()
+    results = {}
+    for size, text in build_corpus(sizes).items():
+        parsed = analyzer.parse_poem(text)
+        lines = len(parsed.lines)
+        analysis = analyzer.analyze_poem(text)
+
+        cases = [(f"analyze_poem/{size}", lambda text=text: analyzer.analyze_poem(text))]
+        for name, method, args in detector_cases(analyzer, parsed):
+            cases.append((f"{name}/{size}", lambda method=method, args=args: method(*args)))
+        for count in instrument_counts:
+            instruments = INSTRUMENTS[:count]
+            cases.append((f"generate_composition/{size}/{count}_instruments",
+                          lambda instruments=instruments, analysis=analysis: generator.generate_composition(
+                              analysis, instruments=instruments, filename="benchmark.mid")))
+
+        for name, function in cases:
+            results[name] = measure(function, lines, min_runs, min_seconds, max_runs)
+            report(name, results[name])
+    return results
+
+
+def print_row(name, stats):
+    print(f"{name:<52}{stats['runs']:>6}{stats['p50_ms']:>11.3f}{stats['p90_ms']:>11.3f}{stats['p99_ms']:>11.3f}"
+          f"{stats['lines_per_s'] or 0:>13.0f}{stats['peak_kib']:>11.1f}", flush=True)
+
+
+def environment():
+    analyzer = PoetryAnalyzer()
+    return {
+        "corpus_version": CORPUS_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "pronunciation_index": bool(analyzer.pronunciations),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Cases slower (p50) or larger (peak memory) than baseline by more than threshold"""
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        slower = stats["p50_ms"] - before["p50_ms"]
+        if slower > MIN_REGRESSION_MS and stats["p50_ms"] > before["p50_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p50 {before['p50_ms']:.3f} -> {stats['p50_ms']:.3f} ms")
+        if stats["peak_kib"] > before["peak_kib"] * (1 + threshold) + 1:
+            regressions.append(f"{name}: peak {before['peak_kib']:.1f} -> {stats['peak_kib']:.1f} KiB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="only the poems up to 100 lines")
+    parser.add_argument("--sizes", help=f"comma-separated corpus sizes from {','.join(CORPUS_SIZES)}")
+    parser.add_argument("--instruments", default=",".join(map(str, INSTRUMENT_COUNTS)),
+                        help="comma-separated instrument counts (1-9)")
+    parser.add_argument("--min-runs", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="keep repeating each case at least this long")
+    parser.add_argument("--max-runs", type=int, default=500)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write results to the baseline file")
+    parser.add_argument("--compare", action="store_true", help="exit 1 if any case regressed against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown ratio for --compare")
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes.split(",") if args.sizes else QUICK_SIZES if args.quick else tuple(CORPUS_SIZES)
+    unknown = [size for size in sizes if size not in CORPUS_SIZES]
+    if unknown:
+        parser.error(f"unknown corpus sizes: {', '.join(unknown)}")
+    instrument_counts = [int(count) for count in args.instruments.split(",")]
+    if not all(1 <= count <= len(INSTRUMENTS) for count in instrument_counts):
+        parser.error(f"instrument counts must be between 1 and {len(INSTRUMENTS)}")
+
+    if not args.json:
+        print(f"{'case':<52}{'runs':>6}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'lines/s':>13}{'peak KiB':>11}")
+    report = (lambda name, stats: None) if args.json else print_row
+
+    # generate_composition writes static/midi relative to the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            results = run_suite(sizes, instrument_counts, args.min_runs, args.min_seconds, args.max_runs, report)
+        finally:
+            os.chdir(cwd)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        baseline = {"environment": environment(), "results": results}
+        if os.path.exists(args.baseline):
+            # Keep baseline cases this run skipped (e.g. --quick)
+            with open(args.baseline) as baseline_file:
+                previous = json.load(baseline_file)
+            if previous.get("environment", {}).get("corpus_version") == CORPUS_VERSION:
+                baseline["results"] = {**previous.get("results", {}), **results}
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Saved baseline for {len(results)} cases to {args.baseline}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        recorded = baseline.get("environment", {})
+        current = environment()
+        if recorded.get("corpus_version") != CORPUS_VERSION:
+            print("Baseline was recorded with a different corpus; re-run with --save-baseline", file=sys.stderr)
+            return 2
+        differences = [key for key in current if key != "corpus_version" and recorded.get(key) != current[key]]
+        if differences:
+            print(f"Warning: baseline environment differs in {', '.join(differences)}", file=sys.stderr)
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
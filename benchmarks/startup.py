@@ -0,0 +1,95 @@
+"""
+Startup benchmark: import time and first-request latency in a fresh process
+
+Usage: python benchmarks/startup.py [--runs 5] [--preload] [--online]
+Each run starts a new interpreter so module imports and lazy model loads are
+measured cold. Runs offline (POETRY_OFFLINE=1) unless --online is given.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_POEM = """The woods are lovely, dark and deep,
+But I have promises to keep,
+And miles to go before I sleep,
+And miles to go before I sleep."""
+
+# Executed in the child process; prints one JSON line of timings in milliseconds
+CHILD_SCRIPT = r'''
+import json, os, sys, time
+sys.path.insert(0, os.environ["BENCH_ROOT"])
+timings = {}
+start = time.perf_counter()
+import poetry_analyzer
+timings["import_poetry_analyzer"] = time.perf_counter() - start
+
+mark = time.perf_counter()
+from app import app
+timings["import_app"] = time.perf_counter() - mark
+
+if os.environ.get("BENCH_PRELOAD"):
+    import routes
+    mark = time.perf_counter()
+    poetry_analyzer.preload_models(routes.analyzer)
+    timings["preload_models"] = time.perf_counter() - mark
+
+client = app.test_client()
+payload = {"title": "Startup Benchmark", "poem_text": os.environ["BENCH_POEM"], "instruments": ["piano"]}
+for name in ("first_request", "second_request"):
+    mark = time.perf_counter()
+    response = client.post("/analyze", json=payload)
+    timings[name] = time.perf_counter() - mark
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+timings["total"] = time.perf_counter() - start
+print(json.dumps({name: round(value * 1000, 2) for name, value in timings.items()}))
+'''
+
+
+def run_once(preload, online):
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ)
+        env.update({
+            "BENCH_ROOT": ROOT,
+            "BENCH_POEM": SAMPLE_POEM,
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        })
+        if not online:
+            env["POETRY_OFFLINE"] = "1"
+        if preload:
+            env["BENCH_PRELOAD"] = "1"
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD_SCRIPT],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--preload", action="store_true", help="call preload_models() before the first request")
+    parser.add_argument("--online", action="store_true", help="allow NLTK downloads")
+    parser.add_argument("--json", action="store_true", help="print raw per-run timings as JSON")
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.preload, args.online) for _ in range(args.runs)]
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return 0
+
+    print(f"{'stage':<24}{'median ms':>12}{'min ms':>12}{'max ms':>12}")
+    for stage in runs[0]:
+        values = [run[stage] for run in runs]
+        print(f"{stage:<24}{statistics.median(values):>12.1f}{min(values):>12.1f}{max(values):>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
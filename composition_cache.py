@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from poetry_analyzer import ANALYZER_VERSION
+from midi_generator import GENERATOR_VERSION
+
+# Two-level cache of (analysis dict, MIDI bytes) keyed by a hash of the
+# normalized poem text, the instrument list and the analyzer/generator
+# versions. The in-process layer is a small LRU; the shared layer is a SQLite
+# file that every worker on the host reads and writes, evicted by total size
+# (kept in a totals row by triggers, so writes never sum the table).
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    'COMPOSITION_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'composition_cache.db')
+)
+DEFAULT_MEMORY_ENTRIES = int(os.environ.get('COMPOSITION_CACHE_MEMORY_ENTRIES', 128))
+DEFAULT_MAX_DISK_BYTES = int(os.environ.get('COMPOSITION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+
+def normalize_poem_text(poem_text):
+    """Canonical form of a poem: unified newlines, trimmed lines, single blank lines between stanzas"""
+    lines = []
+    for line in poem_text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        line = ' '.join(line.split())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(lines)
+
+
+def cache_key(poem_text, instruments, seed=None):
+    """Content address for a poem rendered with the given instruments and seed"""
+    digest = hashlib.sha256()
+    digest.update(f"analyzer={ANALYZER_VERSION};generator={GENERATOR_VERSION};".encode('utf-8'))
+    digest.update(f"instruments={','.join(instruments)};seed={seed};".encode('utf-8'))
+    digest.update(normalize_poem_text(poem_text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CompositionCache:
+    # stats() keys that only ever grow (Prometheus counters); the rest are current sizes
+    COUNTERS = ('hits', 'memory_hits', 'disk_hits', 'misses', 'memory_evictions', 'disk_evictions', 'evictions')
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+        }
+
+    def _connection(self):
+        """Per-thread SQLite connection, reopened after fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            ' key TEXT PRIMARY KEY, analysis TEXT NOT NULL, midi BLOB NOT NULL,'
+            ' size INTEGER NOT NULL, last_access REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_last_access ON cache_entries (last_access)')
+        # Running totals kept by triggers in the writing transaction, so no put has to sum the table
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_totals ('
+                ' id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)'
+            )
+            conn.execute(
+                'INSERT OR IGNORE INTO cache_totals (id, entries, bytes)'
+                ' SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries'
+            )
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_entries_insert AFTER INSERT ON cache_entries BEGIN'
+                ' UPDATE cache_totals SET entries = entries + 1, bytes = bytes + new.size WHERE id = 0; END'
+            )
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_entries_delete AFTER DELETE ON cache_entries BEGIN'
+                ' UPDATE cache_totals SET entries = entries - 1, bytes = bytes - old.size WHERE id = 0; END'
+            )
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_entries_resize AFTER UPDATE OF size ON cache_entries BEGIN'
+                ' UPDATE cache_totals SET bytes = bytes - old.size + new.size WHERE id = 0; END'
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self._counters[name] += 1
+
+    def get(self, key):
+        """Return (analysis, midi_data) for a cache key, or None on a miss"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is not None:
+            self._count('hits', 'memory_hits')
+            return json.loads(entry[0]), entry[1]
+
+        if self.path:
+            try:
+                conn = self._connection()
+                row = conn.execute('SELECT analysis, midi FROM cache_entries WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE cache_entries SET last_access = ? WHERE key = ?', (time.time(), key))
+                    analysis_json, midi_data = row[0], bytes(row[1])
+                    self._remember(key, analysis_json, midi_data)
+                    self._count('hits', 'disk_hits')
+                    return json.loads(analysis_json), midi_data
+            except sqlite3.Error as e:
+                logging.warning(f"Composition cache read failed: {e}")
+
+        self._count('misses')
+        return None
+
+    def put(self, key, analysis, midi_data):
+        """Store an analysis and its rendered MIDI in both cache layers"""
+        analysis_json = json.dumps(analysis, separators=(',', ':'))
+        self._remember(key, analysis_json, midi_data)
+        if not self.path:
+            return
+        try:
+            conn = self._connection()
+            size = len(analysis_json) + len(midi_data)
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete would skip the totals trigger
+            conn.execute(
+                'INSERT INTO cache_entries (key, analysis, midi, size, last_access) VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET analysis = excluded.analysis, midi = excluded.midi,'
+                ' size = excluded.size, last_access = excluded.last_access',
+                (key, analysis_json, midi_data, size, time.time())
+            )
+            self._evict_disk(conn)
+        except sqlite3.Error as e:
+            logging.warning(f"Composition cache write failed: {e}")
+
+    def _remember(self, key, analysis_json, midi_data):
+        with self._lock:
+            self._memory[key] = (analysis_json, midi_data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+                self._counters['memory_evictions'] += 1
+
+    def _disk_totals(self, conn):
+        """(entries, bytes) in the shared layer, from the trigger-maintained totals row"""
+        return conn.execute('SELECT entries, bytes FROM cache_totals WHERE id = 0').fetchone()
+
+    def _evict_disk(self, conn):
+        """Drop least recently used rows until the shared layer fits in max_disk_bytes"""
+        total = self._disk_totals(conn)[1]
+        evicted = 0
+        while total > self.max_disk_bytes:
+            oldest = conn.execute('SELECT key, size FROM cache_entries ORDER BY last_access LIMIT 32').fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if total <= self.max_disk_bytes:
+                    break
+                conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+                total -= size
+                evicted += 1
+        if evicted:
+            with self._lock:
+                self._counters['disk_evictions'] += evicted
+
+    def stats(self):
+        """Hit, miss and eviction counters for this process plus current cache sizes"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['evictions'] = stats['memory_evictions'] + stats['disk_evictions']
+        if self.path:
+            try:
+                entries, disk_bytes = self._disk_totals(self._connection())
+                stats['disk_entries'] = entries
+                stats['disk_bytes'] = disk_bytes
+            except sqlite3.Error as e:
+                logging.warning(f"Composition cache stats failed: {e}")
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            self._connection().execute('DELETE FROM cache_entries')
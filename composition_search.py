@@ -0,0 +1,88 @@
+import re
+import json
+import base64
+import logging
+from datetime import datetime
+from sqlalchemy import text, tuple_, or_
+from app import db
+from models import Composition, CompositionInstrument
+
+# Listing and search over saved compositions. Pages are keyset-paginated
+# newest first on (created_at, id), so every page costs the same index range
+# scan no matter how deep the client pages. Text search uses the full-text
+# index created by migrations.create_search_index.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+SEARCH_TERM_PATTERN = re.compile(r'\w+')
+
+
+def encode_cursor(composition):
+    """Opaque cursor pointing just past this composition"""
+    position = [composition.created_at.isoformat(), composition.id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        created_at, composition_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(composition_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def _text_search_filter(query_text):
+    """Full-text condition for the current database, or None if there is nothing to search for"""
+    terms = SEARCH_TERM_PATTERN.findall(query_text)
+    if not terms:
+        return None
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # Quote every term so FTS5 query syntax in user input is matched literally
+        match = ' '.join('"%s"' % term for term in terms)
+        return Composition.id.in_(
+            text('SELECT rowid FROM composition_fts WHERE composition_fts MATCH :match').bindparams(match=match)
+        )
+    if dialect == 'postgresql':
+        return text("composition.search_vector @@ plainto_tsquery('english', :search)").bindparams(search=' '.join(terms))
+    logging.warning(f"No full-text index for database dialect '{dialect}'; using LIKE")
+    return or_(*(or_(Composition.title.ilike(f'%{term}%'), Composition.poem_text.ilike(f'%{term}%')) for term in terms))
+
+
+def search_compositions(search=None, key_signature=None, mood=None, instrument=None,
+                        tempo_min=None, tempo_max=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of compositions, newest first, matching every given filter
+    Returns (compositions, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = Composition.summaries()
+
+    if key_signature:
+        query = query.filter(Composition.key_signature == key_signature)
+    if mood:
+        query = query.filter(Composition.mood == mood)
+    if tempo_min is not None:
+        query = query.filter(Composition.tempo >= tempo_min)
+    if tempo_max is not None:
+        query = query.filter(Composition.tempo <= tempo_max)
+    # Page in the order of the most selective index: an instrument's link rows carry
+    # the composition's created_at, so they can be read in order straight from their index
+    order_columns = (Composition.created_at, Composition.id)
+    if instrument:
+        query = query.join(CompositionInstrument).filter(CompositionInstrument.instrument == instrument)
+        order_columns = (CompositionInstrument.created_at, CompositionInstrument.composition_id)
+    if search:
+        condition = _text_search_filter(search)
+        if condition is not None:
+            query = query.filter(condition)
+    if cursor:
+        created_at, composition_id = decode_cursor(cursor)
+        query = query.filter(tuple_(*order_columns) < tuple_(created_at, composition_id))
+
+    # One extra row tells us whether another page follows
+    rows = query.order_by(*(column.desc() for column in order_columns)).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,65 @@
+import os
+
+# Production serving profile: gunicorn -c gunicorn_config.py main:app
+# The app is imported once in the master (preload_app) and the pronunciation
+# index and sentiment lexicon are loaded there before workers fork, so every
+# worker shares their pages; each worker then warms up (warmup.py) before
+# it reports ready at /healthz/ready. Workers run gthread: analysis and MIDI
+# rendering are CPU-bound, so there is a process per CPU, with a few threads
+# each to overlap streamed responses, audio render waits and database I/O.
+# Every setting can be overridden with the environment variables below.
+
+
+def _cpu_count():
+    """CPUs this process may run on (the container's share, not the host's)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', _cpu_count() + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+# Long poems and first audio plays (AUDIO_RENDER_TIMEOUT, 30s) can take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Quiet by default: warnings and errors only, no access log unless asked for
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'warning')
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # '-' for stdout
+access_log_format = 'method=%(m)s path="%(U)s" status=%(s)s bytes=%(B)s duration_us=%(D)s pid=%(p)s'
+
+# Read by app.py when the app is preloaded below: pool sizes follow the thread
+# count, and application logs match the level and key=value format above
+os.environ.setdefault('WEB_THREADS', str(threads))
+os.environ.setdefault('LOG_LEVEL', loglevel)
+os.environ.setdefault('LOG_FORMAT', 'time=%(asctime)s level=%(levelname)s logger=%(name)s pid=%(process)d msg="%(message)s"')
+
+
+def when_ready(server):
+    """Load models in the master, after the app is imported and before workers fork"""
+    import routes
+    from poetry_analyzer import preload_models
+
+    preload_models(routes.analyzer)
+    server.log.info("Models preloaded")
+
+
+def post_worker_init(worker):
+    """Warm up the worker in the background and resume unfinished analysis jobs"""
+    import routes
+
+    routes.warm_up.start()
+    routes.job_queue.start()
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master; each worker opens its own"""
+    from app import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,174 @@
+import numpy as np
+
+# Key, scale and chord tables for MIDIGenerator. Every major and minor key and
+# every church mode on each of the twelve tonics is laid out once at import
+# into flat arrays: the seven scale pitches of each key, its relative key, and
+# for every progression in the library a voice-led bass-plus-triad voicing of
+# each chord (with the chord's seventh alongside). Rendering a line's harmony
+# is then an index into these arrays.
+
+PITCH_CLASSES = {
+    'C': 0, 'B#': 0, 'C#': 1, 'Db': 1, 'D': 2, 'D#': 3, 'Eb': 3, 'E': 4, 'Fb': 4, 'F': 5, 'E#': 5,
+    'F#': 6, 'Gb': 6, 'G': 7, 'G#': 8, 'Ab': 8, 'A': 9, 'A#': 10, 'Bb': 10, 'B': 11, 'Cb': 11,
+}
+
+MODES = {
+    'ionian': (0, 2, 4, 5, 7, 9, 11),
+    'dorian': (0, 2, 3, 5, 7, 9, 10),
+    'phrygian': (0, 1, 3, 5, 7, 8, 10),
+    'lydian': (0, 2, 4, 6, 7, 9, 11),
+    'mixolydian': (0, 2, 4, 5, 7, 9, 10),
+    'aeolian': (0, 2, 3, 5, 7, 8, 10),
+    'locrian': (0, 1, 3, 5, 6, 8, 10),
+}
+# Step of each mode's tonic within its parent major scale
+MODE_DEGREES = {mode: degree for degree, mode in enumerate(MODES)}
+MAJOR_THIRD_MODES = ('ionian', 'lydian', 'mixolydian')
+
+# Key names by number of sharps (negative: flats) in the key signature
+MAJOR_KEYS = {-5: 'Db', -4: 'Ab', -3: 'Eb', -2: 'Bb', -1: 'F', 0: 'C', 1: 'G', 2: 'D', 3: 'A', 4: 'E', 5: 'B', 6: 'F#'}
+MINOR_KEYS = {-5: 'Bbm', -4: 'Fm', -3: 'Cm', -2: 'Gm', -1: 'Dm', 0: 'Am', 1: 'Em', 2: 'Bm', 3: 'F#m', 4: 'C#m', 5: 'G#m', 6: 'D#m'}
+DORIAN_KEYS = {-5: 'Eb dorian', -4: 'Bb dorian', -3: 'F dorian', -2: 'C dorian', -1: 'G dorian', 0: 'D dorian',
+               1: 'A dorian', 2: 'E dorian', 3: 'B dorian', 4: 'F# dorian', 5: 'C# dorian', 6: 'G# dorian'}
+TONIC_NAMES = ('C', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B')
+DEFAULT_KEY = 'C'
+
+# Chord roots as scale degrees (0 = tonic); every progression is four chords long
+PROGRESSIONS = {
+    'I-IV-ii-I': (0, 3, 1, 0),
+    'I-V-vi-IV': (0, 4, 5, 3),
+    'I-vi-IV-V': (0, 5, 3, 4),
+    'I-IV-I-V': (0, 3, 0, 4),
+    'i-iv-v-i': (0, 3, 4, 0),
+    'i-VI-III-VII': (0, 5, 2, 6),
+    'i-iv-VII-III': (0, 3, 6, 2),
+    'i-VII-VI-VII': (0, 6, 5, 6),
+}
+# Progression for each meter, by whether the key has a major or minor third
+METER_PROGRESSIONS = {
+    'major': {'iambic': 'I-V-vi-IV', 'trochaic': 'I-IV-I-V', 'anapestic': 'I-vi-IV-V', 'dactylic': 'I-vi-IV-V'},
+    'minor': {'iambic': 'i-VI-III-VII', 'trochaic': 'i-iv-v-i', 'anapestic': 'i-iv-VII-III', 'dactylic': 'i-VII-VI-VII'},
+}
+DEFAULT_PROGRESSION = 'I-IV-ii-I'
+
+# Lowest tonic of melody scales with a major and a minor third: C major starts at
+# middle C and A minor at the A below it
+MAJOR_TONIC_FLOOR = 60
+MINOR_TONIC_FLOOR = 57
+# Chord voicings keep their lowest note in this range (six semitones, so every triad has
+# one), which holds the whole chord and its seventh below the piano melody at middle C
+VOICING_LOW = 45
+VOICING_HIGH = 50
+
+
+def _key_names():
+    """(name, tonic pitch class, mode) of every key: 12 major, 12 minor, then the other modes on each tonic"""
+    keys = [(MAJOR_KEYS[fifths], (7 * fifths) % 12, 'ionian') for fifths in sorted(MAJOR_KEYS)]
+    keys += [(MINOR_KEYS[fifths], (7 * fifths + 9) % 12, 'aeolian') for fifths in sorted(MINOR_KEYS)]
+    for mode in MODES:
+        if mode not in ('ionian', 'aeolian'):
+            keys += [(f'{name} {mode}', tonic, mode) for tonic, name in enumerate(TONIC_NAMES)]
+    return keys
+
+
+def _close_voicings(pitch_classes):
+    """Every close-position voicing (root position and inversions) of a chord with its lowest note in range"""
+    voicings = []
+    for inversion in range(len(pitch_classes)):
+        order = pitch_classes[inversion:] + pitch_classes[:inversion]
+        for low in range(VOICING_LOW, VOICING_HIGH + 1):
+            if low % 12 != order[0]:
+                continue
+            voicing = [low]
+            for pitch_class in order[1:]:
+                voicing.append(voicing[-1] + (pitch_class - voicing[-1]) % 12)
+            voicings.append(voicing)
+    return voicings
+
+
+def _voice_lead(chords):
+    """
+    Voicings of a looping chord sequence, each as close as possible to the one before it
+    Two passes round the loop, so the first chord is also led from the last.
+    """
+    previous = min(_close_voicings(chords[0]), key=lambda voicing: voicing[0])  # root position, lowest octave
+    voiced = []
+    for chord in chords + chords:
+        previous = min(_close_voicings(chord),
+                       key=lambda voicing: (sum(abs(a - b) for a, b in zip(voicing, previous)), voicing[0]))
+        voiced.append(previous)
+    return voiced[len(chords):]
+
+
+def _build_tables():
+    keys = _key_names()
+    index = {name: i for i, (name, _, _) in enumerate(keys)}
+    for k, (name, tonic, mode) in enumerate(keys):
+        # Enharmonic spellings ("C#" for "Db", "A#m" for "Bbm"), and "C ionian" / "A aeolian"
+        suffixes = {'ionian': ('', ' ionian'), 'aeolian': ('m', ' aeolian')}.get(mode, (f' {mode}',))
+        for spelling, pitch_class in PITCH_CLASSES.items():
+            if pitch_class == tonic:
+                for suffix in suffixes:
+                    index.setdefault(spelling + suffix, k)
+
+    minor = np.array([mode not in MAJOR_THIRD_MODES for _, _, mode in keys])
+    scales = np.zeros((len(keys), 7), dtype=np.int64)
+    relative = np.zeros(len(keys), dtype=np.int64)
+    progressions = list(PROGRESSIONS)
+    voicings = np.zeros((len(keys), len(progressions), 4, 5), dtype=np.int64)
+    for k, (name, tonic, mode) in enumerate(keys):
+        intervals = MODES[mode]
+        floor = MINOR_TONIC_FLOOR if minor[k] else MAJOR_TONIC_FLOOR
+        scales[k] = floor + (tonic - floor) % 12 + np.array(intervals)
+
+        # Relative key: the major or minor scale sharing this key's notes, on the opposite side
+        parent = (tonic - MODES['ionian'][MODE_DEGREES[mode]]) % 12
+        relative_name = (MINOR_KEYS if not minor[k] else MAJOR_KEYS)[_fifths(parent)]
+        relative[k] = index[relative_name]
+
+        for p, name in enumerate(progressions):
+            chords = [[(tonic + intervals[(root + step) % 7]) % 12 for step in (0, 2, 4)]
+                      for root in PROGRESSIONS[name]]
+            for step, (root, voicing) in enumerate(zip(PROGRESSIONS[name], _voice_lead(chords))):
+                # Bass: the root just below the chord; seventh: just below its top voice
+                bass = voicing[0] - 1 - (voicing[0] - 1 - chords[step][0]) % 12
+                seventh = voicing[-1] - 1 - (voicing[-1] - 1 - (tonic + intervals[(root + 6) % 7])) % 12
+                voicings[k, p, step] = [bass] + voicing + [seventh]
+    return tuple(name for name, _, _ in keys), index, scales, relative, minor, tuple(progressions), voicings
+
+
+def _fifths(major_tonic):
+    """Key signature (sharps positive, flats negative) of the major scale on a pitch class"""
+    fifths = (major_tonic * 7) % 12
+    return fifths - 12 if fifths > 6 else fifths
+
+
+KEYS, KEY_INDEX, SCALES, RELATIVE_KEYS, MINOR_THIRD, PROGRESSION_NAMES, VOICINGS = _build_tables()
+PROGRESSION_INDEX = {name: i for i, name in enumerate(PROGRESSION_NAMES)}
+
+
+def key_index(name):
+    """Row of a key name in the tables ("C", "F#m", "Bb", "D dorian"...), or of C if it is unknown"""
+    return KEY_INDEX.get(name, KEY_INDEX[DEFAULT_KEY])
+
+
+def progression_index(key, meter):
+    """Row of the progression played in a key (index) for a meter"""
+    table = METER_PROGRESSIONS['minor' if MINOR_THIRD[key] else 'major']
+    return PROGRESSION_INDEX[table.get(meter, DEFAULT_PROGRESSION)]
+
+
+def suggest_key(mood, polarity, subjectivity):
+    """
+    Key for a poem's sentiment: major when positive, minor when negative and dorian when neutral
+    The key signature comes from the circle of fifths: subjective poems get sharper,
+    brighter keys and objective ones flatter, darker keys, nudged sharpwards by
+    positive and flatwards by negative polarity.
+    """
+    fifths = round((subjectivity - 0.5) * 12 + max(-1.0, min(1.0, polarity)) * 3)
+    fifths = max(-5, min(6, fifths))  # five flats .. six sharps
+    if mood == 'positive':
+        return MAJOR_KEYS[fifths]
+    if mood == 'negative':
+        return MINOR_KEYS[fifths]
+    return DORIAN_KEYS[fifths]
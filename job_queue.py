@@ -0,0 +1,106 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from app import db
+from models import AnalysisJob
+
+DEFAULT_JOB_WORKERS = int(os.environ.get('ANALYZE_JOB_WORKERS', 2))
+# A job still 'running' this long after it was claimed belongs to a dead process
+DEFAULT_JOB_TIMEOUT = int(os.environ.get('ANALYZE_JOB_TIMEOUT', 600))
+
+
+class JobQueue:
+    """
+    Background queue for /analyze jobs, persisted in the AnalysisJob table
+    Any web worker can report a job's status; the thread pool that runs the
+    jobs is created per process so it is never inherited across fork, and each
+    process recovers unfinished jobs when its pool starts.
+    """
+
+    def __init__(self, app, handler, max_workers=DEFAULT_JOB_WORKERS, timeout=DEFAULT_JOB_TIMEOUT):
+        self.app = app
+        self.handler = handler  # callable(payload dict) -> Composition
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analyze-job')
+                self._pool_pid = os.getpid()
+                first_start = True
+            else:
+                first_start = False
+        if first_start:
+            self.requeue_stale()
+            self.resume_pending()
+        return self._pool
+
+    def start(self):
+        """Start this process's pool and pick up unfinished jobs; cheap once started"""
+        if self._pool_pid != os.getpid():
+            self._executor()
+
+    def submit(self, payload):
+        """Persist a queued job and schedule it; returns the job id"""
+        job = AnalysisJob(id=uuid.uuid4().hex, status='queued', payload=json.dumps(payload))
+        db.session.add(job)
+        db.session.commit()
+        self._executor().submit(self._run, job.id)
+        return job.id
+
+    def get(self, job_id):
+        return db.session.get(AnalysisJob, job_id)
+
+    def requeue_stale(self):
+        """Put back jobs left 'running' by a process that died before finishing them"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.timeout)
+        with self.app.app_context():
+            requeued = AnalysisJob.query.filter(
+                AnalysisJob.status == 'running', AnalysisJob.updated_at < cutoff
+            ).update({'status': 'queued', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        if requeued:
+            logging.warning(f"Requeued {requeued} analysis jobs left running for over {self.timeout}s")
+
+    def resume_pending(self):
+        """Schedule jobs left queued by a restarted process"""
+        with self.app.app_context():
+            pending = [job_id for (job_id,) in db.session.query(AnalysisJob.id).filter_by(status='queued')]
+        for job_id in pending:
+            self._pool.submit(self._run, job_id)
+        if pending:
+            logging.info(f"Resumed {len(pending)} queued analysis jobs")
+
+    def _claim(self, job_id):
+        """Atomically move a job from queued to running so only one worker runs it"""
+        claimed = AnalysisJob.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'running', 'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+        return claimed == 1
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            if not self._claim(job_id):
+                return
+            job = db.session.get(AnalysisJob, job_id)
+            try:
+                composition = self.handler(json.loads(job.payload))
+                job.composition_id = composition.id
+                job.status = 'done'
+                logging.info(f"Analysis job {job_id} finished with composition {composition.id}")
+            except Exception as e:
+                db.session.rollback()
+                job = db.session.get(AnalysisJob, job_id)
+                job.status = 'failed'
+                job.error = str(e)
+                logging.error(f"Analysis job {job_id} failed: {str(e)}")
+            db.session.commit()
@@ -0,0 +1,136 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+# In-process latency metrics for the analyze pipeline. Every timed stage feeds
+# a histogram that /metrics renders in the Prometheus text format; while a
+# request is collecting a breakdown, the same timings are also summed per stage
+# for that request. Each worker process keeps its own counts.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_breakdown = ContextVar('timing_breakdown', default=None)
+_breakdown_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative latency histogram with one series per label value"""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {value: (list(counts), count, total) for value, (counts, count, total) in self._series.items()}
+        for value in sorted(series):
+            counts, count, total = series[value]
+            label = f'{self.label}="{value}"'
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return '\n'.join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    'poetry_stage_duration_seconds', 'Time spent in each analyze pipeline stage', 'stage'
+)
+REQUEST_SECONDS = Histogram(
+    'poetry_request_duration_seconds', 'HTTP request latency by endpoint', 'endpoint'
+)
+
+
+def record(stage, seconds):
+    """Add one stage timing to the histogram and to the current request's breakdown"""
+    STAGE_SECONDS.observe(stage, seconds)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        with _breakdown_lock:
+            breakdown[stage] = breakdown.get(stage, 0.0) + seconds
+
+
+class timed:
+    """Time a block (with timed('stage'):) or every call of a function (@timed('stage'))"""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.stage, time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, function):
+        stage = self.stage
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+
+
+@contextmanager
+def collect_timings():
+    """Sum stage timings recorded in this context (and contexts copied from it) into a dict"""
+    breakdown = {}
+    token = _breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _breakdown.reset(token)
+
+
+def timings_ms(breakdown):
+    """A breakdown rounded to milliseconds, slowest stage first"""
+    return {stage: round(seconds * 1000, 3)
+            for stage, seconds in sorted(breakdown.items(), key=lambda item: -item[1])}
+
+
+def _metric_name(name):
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def render_prometheus(gauges=None, counters=None):
+    """
+    Text exposition of the histograms plus extra metrics given as {name: value}
+    gauges are current values (sizes, readiness); counters only grow and are
+    exported with the conventional _total suffix.
+    """
+    sections = [STAGE_SECONDS.render(), REQUEST_SECONDS.render()]
+    for name, value in sorted((counters or {}).items()):
+        metric = _metric_name(name)
+        if not metric.endswith('_total'):
+            metric += '_total'
+        sections.append(f"# TYPE {metric} counter\n{metric} {value}")
+    for name, value in sorted((gauges or {}).items()):
+        metric = _metric_name(name)
+        sections.append(f"# TYPE {metric} gauge\n{metric} {value}")
+    return '\n'.join(sections) + '\n'
@@ -1,23 +1,59 @@
+import io
 import os
-import random
+import hashlib
+import numpy as np
 from midiutil import MIDIFile
 import logging
+import threading
+from itertools import chain
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
+import harmony
+from metrics import timed
+from note_events import NoteEvents, syllable_grid
+from smf import encode_track, assemble_smf
+
+# Bump whenever the rendered MIDI for a given analysis changes, so cached renders are invalidated
+GENERATOR_VERSION = 7
+
+# Velocity added per unit of line polarity, and the polarity beyond which a stanza counts
+# as positive or negative (the analyzer's mood threshold)
+LINE_DYNAMICS = 20
+MOOD_THRESHOLD = 0.1
+
+# Melody effects placed on the syllables where the analyzer found a literary device:
+# alliterative words are accented, assonant ones held legato, sensory words lifted an
+# octave and every repeat of a repeated word replays its first pitch as a motif
+ALLITERATION_ACCENT = 15
+ASSONANCE_LEGATO = 1.5
+IMAGERY_LIFT = 12
+DEVICE_EFFECTS = ('alliteration', 'assonance', 'imagery', 'repetition', 'metaphor_simile')
+
+# Instrument tracks are rendered concurrently on a shared thread pool; 1 renders them inline
+DEFAULT_TRACK_WORKERS = int(os.environ.get('MIDI_TRACK_WORKERS', min(9, os.cpu_count() or 1)))
+
+_track_pool = None
+_track_pool_lock = threading.Lock()
+
+
+def get_track_pool(workers=DEFAULT_TRACK_WORKERS):
+    """Thread pool shared by every MIDIGenerator in this process"""
+    global _track_pool
+    with _track_pool_lock:
+        if _track_pool is None:
+            _track_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='midi-track')
+        return _track_pool
+
+# 'numpy' encodes note-event arrays directly; 'midiutil' feeds the same events
+# through MIDIFile and is kept as the reference for equivalence checks
+ENGINES = ('numpy', 'midiutil')
 
 class MIDIGenerator:
-    def __init__(self):
-        self.scales = {
-            'C': [60, 62, 64, 65, 67, 69, 71],  # C major
-            'Am': [57, 59, 60, 62, 64, 65, 67],  # A minor
-            'G': [67, 69, 71, 72, 74, 76, 78],   # G major
-            'Em': [64, 66, 67, 69, 71, 72, 74],  # E minor
-            'F': [65, 67, 69, 70, 72, 74, 76],   # F major
-            'Dm': [62, 64, 65, 67, 69, 70, 72],  # D minor
-        }
-        
-        self.chord_progressions = {
-            'major': [[0, 2, 4], [3, 5, 0], [1, 3, 5], [0, 2, 4]],  # I-IV-ii-I
-            'minor': [[0, 2, 4], [3, 5, 0], [1, 3, 5], [0, 2, 4]],  # i-iv-ii-i
-        }
+    def __init__(self, engine='numpy', track_workers=DEFAULT_TRACK_WORKERS):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown MIDI engine: {engine}")
+        self.engine = engine
+        self.track_workers = track_workers
         
         self.instruments = {
             'piano': 0,
@@ -31,137 +67,261 @@ class MIDIGenerator:
             'drums': 128  # Percussion channel
         }
     
-    def generate_composition(self, analysis, title="Untitled", instruments=['piano'], filename=None):
+    def generate_composition(self, analysis, title="Untitled", instruments=['piano'], filename=None, seed=None):
         """
         Generate MIDI composition based on poetry analysis
         """
         try:
-            if not filename:
-                safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                filename = f"{safe_title.replace(' ', '_')}.mid"
-            
-            # Create MIDI file
-            midi = MIDIFile(len(instruments))
-            
-            # Set tempo
-            tempo = analysis.get('tempo_suggestion', 120)
-            for i in range(len(instruments)):
-                midi.addTempo(i, 0, tempo)
-            
-            # Generate music for each instrument
-            for i, instrument in enumerate(instruments):
-                self._add_instrument_track(midi, i, instrument, analysis)
-            
-            # Save MIDI file
-            midi_path = os.path.join('static', 'midi', filename)
-            os.makedirs(os.path.dirname(midi_path), exist_ok=True)
-            
-            with open(midi_path, 'wb') as output_file:
-                midi.writeFile(output_file)
-            
-            logging.info(f"Generated MIDI file: {midi_path}")
-            return filename
+            midi_data = self.render_midi(analysis, instruments, seed=seed)
+            return self.save_midi(midi_data, title=title, filename=filename)
             
         except Exception as e:
             logging.error(f"Error generating MIDI: {str(e)}")
             raise
     
-    def _add_instrument_track(self, midi, track, instrument_name, analysis):
-        """Add a track for a specific instrument"""
-        # Set instrument
-        program = self.instruments.get(instrument_name, 0)
-        if instrument_name != 'drums':
-            midi.addProgramChange(track, 0, 0, program)
+    @timed('midi.render')
+    def render_midi(self, analysis, instruments=['piano'], seed=None):
+        """
+        Render the composition in memory and return the MIDI file bytes
+        The same analysis, instruments and seed always give byte-identical output.
+        Each track draws from its own RNG, derived from the seed and the track's
+        position, so tracks can be rendered in any order or concurrently.
+        """
+        if seed is None:
+            seed = self.default_seed(analysis)
+        track_seeds = np.random.SeedSequence(seed).spawn(len(instruments))
+        
+        tempo = analysis.get('tempo_suggestion', 120)
+        
+        if self.engine == 'midiutil':
+            tracks = self._map_tracks(self._instrument_track, instruments, analysis, track_seeds)
+            return self._encode_with_midiutil(tracks, tempo)
+        return assemble_smf(self._map_tracks(self._encoded_track, instruments, analysis, track_seeds), tempo)
+    
+    def _map_tracks(self, build, instruments, analysis, track_seeds):
+        """Run build(instrument, analysis, rng, devices) for every track, in track order"""
+        devices = self._device_syllables(analysis)
+        jobs = [(instrument, analysis, np.random.default_rng(track_seed), devices)
+                for instrument, track_seed in zip(instruments, track_seeds)]
+        if self.track_workers <= 1 or len(jobs) <= 1:
+            return [build(*job) for job in jobs]
+        # Each job runs in a copy of the caller's context so its stage timings reach the request breakdown
+        contexts = [copy_context() for _ in jobs]
+        return list(get_track_pool().map(lambda context, job: context.run(build, *job), contexts, jobs))
+    
+    def _encoded_track(self, instrument_name, analysis, rng, devices=None):
+        """Build one instrument's events and serialize them to MTrk data"""
+        program, events = self._instrument_track(instrument_name, analysis, rng, devices)
+        with timed('midi.encode'):
+            return encode_track(events, program)
+    
+    def stream(self, instruments=['piano'], seed=None):
+        """Incremental renderer for analyze_stream output; see MIDIStream"""
+        return MIDIStream(self, instruments, seed)
+    
+    @timed('midi.encode')
+    def _encode_with_midiutil(self, tracks, tempo):
+        """Reference encoder: write the same note events through midiutil"""
+        midi = MIDIFile(len(tracks))
+        for i in range(len(tracks)):
+            midi.addTempo(i, 0, tempo)
+        
+        for i, (program, events) in enumerate(tracks):
+            if program is not None:
+                midi.addProgramChange(i, 0, 0, program)
+            for channel, pitch, start, duration, velocity in events.notes():
+                midi.addNote(i, channel, pitch, start, duration, velocity)
+        
+        buffer = io.BytesIO()
+        midi.writeFile(buffer)
+        return buffer.getvalue()
+    
+    def default_seed(self, analysis):
+        """Derive a stable seed from the poem's lines"""
+        poem = '\n'.join(analysis.get('lines', []))
+        return int.from_bytes(hashlib.sha256(poem.encode('utf-8')).digest()[:8], 'big')
+    
+    @timed('midi.write')
+    def save_midi(self, midi_data, title="Untitled", filename=None):
+        """Write rendered MIDI bytes to static/midi and return the filename"""
+        if not filename:
+            safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+            filename = f"{safe_title.replace(' ', '_')}.mid"
+        
+        midi_path = os.path.join('static', 'midi', filename)
+        os.makedirs(os.path.dirname(midi_path), exist_ok=True)
+        
+        with open(midi_path, 'wb') as output_file:
+            output_file.write(midi_data)
+        
+        logging.info(f"Generated MIDI file: {midi_path}")
+        return filename
+    
+    @timed('midi.track_events')
+    def _instrument_track(self, instrument_name, analysis, rng, devices=None):
+        """
+        Build (program, NoteEvents) for a specific instrument
+        devices is the analysis' _device_syllables(), passed in when several tracks share it.
+        """
+        # Drums play on the percussion channel and need no program change
+        program = None if instrument_name == 'drums' else self.instruments.get(instrument_name, 0)
         
         # Get musical parameters
-        key = analysis.get('key_suggestion', 'C')
-        scale = self.scales.get(key, self.scales['C'])
         syllable_counts = analysis.get('syllable_counts', [8, 8, 8, 8])
-        line_count = analysis.get('line_count', 4)
+        line_moods = self._line_moods(analysis, len(syllable_counts))
+        if devices is None:
+            devices = self._device_syllables(analysis)
         
         if instrument_name == 'drums':
-            self._add_drum_track(midi, track, analysis)
+            events = self._drum_events(analysis)
         elif instrument_name in ['piano', 'acoustic_guitar', 'electric_guitar']:
-            self._add_melody_and_harmony_track(midi, track, scale, syllable_counts, analysis)
+            events = self._melody_and_harmony_events(syllable_counts, line_moods, analysis, devices, rng)
         else:
-            self._add_melody_track(midi, track, scale, syllable_counts, analysis)
+            events = self._melody_events(syllable_counts, line_moods, analysis, devices, rng)
+        return program, events
+    
+    def _line_moods(self, analysis, line_count):
+        """
+        Mood of the stanza each line belongs to: 1 positive, -1 negative, 0 neutral
+        Analyses without a per-stanza sentiment arc use the poem's mood throughout.
+        """
+        sentiment = analysis.get('sentiment', {})
+        stanza_arc = sentiment.get('stanza_arc')
+        stanza_lengths = analysis.get('stanza_lengths')
+        if stanza_arc and stanza_lengths and sum(stanza_lengths) == line_count:
+            polarity = np.repeat(stanza_arc, stanza_lengths)
+            return np.select([polarity > MOOD_THRESHOLD, polarity < -MOOD_THRESHOLD], [1, -1], 0)
+        mood = sentiment.get('mood', 'neutral')
+        return np.full(line_count, 1 if mood == 'positive' else -1 if mood == 'negative' else 0)
+    
+    def _line_keys(self, analysis, line_moods):
+        """
+        Key (harmony table row) of every line: the suggested key, or its relative major or
+        minor in stanzas of the opposite mood
+        """
+        key = harmony.key_index(analysis.get('key_suggestion', 'C'))
+        against = line_moods == (1 if harmony.MINOR_THIRD[key] else -1)
+        return np.where(against, harmony.RELATIVE_KEYS[key], key)
+    
+    def _line_dynamics(self, analysis, line_count):
+        """Velocity offset of every line from its polarity, or from the poem's mood without a sentiment arc"""
+        sentiment = analysis.get('sentiment', {})
+        arc = sentiment.get('arc')
+        if arc and len(arc) == line_count:
+            return np.rint(np.clip(arc, -1.0, 1.0) * LINE_DYNAMICS).astype(np.int64)
+        mood = sentiment.get('mood', 'neutral')
+        return np.full(line_count, 10 if mood == 'positive' else -10 if mood == 'negative' else 0)
     
-    def _add_melody_track(self, midi, track, scale, syllable_counts, analysis):
-        """Add a melody track"""
-        time = 0
+    def _melody_events(self, syllable_counts, line_moods, analysis, devices, rng):
+        """Melody line: one half-beat note per syllable, with a rest between lines"""
         beat_duration = 0.5  # Half note per syllable
+        line_idx, position, line_length, start = syllable_grid(syllable_counts, beat_duration)
+        scales = harmony.SCALES[self._line_keys(analysis, line_moods)]
         
-        for line_idx, syllable_count in enumerate(syllable_counts):
-            # Generate melody for this line
-            for syllable in range(syllable_count):
-                # Choose note based on position and analysis
-                note_idx = self._choose_note_index(syllable, syllable_count, line_idx, analysis)
-                note = scale[note_idx % len(scale)]
-                
-                # Add some octave variation
-                if random.random() < 0.3:
-                    note += 12 if random.random() < 0.5 else -12
-                
-                # Ensure note is in reasonable range
-                note = max(48, min(84, note))
-                
-                # Add note
-                velocity = self._get_velocity(syllable, syllable_count, analysis)
-                midi.addNote(track, 0, note, time, beat_duration, velocity)
-                time += beat_duration
-            
-            # Add pause between lines
-            time += beat_duration
+        # Choose notes based on position and each stanza's mood
+        note_idx = self._choose_note_indices(position, line_length, line_moods[line_idx], rng)
+        notes = scales[line_idx, note_idx % scales.shape[1]]
+        
+        # Add some octave variation
+        octave_jump = rng.random(len(notes)) < 0.3
+        upward = rng.random(len(notes)) < 0.5
+        notes = notes + np.where(octave_jump, np.where(upward, 12, -12), 0)
+        
+        velocity = self._get_velocities(line_idx, position, line_length,
+                                        self._line_dynamics(analysis, len(syllable_counts)), rng)
+        notes, velocity, duration = self._device_effects(devices, notes, velocity, beat_duration, 48, 84)
+        return NoteEvents(notes, start, duration, velocity, 0)
     
-    def _add_melody_and_harmony_track(self, midi, track, scale, syllable_counts, analysis):
-        """Add both melody and harmony for piano/guitar"""
-        time = 0
+    def _melody_and_harmony_events(self, syllable_counts, line_moods, analysis, devices, rng):
+        """Both melody and harmony for piano/guitar"""
         beat_duration = 0.5
+        line_keys = self._line_keys(analysis, line_moods)
+        scales = harmony.SCALES[line_keys]
         
-        # Add bass line first
-        key = analysis.get('key_suggestion', 'C')
-        is_minor = 'm' in key
-        chord_progression = self.chord_progressions['minor' if is_minor else 'major']
-        
-        chord_time = 0
+        # Bass note and voice-led triad of each line's chord, looked up for its key and the
+        # progression the poem's key and meter call for
+        progression = harmony.progression_index(harmony.key_index(analysis.get('key_suggestion', 'C')),
+                                                analysis.get('meter'))
         chord_duration = 2.0  # 2 beats per chord
         
-        for line_idx, syllable_count in enumerate(syllable_counts):
-            # Add chord for this line
-            chord_idx = line_idx % len(chord_progression)
-            chord = chord_progression[chord_idx]
-            
-            # Add bass note
-            bass_note = scale[chord[0]] - 24  # One octave lower
-            bass_note = max(24, min(60, bass_note))
-            midi.addNote(track, 0, bass_note, chord_time, chord_duration, 70)
-            
-            # Add chord notes
-            for note_idx in chord:
-                chord_note = scale[note_idx % len(scale)] - 12
-                chord_note = max(36, min(72, chord_note))
-                midi.addNote(track, 0, chord_note, chord_time, chord_duration, 60)
-            
-            chord_time += chord_duration
-        
-        # Add melody on top
-        time = 0
-        for line_idx, syllable_count in enumerate(syllable_counts):
-            for syllable in range(syllable_count):
-                note_idx = self._choose_note_index(syllable, syllable_count, line_idx, analysis)
-                note = scale[note_idx % len(scale)]
-                
-                # Melody octave
-                note = max(60, min(84, note))
-                
-                velocity = self._get_velocity(syllable, syllable_count, analysis)
-                midi.addNote(track, 0, note, time, beat_duration, velocity)
-                time += beat_duration
-            
-            time += beat_duration
+        line_count = len(syllable_counts)
+        lines = np.arange(line_count)
+        chord_time = lines * chord_duration
+        voicings = harmony.VOICINGS[line_keys, progression, lines % harmony.VOICINGS.shape[2]]
+        chord_size = voicings.shape[1] - 1  # bass and triad; the last column is the seventh
+        harmony_pitch = voicings[:, :chord_size].ravel()
+        dynamics = self._line_dynamics(analysis, line_count)
+        harmony_velocity = (np.array([70] + [60] * (chord_size - 1)) + dynamics[:, None]).clip(30, 127).ravel()
+        harmony_events = NoteEvents(harmony_pitch, np.repeat(chord_time, chord_size), chord_duration, harmony_velocity, 0)
+        
+        # Melody on top
+        line_idx, position, line_length, start = syllable_grid(syllable_counts, beat_duration)
+        
+        # Lines holding a simile or metaphor add the chord's seventh, colouring the comparison
+        figurative, _ = devices['metaphor_simile']
+        if len(figurative):
+            figurative_lines = np.unique(line_idx[figurative])
+            harmony_events = NoteEvents.concat([harmony_events, NoteEvents(
+                voicings[figurative_lines, chord_size], chord_time[figurative_lines], chord_duration,
+                (60 + dynamics[figurative_lines]).clip(30, 127), 0)])
+        
+        note_idx = self._choose_note_indices(position, line_length, line_moods[line_idx], rng)
+        
+        # Melody octave
+        notes = scales[line_idx, note_idx % scales.shape[1]]
+        
+        velocity = self._get_velocities(line_idx, position, line_length, dynamics, rng)
+        notes, velocity, duration = self._device_effects(devices, notes, velocity, beat_duration, 60, 84)
+        melody = NoteEvents(notes, start, duration, velocity, 0)
+        return NoteEvents.concat([harmony_events, melody])
+    
+    def _device_syllables(self, analysis):
+        """
+        Melody syllables where each literary device occurs, with the group each belongs to
+        Returns {device: (syllable index, group)} arrays over the syllable grid; they are
+        empty for analyses without device positions and skip positions outside the grid.
+        """
+        counts = np.asarray(analysis.get('syllable_counts', [8, 8, 8, 8]), dtype=np.int64).clip(min=0)
+        offsets = np.cumsum(counts) - counts
+        found = analysis.get('literary_devices') or {}
+        devices = {}
+        for name in DEVICE_EFFECTS:
+            positions = (found.get(name) or {}).get('positions') or []
+            positions = np.fromiter(chain.from_iterable(positions), dtype=np.int64, count=4 * len(positions)).reshape(-1, 4)
+            line, syllable, group = positions[:, 0], positions[:, 2], positions[:, 3]
+            inside = (line >= 0) & (line < len(counts)) & (syllable >= 0)
+            inside[inside] &= syllable[inside] < counts[line[inside]]
+            devices[name] = (offsets[line[inside]] + syllable[inside], group[inside])
+        return devices
     
-    def _add_drum_track(self, midi, track, analysis):
-        """Add drum track"""
+    def _device_effects(self, devices, notes, velocity, beat_duration, low, high):
+        """Melody (notes, velocity, duration) with the literary device effects applied, notes clipped to low..high"""
+        notes = np.array(notes, dtype=np.int64)
+        velocity = np.array(velocity, dtype=np.int64)
+        duration = np.full(len(notes), beat_duration)
+        
+        # Repetition: every occurrence of a repeated word replays the pitch of its first one
+        repeats, groups = devices['repetition']
+        if len(repeats):
+            order = np.argsort(repeats, kind='stable')
+            repeats, groups = repeats[order], groups[order]
+            _, first, inverse = np.unique(groups, return_index=True, return_inverse=True)
+            notes[repeats] = notes[repeats[first][inverse]]
+        
+        notes[devices['imagery'][0]] += IMAGERY_LIFT
+        velocity[devices['alliteration'][0]] += ALLITERATION_ACCENT
+        notes = notes.clip(low, high)
+        
+        # Assonance: held over into the next syllable, unless that one repeats the pitch
+        assonance = devices['assonance'][0]
+        following = np.minimum(assonance + 1, len(notes) - 1)
+        legato = assonance[(following > assonance) & (notes[following] != notes[assonance])]
+        duration[legato] = beat_duration * ASSONANCE_LEGATO
+        
+        return notes, velocity.clip(40, 127), duration
+    
+    def _drum_events(self, analysis):
+        """Drum pattern: kick on beats 1 and 3, snare on 2 and 4, hi-hat on every beat"""
         # Drum channel is 9 (0-indexed)
         channel = 9
         
@@ -170,66 +330,102 @@ class MIDIGenerator:
         snare = 38
         hihat = 42
         
-        time = 0
         beat_duration = 0.5
-        total_beats = sum(analysis.get('syllable_counts', [8, 8, 8, 8])) + len(analysis.get('syllable_counts', [8, 8, 8, 8]))
+        syllable_counts = analysis.get('syllable_counts', [8, 8, 8, 8])
+        total_beats = int(sum(syllable_counts) + len(syllable_counts))
         
-        for beat in range(int(total_beats)):
-            # Kick on beats 1 and 3
-            if beat % 4 == 0 or beat % 4 == 2:
-                midi.addNote(track, channel, kick, time, beat_duration, 100)
-            
-            # Snare on beats 2 and 4
-            if beat % 4 == 1 or beat % 4 == 3:
-                midi.addNote(track, channel, snare, time, beat_duration, 90)
-            
-            # Hi-hat on every beat
-            midi.addNote(track, channel, hihat, time, beat_duration * 0.8, 70)
-            
-            time += beat_duration
-    
-    def _choose_note_index(self, syllable_pos, total_syllables, line_idx, analysis):
-        """Choose a note index based on position and analysis"""
-        # Start with scale degree based on position
-        if syllable_pos == 0:
-            # Start of line - use tonic
-            return 0
-        elif syllable_pos == total_syllables - 1:
-            # End of line - resolve to tonic or dominant
-            return 0 if random.random() < 0.7 else 4
-        else:
-            # Middle of line - use scale degrees with some logic
-            sentiment = analysis.get('sentiment', {})
-            mood = sentiment.get('mood', 'neutral')
-            
-            if mood == 'positive':
-                # Use brighter notes (3rd, 5th)
-                return random.choice([2, 4, 6])
-            elif mood == 'negative':
-                # Use more somber notes (2nd, 6th)
-                return random.choice([1, 3, 5])
-            else:
-                # Neutral - use all scale degrees
-                return random.randint(0, 6)
-    
-    def _get_velocity(self, syllable_pos, total_syllables, analysis):
-        """Get note velocity based on position and analysis"""
+        beat = np.arange(total_beats)
+        on_kick = beat % 2 == 0
+        time = beat * beat_duration
+        
+        # Beats follow the syllable grid (one per syllable plus the rest after each line),
+        # so each beat takes the dynamics of the line it falls in
+        line_ends = np.cumsum(np.asarray(syllable_counts, dtype=np.int64).clip(min=0) + 1)
+        dynamics = self._line_dynamics(analysis, len(syllable_counts))
+        accent = dynamics[np.searchsorted(line_ends, beat, side='right')] if total_beats else np.zeros(0, dtype=np.int64)
+        
+        # Kick or snare then hi-hat on each beat
+        pitch = np.column_stack([np.where(on_kick, kick, snare), np.full(total_beats, hihat)]).ravel()
+        velocity = np.column_stack([np.where(on_kick, 100, 90) + accent, np.full(total_beats, 70) + accent]).ravel()
+        duration = np.tile([beat_duration, beat_duration * 0.8], total_beats)
+        return NoteEvents(pitch, np.repeat(time, 2), duration, velocity.clip(30, 127), channel)
+    
+    def _choose_note_indices(self, syllable_pos, total_syllables, moods, rng):
+        """Choose scale degrees for every syllable from its position and the mood (1, 0, -1) of its stanza"""
+        count = len(syllable_pos)
+        
+        # Middle of line: brighter degrees (3rd, 5th, 7th) when positive, more somber
+        # ones (2nd, 4th, 6th) when negative, any degree when neutral
+        draw = rng.random(count)
+        middle = np.select(
+            [moods > 0, moods < 0],
+            [np.array([2, 4, 6])[(draw * 3).astype(np.int64)], np.array([1, 3, 5])[(draw * 3).astype(np.int64)]],
+            (draw * 7).astype(np.int64)
+        )
+        
+        # End of line - resolve to tonic or dominant
+        ending = np.where(rng.random(count) < 0.7, 0, 4)
+        
+        # Start of line - use tonic
+        return np.where(syllable_pos == 0, 0, np.where(syllable_pos == total_syllables - 1, ending, middle))
+    
+    def _get_velocities(self, line_idx, syllable_pos, total_syllables, dynamics, rng):
+        """Note velocities for every syllable from its position and its line's dynamics"""
         base_velocity = 80
         
-        # Vary velocity based on position
-        if syllable_pos == 0 or syllable_pos == total_syllables - 1:
-            # Emphasize beginning and end
-            velocity = base_velocity + 10
-        else:
-            velocity = base_velocity + random.randint(-10, 10)
+        # Emphasize beginning and end, vary the rest
+        edge = (syllable_pos == 0) | (syllable_pos == total_syllables - 1)
+        velocity = np.where(edge, base_velocity + 10, base_velocity + rng.integers(-10, 11, len(syllable_pos)))
         
-        # Adjust based on sentiment
-        sentiment = analysis.get('sentiment', {})
-        mood = sentiment.get('mood', 'neutral')
+        # Louder on positive lines, softer on negative ones
+        velocity += dynamics[line_idx]
         
-        if mood == 'positive':
-            velocity += 10
-        elif mood == 'negative':
-            velocity -= 10
+        return velocity.clip(40, 127)
+
+
+class MIDIStream:
+    """
+    Builds a composition stanza by stanza as analyses arrive
+    Each stanza is rendered with its own key and mood and placed after the previous one;
+    only the compact note arrays are kept until finish() encodes the file.
+    """
+    
+    def __init__(self, generator, instruments, seed=None):
+        self.generator = generator
+        self.instruments = list(instruments)
+        self.seed = seed
+        self.position = 0.0  # start of the next stanza, in beats
+        self._rngs = None
+        self._programs = [None] * len(self.instruments)
+        self._parts = [[] for _ in self.instruments]
+    
+    def add_stanza(self, analysis):
+        """Render one stanza's tracks; returns the new (program, NoteEvents) per instrument"""
+        if self._rngs is None:
+            seed = self.generator.default_seed(analysis) if self.seed is None else self.seed
+            self._rngs = [np.random.default_rng(track_seed)
+                          for track_seed in np.random.SeedSequence(seed).spawn(len(self.instruments))]
+        
+        new_tracks = []
+        devices = self.generator._device_syllables(analysis)
+        for i, (instrument, rng) in enumerate(zip(self.instruments, self._rngs)):
+            program, events = self.generator._instrument_track(instrument, analysis, rng, devices)
+            events = events.shifted(self.position)
+            self._programs[i] = program
+            self._parts[i].append(events)
+            new_tracks.append((program, events))
         
-        return max(40, min(127, velocity))
+        self.position += self.stanza_beats(analysis.get('syllable_counts', []))
+        return new_tracks
+    
+    def stanza_beats(self, syllable_counts):
+        """Length of a stanza: the melody grid or the chord progression, whichever is longer"""
+        return max((sum(syllable_counts) + len(syllable_counts)) * 0.5, len(syllable_counts) * 2.0)
+    
+    def finish(self, tempo=120):
+        """Encode everything added so far into MIDI file bytes"""
+        tracks = [(program, NoteEvents.concat(parts)) for program, parts in zip(self._programs, self._parts)]
+        if self.generator.engine == 'midiutil':
+            return self.generator._encode_with_midiutil(tracks, tempo)
+        with timed('midi.encode'):
+            return assemble_smf([encode_track(events, program) for program, events in tracks], tempo)
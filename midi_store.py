@@ -0,0 +1,118 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+# Content-addressed store for rendered MIDI. Files are named by the SHA-256 of
+# their bytes and sharded by the first two hex digits, so identical renders
+# are written once and two poems with the same title never collide. Recently
+# used files are also kept in a small in-memory LRU for serving.
+
+DEFAULT_STORE_DIR = os.environ.get(
+    'MIDI_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'midi_store')
+)
+DEFAULT_MEMORY_BYTES = int(os.environ.get('MIDI_STORE_MEMORY_BYTES', 32 * 1024 * 1024))
+
+FILENAME_PATTERN = re.compile(r'^([0-9a-f]{64})\.mid$')
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@lru_cache(maxsize=1024)
+def _file_digest(path, mtime_ns, size):
+    with open(path, 'rb') as input_file:
+        return hashlib.file_digest(input_file, 'sha256').hexdigest()
+
+
+def file_digest(path):
+    """Content hash of a file on disk, recomputed only when its size or mtime changes"""
+    stat = os.stat(path)
+    return _file_digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+def digest_from_filename(filename):
+    """Return the content hash for a content-addressed filename, or None for legacy names"""
+    match = FILENAME_PATTERN.match(filename or '')
+    return match.group(1) if match else None
+
+
+class MidiStore:
+    def __init__(self, root=DEFAULT_STORE_DIR, memory_bytes=DEFAULT_MEMORY_BYTES):
+        self.root = root
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def filename(self, digest):
+        return f"{digest}.mid"
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], self.filename(digest))
+
+    def put(self, data):
+        """Store MIDI bytes under their content hash; returns the hash"""
+        digest = content_digest(data)
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as output_file:
+                output_file.write(data)
+            os.replace(tmp_path, path)
+            logging.info(f"Stored MIDI file: {path}")
+        self._remember(digest, data)
+        return digest
+
+    def last_modified(self, digest):
+        """Modification time of a stored file, or None if it is not on disk"""
+        try:
+            return os.path.getmtime(self.path(digest))
+        except FileNotFoundError:
+            return None
+
+    def exists(self, digest):
+        with self._lock:
+            if digest in self._memory:
+                return True
+        return os.path.exists(self.path(digest))
+
+    def get_cached(self, digest):
+        """MIDI bytes if they are held in memory, else None"""
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+            return data
+
+    def get(self, digest):
+        """MIDI bytes from memory or disk; None if unknown"""
+        data = self.get_cached(digest)
+        if data is not None:
+            return data
+        try:
+            with open(self.path(digest), 'rb') as input_file:
+                data = input_file.read()
+        except FileNotFoundError:
+            return None
+        self._remember(digest, data)
+        return data
+
+    def _remember(self, digest, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                return
+            self._memory[digest] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
@@ -0,0 +1,152 @@
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from analysis_codec import pack_analysis
+
+# Minimal schema migrations for deployments whose tables predate the models.
+# db.create_all() creates missing tables but never alters existing ones, so
+# sync_schema() adds missing (nullable) columns and indexes on every start,
+# then each data migration in MIGRATIONS runs once and is recorded in the
+# schema_migrations table.
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def sync_schema(db):
+    """Add model columns and indexes that existing tables are missing"""
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl_type}'))
+                logging.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def pack_composition_analysis(db):
+    """Move legacy JSON analysis_data rows into the packed analysis_blob column"""
+    from models import Composition
+
+    converted = 0
+    for composition in _batches(db, Composition.with_content().filter(
+            Composition.analysis_blob.is_(None), Composition.analysis_data.isnot(None))):
+        try:
+            analysis = json.loads(composition.analysis_data)
+        except ValueError:
+            logging.warning(f"Leaving unreadable analysis_data of composition {composition.id} as is")
+            continue
+        composition.analysis_blob = pack_analysis(analysis, composition.poem_text)
+        composition.analysis_data = None
+        converted += 1
+    logging.info(f"Packed analysis_data for {converted} compositions")
+
+
+def backfill_composition_filters(db):
+    """Fill composition.mood and the composition_instrument rows used by the listing filters"""
+    from models import Composition, CompositionInstrument
+
+    updated = 0
+    for composition in _batches(db, Composition.with_content()):
+        if composition.mood is None:
+            composition.mood = composition.analysis.get('sentiment', {}).get('mood')
+        if not composition.instrument_links:
+            instruments = [name.strip() for name in (composition.instruments or '').split(',') if name.strip()]
+            composition.instrument_links = [CompositionInstrument(instrument=name, created_at=composition.created_at)
+                                            for name in dict.fromkeys(instruments)]
+        updated += 1
+    logging.info(f"Backfilled listing filters for {updated} compositions")
+
+
+def create_search_index(db):
+    """Full-text search over title and poem_text: FTS5 on SQLite, a tsvector column on PostgreSQL"""
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialect == 'sqlite':
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS composition_fts USING fts5("
+                "title, poem_text, content='composition', content_rowid='id')"
+            ))
+            # External-content FTS table kept in step with composition by triggers
+            connection.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS composition_fts_insert AFTER INSERT ON composition BEGIN "
+                "INSERT INTO composition_fts(rowid, title, poem_text) VALUES (new.id, new.title, new.poem_text); END"
+            ))
+            connection.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS composition_fts_delete AFTER DELETE ON composition BEGIN "
+                "INSERT INTO composition_fts(composition_fts, rowid, title, poem_text) "
+                "VALUES ('delete', old.id, old.title, old.poem_text); END"
+            ))
+            connection.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS composition_fts_update AFTER UPDATE OF title, poem_text ON composition BEGIN "
+                "INSERT INTO composition_fts(composition_fts, rowid, title, poem_text) "
+                "VALUES ('delete', old.id, old.title, old.poem_text); "
+                "INSERT INTO composition_fts(rowid, title, poem_text) VALUES (new.id, new.title, new.poem_text); END"
+            ))
+            connection.execute(text("INSERT INTO composition_fts(composition_fts) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            connection.execute(text(
+                "ALTER TABLE composition ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                "GENERATED ALWAYS AS (to_tsvector('english', coalesce(title, '') || ' ' || coalesce(poem_text, ''))) STORED"
+            ))
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_composition_search_vector ON composition USING GIN (search_vector)"
+            ))
+        else:
+            logging.warning(f"No full-text index for database dialect '{dialect}'; search falls back to LIKE")
+            return
+    logging.info(f"Created full-text search index ({dialect})")
+
+
+MIGRATIONS = [
+    pack_composition_analysis,
+    backfill_composition_filters,
+    create_search_index,
+]
+
+
+def _batches(db, query):
+    """Iterate a Composition query in id order, committing after every batch"""
+    from models import Composition
+
+    last_id = 0
+    while True:
+        rows = query.filter(Composition.id > last_id).order_by(Composition.id).limit(BACKFILL_BATCH_SIZE).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        yield from rows
+        db.session.commit()
+
+
+def run_migrations(db):
+    """Bring the schema up to date and apply pending data migrations; call after db.create_all()"""
+    sync_schema(db)
+
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations (name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP)'
+        ))
+        applied = {row[0] for row in connection.execute(text('SELECT name FROM schema_migrations'))}
+
+    for migration in MIGRATIONS:
+        if migration.__name__ in applied:
+            continue
+        migration(db)
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    text('INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)'),
+                    {'name': migration.__name__, 'applied_at': datetime.utcnow()}
+                )
+        except IntegrityError:
+            pass  # another worker recorded it first; every migration is safe to repeat
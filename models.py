@@ -1,18 +1,102 @@
+import json
+import logging
 from app import db
 from datetime import datetime
+from analysis_codec import pack_analysis, unpack_analysis
 
 class Composition(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    poem_text = db.Column(db.Text, nullable=False)
+    # Large columns are deferred as one group: listings never load them, and
+    # touching any of them on a row loads all three in a single query
+    poem_text = db.deferred(db.Column(db.Text, nullable=False), group='content')
     midi_filename = db.Column(db.String(100), nullable=False)
     audio_filename = db.Column(db.String(100), nullable=True)
-    analysis_data = db.Column(db.Text, nullable=True)  # JSON string of analysis results
+    analysis_data = db.deferred(db.Column(db.Text, nullable=True), group='content')  # Legacy JSON string of analysis results
+    analysis_blob = db.deferred(db.Column(db.LargeBinary, nullable=True), group='content')  # Packed analysis (see analysis_codec)
     instruments = db.Column(db.String(200), nullable=True)  # Comma-separated instrument list
     tempo = db.Column(db.Integer, default=120)
     key_signature = db.Column(db.String(10), default='C')
     time_signature = db.Column(db.String(10), default='4/4')
+    mood = db.Column(db.String(20), nullable=True)  # Sentiment mood, copied out of the analysis for filtering
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    instrument_links = db.relationship('CompositionInstrument', cascade='all, delete-orphan', lazy='select')
+    
+    # Listing is keyset-paginated newest first on (created_at, id); each filter
+    # column leads its own index so filtered pages are read in order too
+    __table_args__ = (
+        db.Index('ix_composition_created_at_id', 'created_at', 'id'),
+        db.Index('ix_composition_key_signature_created_at', 'key_signature', 'created_at', 'id'),
+        db.Index('ix_composition_mood_created_at', 'mood', 'created_at', 'id'),
+        db.Index('ix_composition_tempo', 'tempo'),
+    )
+    
+    @classmethod
+    def summaries(cls):
+        """Query loading only the small columns a listing shows"""
+        return cls.query.options(db.load_only(
+            cls.id, cls.title, cls.created_at, cls.midi_filename, cls.instruments,
+            cls.tempo, cls.key_signature, cls.time_signature, cls.mood
+        ))
+    
+    @classmethod
+    def with_content(cls):
+        """Query that also loads the poem text and analysis up front"""
+        return cls.query.options(db.undefer_group('content'))
+    
+    @classmethod
+    def from_analysis(cls, title, poem_text, instruments, midi_filename, analysis):
+        """New composition row for an analyzed poem and its stored MIDI"""
+        created_at = datetime.utcnow()
+        return cls(
+            title=title,
+            poem_text=poem_text,
+            midi_filename=midi_filename,
+            analysis_blob=pack_analysis(analysis, poem_text),
+            instruments=','.join(instruments),
+            tempo=analysis.get('tempo_suggestion', 120),
+            key_signature=analysis.get('key_suggestion', 'C'),
+            time_signature=analysis.get('time_signature', '4/4'),
+            mood=analysis.get('sentiment', {}).get('mood'),
+            created_at=created_at,
+            instrument_links=[CompositionInstrument(instrument=instrument, created_at=created_at)
+                              for instrument in dict.fromkeys(instruments)]
+        )
+    
+    @property
+    def analysis(self):
+        """Analysis results as a dict, decoded from the packed blob or legacy JSON"""
+        try:
+            if self.analysis_blob is not None:
+                return unpack_analysis(self.analysis_blob, self.poem_text)
+            if self.analysis_data:
+                return json.loads(self.analysis_data)
+        except (ValueError, TypeError) as e:
+            logging.warning(f"Could not decode analysis for composition {self.id}: {e}")
+        return {}
+    
     def __repr__(self):
         return f'<Composition {self.title}>'
+
+class CompositionInstrument(db.Model):
+    """One row per instrument used by a composition, for filtering by instrument"""
+    composition_id = db.Column(db.Integer, db.ForeignKey('composition.id', ondelete='CASCADE'), primary_key=True)
+    instrument = db.Column(db.String(50), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=True)  # Copy of the composition's, so instrument pages read in index order
+    
+    __table_args__ = (
+        db.Index('ix_composition_instrument_created_at', 'instrument', 'created_at', 'composition_id'),
+    )
+
+class AnalysisJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, done, failed
+    payload = db.Column(db.Text, nullable=False)  # JSON string of the /analyze request
+    composition_id = db.Column(db.Integer, db.ForeignKey('composition.id'), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AnalysisJob {self.id} {self.status}>'
@@ -0,0 +1,66 @@
+import numpy as np
+
+# Columnar note-event representation used by MIDIGenerator. A track is a set
+# of parallel NumPy arrays (one entry per note) built in batch from the
+# syllable counts, instead of one midiutil event object per addNote call.
+# Array order is insertion order, which the encoder uses to break ties.
+
+
+def _column(values, dtype, count):
+    """values as a dtype array of length count, broadcasting scalars"""
+    values = np.asarray(values, dtype=dtype)
+    if values.shape == (count,):
+        return values
+    return np.broadcast_to(values, (count,))
+
+
+class NoteEvents:
+    """Parallel arrays of pitch, start (beats), duration (beats), velocity and channel"""
+    __slots__ = ("pitch", "start", "duration", "velocity", "channel")
+
+    def __init__(self, pitch, start, duration, velocity, channel):
+        self.pitch = np.asarray(pitch, dtype=np.int16)
+        count = len(self.pitch)
+        self.start = _column(start, np.float64, count)
+        self.duration = _column(duration, np.float64, count)
+        self.velocity = _column(velocity, np.int16, count)
+        self.channel = _column(channel, np.int16, count)
+
+    def __len__(self):
+        return len(self.pitch)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0), np.empty(0), np.empty(0), np.empty(0), np.empty(0))
+
+    @classmethod
+    def concat(cls, parts):
+        """Join event sets, keeping each part's notes after the previous part's"""
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(part, name) for part in parts]) for name in cls.__slots__))
+
+    def shifted(self, beats):
+        """Copy of these events starting `beats` later"""
+        return NoteEvents(self.pitch, self.start + beats, self.duration, self.velocity, self.channel)
+
+    def notes(self):
+        """Iterate (channel, pitch, start, duration, velocity) tuples in insertion order"""
+        return zip(self.channel.tolist(), self.pitch.tolist(), self.start.tolist(),
+                   self.duration.tolist(), self.velocity.tolist())
+
+
+def syllable_grid(syllable_counts, beat_duration):
+    """
+    Lay syllables out one per beat_duration with a one-beat rest after each line
+    Returns (line_index, position_in_line, line_length, start) arrays, one entry per syllable.
+    """
+    counts = np.asarray(syllable_counts, dtype=np.int64).clip(min=0)
+    total = int(counts.sum())
+    line_index = np.repeat(np.arange(len(counts)), counts)
+    line_offsets = np.cumsum(counts) - counts
+    position = np.arange(total) - np.repeat(line_offsets, counts)
+    line_length = np.repeat(counts, counts)
+    start = (np.arange(total) + line_index) * beat_duration
+    return line_index, position, line_length, start
@@ -1,36 +1,279 @@
+import os
 import re
-import nltk
-import spacy
-from textblob import TextBlob
+import threading
 from collections import Counter
+from functools import lru_cache
 import logging
+import numpy as np
+from harmony import suggest_key
+from metrics import timed
+from pronunciation_index import DEFAULT_INDEX_PATH, load_index
+from sentiment_lexicon import load_lexicon
 
-# Download required NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+# Heavy NLP resources (NLTK data, spaCy, TextBlob's lexicon, the pronunciation
+# index) are loaded lazily on first use, or once up front via preload_models().
+# With POETRY_OFFLINE set, missing NLTK data is never downloaded.
+OFFLINE = os.environ.get('POETRY_OFFLINE', '').lower() in ('1', 'true', 'yes')
 
-try:
-    nltk.data.find('corpora/cmudict')
-except LookupError:
-    nltk.download('cmudict')
+# Bump whenever analyze_poem output changes, so cached analyses are invalidated
+ANALYZER_VERSION = 7
 
-# Load spaCy model
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    logging.warning("spaCy model 'en_core_web_sm' not found. Install with: python -m spacy download en_core_web_sm")
-    nlp = None
+# 'lexicon' scores sentiment with the compiled lexicon in sentiment_lexicon.py;
+# 'textblob' runs TextBlob over the poem, each stanza and each line (slower, kept for accuracy checks)
+SENTIMENT_ENGINES = ('lexicon', 'textblob')
+DEFAULT_SENTIMENT_ENGINE = os.environ.get('SENTIMENT_ENGINE', 'lexicon')
+
+_load_lock = threading.Lock()
+_nlp = None
+_nlp_loaded = False
+
+
+def ensure_nltk_data(resource, package):
+    """Return True if an NLTK resource is installed, downloading it unless offline"""
+    import nltk
+    try:
+        nltk.data.find(resource)
+        return True
+    except LookupError:
+        pass
+    if OFFLINE:
+        logging.warning(f"NLTK resource '{package}' not found and POETRY_OFFLINE is set; not downloading")
+        return False
+    return bool(nltk.download(package, quiet=True))
+
+
+def get_nlp():
+    """Load the spaCy model on first use; returns None if it is not installed"""
+    global _nlp, _nlp_loaded
+    if not _nlp_loaded:
+        with _load_lock:
+            if not _nlp_loaded:
+                try:
+                    import spacy
+                    _nlp = spacy.load("en_core_web_sm")
+                except (ImportError, OSError):
+                    logging.warning("spaCy model 'en_core_web_sm' not found. Install with: python -m spacy download en_core_web_sm")
+                _nlp_loaded = True
+    return _nlp
+
+
+def load_pronunciations(path=DEFAULT_INDEX_PATH):
+    """Open the pronunciation index, fetching cmudict to build it if needed"""
+    if not os.path.exists(path):
+        ensure_nltk_data('corpora/cmudict', 'cmudict')
+    return load_index(path)
+
+
+def preload_models(analyzer=None, spacy_model=False):
+    """
+    Load heavy models ahead of the first request
+    Call this in the gunicorn master (preload_app) so forked workers share the pages.
+    """
+    analyzer = analyzer or PoetryAnalyzer()
+    analyzer.pronunciations
+    # Opens the sentiment lexicon (or TextBlob's, in textblob mode) on the first call
+    analyzer._analyze_sentiment(analyzer.parse_poem("preload"))
+    if spacy_model:
+        get_nlp()
+    return analyzer
+
+
+# Elisions and possessives ("dimm'd", "ow'st", "summer's") stay one word, so lines rhyme on the whole word
+WORD_PATTERN = re.compile(r"\w+(?:'\w+)*")
+SPELLING_RHYME_PATTERN = re.compile(r'[aeiouy]+[^aeiouy]*$')
+
+# Static descriptions attached to each literary device result (not stored per composition)
+LITERARY_DEVICE_INFO = {
+    "alliteration": {
+        "explanation": "Alliteration is the repetition of consonant sounds at the beginning of words. In music, this creates rhythmic emphasis through repeated notes or accents.",
+        "musical_impact": "Creates syncopated rhythms and emphasizes certain beats"
+    },
+    "repetition": {
+        "explanation": "Repetition involves repeating words or phrases for emphasis. Musically, this translates to recurring motifs and themes.",
+        "musical_impact": "Generates melodic themes that repeat throughout the composition"
+    },
+    "metaphor_simile": {
+        "explanation": "Metaphors and similes create vivid imagery by comparing different things. This adds harmonic complexity and tonal color to the music.",
+        "musical_impact": "Introduces chord variations and modulations to different keys"
+    },
+    "imagery": {
+        "explanation": "Vivid imagery appeals to the senses and creates atmosphere. This influences instrumentation choices and dynamic expression.",
+        "musical_impact": "Determines instrument selection and volume changes throughout the piece"
+    },
+    "assonance": {
+        "explanation": "Assonance is the repetition of vowel sounds within words. This creates melodic flow and smooth transitions.",
+        "musical_impact": "Produces legato passages and flowing melodic lines"
+    },
+}
+
+# Literary device lookup tables, used by _detect_literary_devices
+ALLITERATION_MIN_WORDS = 2  # content words of a line sharing an initial consonant
+ASSONANCE_MIN_WORDS = 3  # content words of a line sharing a stressed vowel sound
+IMAGERY_MIN_WORDS = 2  # different sensory words in the poem
+SPELLING_VOWEL_PATTERN = re.compile(r'[aeiouy]+(?=[^aeiouy]*$)')
+
+REPETITION_STOP_WORDS = frozenset("""
+the a an and or but in on at to for of with by is are was were be been have has had
+do does did will would could should may might can shall must
+""".split())
+
+SENSORY_WORDS = (
+    # Visual
+    'bright', 'dark', 'colorful', 'shining', 'gleaming', 'shadowy', 'vivid', 'pale', 'golden', 'silver',
+    # Auditory
+    'whisper', 'roar', 'silence', 'echo', 'musical', 'harmony', 'thunder', 'gentle', 'loud', 'quiet',
+    # Tactile
+    'rough', 'smooth', 'soft', 'hard', 'warm', 'cold', 'sharp', 'tender', 'harsh',
+    # Emotional/Atmospheric
+    'peaceful', 'stormy', 'serene', 'turbulent', 'mysterious', 'ethereal', 'haunting', 'joyful',
+)
+
+
+def _inflections(word):
+    """Common inflected and derived forms of a sensory word ("dark" -> "darker", "darkness", ...)"""
+    stem = word[:-1] if word.endswith('e') else word
+    forms = {word, word + 's', word + 'es', word + 'ly', word + 'ness', word + 'ed',
+             stem + 'er', stem + 'est', stem + 'ed', stem + 'ing'}
+    if word.endswith('le'):
+        forms.add(word[:-1] + 'y')  # gentle -> gently
+    if word.endswith('y'):
+        forms.update({word[:-1] + 'ies', word[:-1] + 'ier', word[:-1] + 'iest', word[:-1] + 'ily'})
+    return forms
+
+
+# Every form maps to its base word, so each token needs a single dict lookup
+SENSORY_FORMS = {form: word for word in SENSORY_WORDS for form in _inflections(word)}
+del SENSORY_FORMS['hardly']  # "barely", not a texture
+
+COMPARISON_DETERMINERS = frozenset("a an the my your his her its our their this that some every".split())
+METAPHOR_VERBS = frozenset("is are was were becomes become became transforms transformed".split())
+RESEMBLANCE_WORDS = frozenset("resembles resemble resembled resembling".split())
+EXISTENTIAL_SUBJECTS = frozenset("there here it this that what who which".split())
+COMPARISON_STARTS = frozenset({'like', 'as', 'similar'}) | RESEMBLANCE_WORDS | METAPHOR_VERBS
+
+# Metrical feet as stress templates: 'x' unstressed, '/' stressed
+METER_TEMPLATES = {
+    "iambic": "x/",
+    "trochaic": "/x",
+    "anapestic": "xx/",
+    "dactylic": "/xx",
+}
+METER_THRESHOLD = 0.75  # mean per-syllable score needed to call a meter
+METER_AGREEMENT = 0.6  # share of lines that must fit the meter best
+STRESS_CACHE_SIZE = int(os.environ.get('STRESS_CACHE_SIZE', 50000))
+STREAM_WORD_CACHE_SIZE = 50000  # distinct words kept while streaming before the lookup cache is reset
+
+# Monosyllables that usually fall on an unstressed beat
+FUNCTION_WORDS = frozenset("""
+a an the and but or nor for so yet as at by in of off on to up with from into onto upon
+i me my we us our you your he him his she her it its they them their this that these those
+thee thou thy thine ye
+who whom whose which what is am are was were be been has had have do does did can could
+shall should will would may might must not no than then there when where while if
+""".split())
+
+# Per-syllable score of a stress mark against a template position.
+# 'f' is a monosyllabic function word and 'c' any other monosyllable: both can take
+# either beat, but lean unstressed and stressed respectively.
+_STRESS_SCORES = {
+    ('x', 'x'): 1.0, ('x', '/'): 0.0, ('x', 'f'): 1.0, ('x', 'c'): 0.5, ('x', '?'): 0.5,
+    ('/', 'x'): 0.0, ('/', '/'): 1.0, ('/', 'f'): 0.5, ('/', 'c'): 1.0, ('/', '?'): 0.5,
+}
+
+
+@lru_cache(maxsize=STRESS_CACHE_SIZE)
+def word_stress_pattern(text, stress, syllables):
+    """
+    Metrical stress marks for one word, one character per syllable
+    CMU primary and secondary stress become '/', unstressed 'x'; monosyllables become
+    'f' (function word) or 'c', and words missing from the index '?'.
+    """
+    if syllables == 1:
+        return 'f' if text in FUNCTION_WORDS else 'c'
+    if stress and len(stress) == syllables:
+        return ''.join('x' if digit == '0' else '/' for digit in stress)
+    return '?' * syllables
+
+
+class ParsedWord:
+    """A word token with its pronunciation data, looked up once per poem"""
+    __slots__ = ("text", "syllables", "stress", "rhyme", "sentiment")
+
+    def __init__(self, text, syllables, stress=None, rhyme=None, sentiment=None):
+        self.text = text
+        self.syllables = syllables
+        self.stress = stress  # CMU stress digits, e.g. "01"; None if unknown
+        self.rhyme = rhyme  # CMU phonemes from the last stressed vowel on; None if unknown
+        self.sentiment = sentiment  # row in the sentiment lexicon; None in textblob mode
+
+
+class ParsedLine:
+    """A non-empty line of the poem and its word tokens"""
+    __slots__ = ("text", "words", "syllables", "stanza")
+
+    def __init__(self, text, words, stanza=0):
+        self.text = text
+        self.words = words
+        self.syllables = sum(word.syllables for word in words)
+        self.stanza = stanza  # index of the blank-line separated stanza this line belongs to
+
+
+class ParsedPoem:
+    """Poem tokenized once into lines and words, shared by every detector"""
+    __slots__ = ("text", "text_lower", "lines", "words")
+
+    def __init__(self, text, lines):
+        self.text = text
+        self.text_lower = text.lower()
+        self.lines = lines
+        self.words = [word for line in lines for word in line.words]
+
+    @property
+    def syllable_counts(self):
+        return [line.syllables for line in self.lines]
+
+    @property
+    def stanza_lengths(self):
+        """Number of lines in each stanza, in order"""
+        lengths = []
+        previous = None
+        for line in self.lines:
+            if line.stanza == previous:
+                lengths[-1] += 1
+            else:
+                lengths.append(1)
+                previous = line.stanza
+        return lengths
 
 class PoetryAnalyzer:
-    def __init__(self):
-        self.cmudict = None
-        try:
-            from nltk.corpus import cmudict
-            self.cmudict = cmudict.dict()
-        except:
-            logging.warning("CMU Pronouncing Dictionary not available. Syllable counting will be approximate.")
+    def __init__(self, pronunciation_index=None, sentiment=DEFAULT_SENTIMENT_ENGINE, sentiment_lexicon=None):
+        if sentiment not in SENTIMENT_ENGINES:
+            raise ValueError(f"Unknown sentiment engine: {sentiment}")
+        self.sentiment_engine = sentiment
+        self._pronunciations = pronunciation_index
+        self._pronunciations_loaded = pronunciation_index is not None
+        self._sentiment_lexicon = sentiment_lexicon
+        self._sentiment_lexicon_loaded = sentiment_lexicon is not None or sentiment != 'lexicon'
+    
+    @property
+    def pronunciations(self):
+        """Memory-mapped index generated from cmudict (see pronunciation_index.py), opened on first use"""
+        if not self._pronunciations_loaded:
+            with _load_lock:
+                if not self._pronunciations_loaded:
+                    self._pronunciations = load_pronunciations()
+                    self._pronunciations_loaded = True
+        return self._pronunciations
+    
+    @property
+    def sentiment_lexicon(self):
+        """Compiled sentiment lexicon (see sentiment_lexicon.py), opened on first use; None in textblob mode"""
+        if not self._sentiment_lexicon_loaded:
+            with _load_lock:
+                if not self._sentiment_lexicon_loaded:
+                    self._sentiment_lexicon = load_lexicon()
+                    self._sentiment_lexicon_loaded = True
+        return self._sentiment_lexicon
     
     def analyze_poem(self, poem_text):
         """
@@ -40,57 +283,160 @@ class PoetryAnalyzer:
         if not poem_text.strip():
             return {"error": "Empty poem text provided"}
         
+        return self._analyze_parsed(self.parse_poem(poem_text))
+    
+    def analyze_poems(self, poem_texts):
+        """
+        analyze_poem for many poems, scoring the sentiment of all of them in one vectorized pass
+        Returns one analysis (or error) dict per poem, in order.
+        """
+        parsed_poems = [self.parse_poem(text) if text.strip() else None for text in poem_texts]
+        sentiments = iter(self._analyze_sentiment_batch([parsed for parsed in parsed_poems if parsed]))
+        return [self._analyze_parsed(parsed, next(sentiments)) if parsed else {"error": "Empty poem text provided"}
+                for parsed in parsed_poems]
+    
+    def _analyze_parsed(self, parsed, sentiment=None):
+        """Analysis dict for an already tokenized poem (or stanza), optionally with its sentiment precomputed"""
+        syllable_counts = parsed.syllable_counts
+        # One rhyme stage: labelling the lines, then naming and spelling out the scheme
+        with timed('analyze.rhyme'):
+            rhyme_labels = self._rhyme_labels(parsed)
+            rhyme_scheme = self._detect_rhyme_scheme(rhyme_labels)
+            rhyme_pattern = self._rhyme_pattern(parsed, rhyme_labels)
+        
         analysis = {
-            "lines": self._get_lines(poem_text),
-            "syllable_counts": [],
-            "total_syllables": 0,
-            "line_count": 0,
-            "sentiment": self._analyze_sentiment(poem_text),
-            "meter": self._detect_meter(poem_text),
-            "rhyme_scheme": self._detect_rhyme_scheme(poem_text),
-            "literary_devices": self._detect_literary_devices(poem_text),
+            "lines": [line.text for line in parsed.lines],
+            "syllable_counts": syllable_counts,
+            "total_syllables": sum(syllable_counts),
+            "line_count": len(parsed.lines),
+            "stanza_lengths": parsed.stanza_lengths,
+            "sentiment": sentiment or self._analyze_sentiment(parsed),
+            "meter": self._detect_meter(parsed),
+            "rhyme_scheme": rhyme_scheme,
+            "rhyme_pattern": rhyme_pattern,
+            "literary_devices": self._detect_literary_devices(parsed),
             "tempo_suggestion": 120,
             "key_suggestion": "C",
             "time_signature": "4/4"
         }
         
-        lines = analysis["lines"]
-        analysis["line_count"] = len(lines)
-        
-        # Analyze each line
-        for line in lines:
-            syllables = self._count_syllables(line)
-            analysis["syllable_counts"].append(syllables)
-            analysis["total_syllables"] += syllables
-        
         # Generate musical suggestions based on analysis
         analysis.update(self._generate_musical_suggestions(analysis))
         
         return analysis
     
-    def _get_lines(self, text):
-        """Split text into lines and clean them"""
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        return lines
+    @timed('analyze.parse')
+    def parse_poem(self, poem_text):
+        """Tokenize the poem into lines and words, looking up each distinct word once"""
+        word_cache = {}
+        lines = []
+        stanza = 0
+        for raw_line in poem_text.split('\n'):
+            text = raw_line.strip()
+            if not text:
+                if lines and lines[-1].stanza == stanza:
+                    stanza += 1
+                continue
+            lines.append(self._parse_line(text, stanza, word_cache))
+        return ParsedPoem(poem_text, lines)
     
-    def _count_syllables(self, word):
-        """Count syllables in a word using CMU dict or fallback method"""
-        if not word:
-            return 0
+    def _parse_line(self, text, stanza, word_cache):
+        words = []
+        for token in WORD_PATTERN.findall(text.lower().replace('\u2019', "'")):
+            word = word_cache.get(token)
+            if word is None:
+                word = word_cache[token] = self._parse_word(token)
+            words.append(word)
+        return ParsedLine(text, words, stanza)
+    
+    def iter_stanzas(self, lines):
+        """
+        Parse an iterable of text lines (a file, a request stream) into one ParsedPoem per stanza
+        Only the current stanza is held in memory; word lookups are shared across the stream.
+        """
+        word_cache = {}
+        stanza_lines = []
+        stanza = 0
+        for raw_line in lines:
+            text = raw_line.strip()
+            if text:
+                stanza_lines.append(self._parse_line(text, stanza, word_cache))
+                continue
+            if stanza_lines:
+                yield ParsedPoem('\n'.join(line.text for line in stanza_lines), stanza_lines)
+                stanza_lines = []
+                stanza += 1
+            if len(word_cache) > STREAM_WORD_CACHE_SIZE:
+                word_cache.clear()
+        if stanza_lines:
+            yield ParsedPoem('\n'.join(line.text for line in stanza_lines), stanza_lines)
+    
+    def analyze_stream(self, lines):
+        """
+        Analyze a poem of any length stanza by stanza
+        Yields one analysis dict per stanza (the analyze_poem fields for that stanza plus
+        "stanza" and "first_line"), then a final {"summary": ...} dict with the whole-poem
+        totals, mood, dominant meter and musical suggestions.
+        """
+        line_count = 0
+        total_syllables = 0
+        polarity = 0.0
+        subjectivity = 0.0
+        meters = Counter()
+        stanza_arc = []
+        stanza = -1
+        for stanza, parsed in enumerate(self.iter_stanzas(lines)):
+            analysis = self._analyze_parsed(parsed)
+            analysis["stanza"] = stanza
+            analysis["first_line"] = line_count
+            
+            weight = analysis["line_count"]
+            line_count += weight
+            total_syllables += analysis["total_syllables"]
+            polarity += analysis["sentiment"]["polarity"] * weight
+            subjectivity += analysis["sentiment"]["subjectivity"] * weight
+            stanza_arc.append(round(analysis["sentiment"]["polarity"], 3))
+            meters[analysis["meter"]] += weight
+            yield analysis
+        
+        if not line_count:
+            yield {"summary": {"error": "Empty poem text provided"}}
+            return
         
-        # Clean the word
-        word = re.sub(r'[^a-zA-Z]', '', word.lower())
+        polarity /= line_count
+        summary = {
+            "line_count": line_count,
+            "stanza_count": stanza + 1,
+            "total_syllables": total_syllables,
+            "sentiment": {
+                "polarity": polarity,
+                "subjectivity": subjectivity / line_count,
+                "mood": self._mood(polarity),
+                "stanza_arc": stanza_arc
+            },
+            "meter": meters.most_common(1)[0][0],
+        }
+        summary.update(self._generate_musical_suggestions(summary))
+        yield {"summary": summary}
+    
+    def _parse_word(self, token):
+        """Build a ParsedWord using the pronunciation index or the fallback syllable counter"""
+        lexicon = self.sentiment_lexicon
+        sentiment = lexicon.code(token) if lexicon else None
+        word = re.sub(r'[^a-z]', '', token)
         if not word:
-            return 0
+            return ParsedWord(token, 0, sentiment=sentiment)
         
-        if self.cmudict and word in self.cmudict:
-            # Use CMU dictionary for accurate syllable count
-            pronunciations = self.cmudict[word]
-            if pronunciations:
-                return len([phone for phone in pronunciations[0] if phone[-1].isdigit()])
+        pronunciations = self.pronunciations
+        if pronunciations:
+            # Use the CMU-derived index for accurate syllable count and stress
+            entry = pronunciations.lookup(word)
+            if entry:
+                syllables, stress, rhyme = entry
+                return ParsedWord(token, syllables, stress, rhyme, sentiment)
         
         # Fallback syllable counting method
-        return self._fallback_syllable_count(word)
+        return ParsedWord(token, self._fallback_syllable_count(word), sentiment=sentiment)
     
     def _fallback_syllable_count(self, word):
         """Fallback method for syllable counting"""
@@ -111,191 +457,312 @@ class PoetryAnalyzer:
         
         return max(1, syllables)
     
-    def _analyze_sentiment(self, text):
-        """Analyze sentiment using TextBlob"""
+    def _analyze_sentiment(self, parsed):
+        """
+        Polarity, subjectivity and mood of the poem, plus its sentiment arc:
+        the polarity of every line ("arc") and of every stanza ("stanza_arc")
+        """
+        return self._analyze_sentiment_batch([parsed])[0]
+    
+    @timed('analyze.sentiment')
+    def _analyze_sentiment_batch(self, parsed_poems):
+        """_analyze_sentiment for several poems; the lexicon scores all their lines in one pass"""
         try:
-            blob = TextBlob(text)
-            sentiment = blob.sentiment
-            polarity = float(sentiment.polarity)
-            subjectivity = float(sentiment.subjectivity)
-            
-            if polarity > 0.1:
-                mood = "positive"
-            elif polarity < -0.1:
-                mood = "negative"
-            else:
-                mood = "neutral"
-            
-            return {
-                "polarity": polarity,
-                "subjectivity": subjectivity,
-                "mood": mood
-            }
+            lexicon = self.sentiment_lexicon
+            if lexicon is None:
+                return [self._textblob_sentiment(parsed) for parsed in parsed_poems]
+            scores = lexicon.score_batch([
+                ([word.sentiment for word in parsed.words], [len(line.words) for line in parsed.lines])
+                for parsed in parsed_poems
+            ])
+            return [self._sentiment_from_sums(parsed, *sums) for parsed, sums in zip(parsed_poems, scores)]
         except Exception as e:
             logging.warning(f"Sentiment analysis failed: {e}")
-            return {
-                "polarity": 0.0,
-                "subjectivity": 0.5,
-                "mood": "neutral"
-            }
+            return [self._neutral_sentiment(parsed) for parsed in parsed_poems]
+    
+    def _sentiment_from_sums(self, parsed, polarity_sum, subjectivity_sum, count):
+        """Sentiment dict from per-line lexicon sums; every scored word weighs the same, as in TextBlob"""
+        total = count.sum()
+        polarity = float(polarity_sum.sum() / total) if total else 0.0
+        stanza = np.repeat(np.arange(len(parsed.stanza_lengths)), parsed.stanza_lengths)
+        stanza_count = np.bincount(stanza, weights=count)
+        stanza_polarity = np.bincount(stanza, weights=polarity_sum) / np.maximum(stanza_count, 1)
+        return {
+            "polarity": polarity,
+            "subjectivity": float(subjectivity_sum.sum() / total) if total else 0.0,
+            "mood": self._mood(polarity),
+            "arc": np.round(polarity_sum / np.maximum(count, 1), 3).tolist(),
+            "stanza_arc": np.round(stanza_polarity, 3).tolist(),
+        }
+    
+    def _textblob_sentiment(self, parsed):
+        """Sentiment dict from TextBlob run over the whole poem, each stanza and each line"""
+        from textblob import TextBlob
+        sentiment = TextBlob(parsed.text).sentiment
+        polarity = float(sentiment.polarity)
+        stanzas = []
+        first = 0
+        for length in parsed.stanza_lengths:
+            stanzas.append('\n'.join(line.text for line in parsed.lines[first:first + length]))
+            first += length
+        return {
+            "polarity": polarity,
+            "subjectivity": float(sentiment.subjectivity),
+            "mood": self._mood(polarity),
+            "arc": [round(TextBlob(line.text).sentiment.polarity, 3) for line in parsed.lines],
+            "stanza_arc": [round(TextBlob(text).sentiment.polarity, 3) for text in stanzas],
+        }
+    
+    def _neutral_sentiment(self, parsed):
+        return {
+            "polarity": 0.0,
+            "subjectivity": 0.5,
+            "mood": "neutral",
+            "arc": [0.0] * len(parsed.lines),
+            "stanza_arc": [0.0] * len(parsed.stanza_lengths),
+        }
+    
+    def _mood(self, polarity):
+        if polarity > 0.1:
+            return "positive"
+        elif polarity < -0.1:
+            return "negative"
+        return "neutral"
     
-    def _detect_meter(self, text):
-        """Basic meter detection based on syllable patterns"""
-        lines = self._get_lines(text)
-        if not lines:
+    @timed('analyze.meter')
+    def _detect_meter(self, parsed):
+        """Score each line's stress pattern against the metrical feet and pick the best fit"""
+        if not parsed.lines:
             return "free_verse"
         
-        syllable_counts = [self._count_syllables_in_line(line) for line in lines]
+        totals = dict.fromkeys(METER_TEMPLATES, 0.0)
+        best_lines = dict.fromkeys(METER_TEMPLATES, 0)
+        syllable_total = 0
+        for line in parsed.lines:
+            pattern = ''.join(word_stress_pattern(word.text, word.stress, word.syllables) for word in line.words)
+            scores = self._score_stress_line(pattern)
+            best = max(scores.values())
+            for meter, score in scores.items():
+                totals[meter] += score
+                best_lines[meter] += score == best
+            syllable_total += len(pattern)
         
-        # Check for common patterns
-        if len(set(syllable_counts)) == 1:
+        if syllable_total:
+            meter = max(totals, key=totals.get)  # ties keep template order
+            if totals[meter] / syllable_total >= METER_THRESHOLD \
+                    and best_lines[meter] >= METER_AGREEMENT * len(parsed.lines):
+                return meter
+        
+        # No dominant foot: fall back to the line lengths
+        if len(set(parsed.syllable_counts)) == 1:
             return "regular"
-        elif self._is_iambic_pattern(lines):
-            return "iambic"
-        elif self._is_trochaic_pattern(lines):
-            return "trochaic"
-        else:
-            return "free_verse"
+        return "free_verse"
     
-    def _count_syllables_in_line(self, line):
-        """Count total syllables in a line"""
-        words = re.findall(r'\b\w+\b', line.lower())
-        return sum(self._count_syllables(word) for word in words)
+    def _score_stress_line(self, pattern):
+        """
+        Summed per-syllable scores of a line against every meter template, in one pass over the line
+        Anapestic lines may drop their first syllable (headless), so both alignments are tried.
+        """
+        alignments = {meter: [template] for meter, template in METER_TEMPLATES.items()}
+        alignments["anapestic"].append(METER_TEMPLATES["anapestic"][1:] + METER_TEMPLATES["anapestic"][:1])
+        scores = {meter: [0.0] * len(templates) for meter, templates in alignments.items()}
+        for position, mark in enumerate(pattern):
+            for meter, templates in alignments.items():
+                meter_scores = scores[meter]
+                for i, template in enumerate(templates):
+                    meter_scores[i] += _STRESS_SCORES[template[position % len(template)], mark]
+        return {meter: max(meter_scores) for meter, meter_scores in scores.items()}
     
-    def _is_iambic_pattern(self, lines):
-        """Simple iambic pattern detection"""
-        # This is a simplified check - real iambic detection would need stress analysis
-        syllable_counts = [self._count_syllables_in_line(line) for line in lines]
-        # Iambic pentameter has 10 syllables, iambic tetrameter has 8
-        common_counts = [8, 10, 12]
-        return any(count in common_counts for count in syllable_counts)
+    def _rhyme_labels(self, parsed):
+        """
+        Label every line with a letter by the rhyme key of its end word, in one pass
+        Lines whose end words share a key get the same letter, in order of first appearance.
+        """
+        letters = {}
+        labels = []
+        for line in parsed.lines:
+            key = self._rhyme_key(line.words[-1]) if line.words else None
+            if key is None:
+                key = ('line', len(labels))  # no word to rhyme on: a label of its own
+            label = letters.get(key)
+            if label is None:
+                label = letters[key] = self._scheme_letter(len(letters))
+            labels.append(label)
+        return labels
     
-    def _is_trochaic_pattern(self, lines):
-        """Simple trochaic pattern detection"""
-        # Similar to iambic but typically shorter lines
-        syllable_counts = [self._count_syllables_in_line(line) for line in lines]
-        common_counts = [7, 8, 9]
-        return any(count in common_counts for count in syllable_counts)
+    def _rhyme_key(self, word):
+        """Phonemes from the last stressed vowel on, or the spelling from the last vowel group for unknown words"""
+        if word.rhyme:
+            return tuple(phone.rstrip('012') for phone in word.rhyme)
+        match = SPELLING_RHYME_PATTERN.search(word.text)
+        return ('spelling', match.group(0) if match else word.text)
     
-    def _detect_rhyme_scheme(self, text):
-        """Basic rhyme scheme detection"""
-        lines = self._get_lines(text)
-        if len(lines) < 2:
+    def _scheme_letter(self, index):
+        """A, B, ... Z, then A2, B2, ... for poems with more than 26 rhymes"""
+        letter = chr(ord('A') + index % 26)
+        return letter if index < 26 else f"{letter}{index // 26 + 1}"
+    
+    def _rhyme_pattern(self, parsed, labels):
+        """Full scheme string with stanzas separated by spaces, e.g. ABBA CDDC EFG EFG"""
+        stanzas = []
+        for line, label in zip(parsed.lines, labels):
+            if not stanzas or line.stanza != stanzas[-1][0]:
+                stanzas.append((line.stanza, []))
+            stanzas[-1][1].append(label)
+        return ' '.join(''.join(stanza_labels) for _, stanza_labels in stanzas)
+    
+    def _detect_rhyme_scheme(self, labels):
+        """Name the rhyme scheme by matching the line labels against known forms and repeating quatrains"""
+        count = len(labels)
+        if count < 2:
             return "none"
+        if count >= 3 and len(set(labels)) == 1:
+            return "monorhyme"
+        
+        if count == 14:
+            if self._normalized_scheme(labels[:12]) == "ABABCDCDEFEF" and labels[12] == labels[13] \
+                    and labels[12] not in labels[:12]:
+                return "Shakespearean sonnet"
+            if self._normalized_scheme(labels[:8]) == "ABBAABBA" and not set(labels[8:]) & set(labels[:8]):
+                return "Petrarchan sonnet"
         
-        # Get last word of each line
-        end_words = []
-        for line in lines:
-            words = re.findall(r'\b\w+\b', line.lower())
-            if words:
-                end_words.append(words[-1])
+        if count >= 6 and self._is_terza_rima(labels):
+            return "terza rima"
         
-        # Simple rhyme detection based on ending sounds
-        if len(end_words) >= 4:
-            if self._words_rhyme(end_words[0], end_words[2]) and self._words_rhyme(end_words[1], end_words[3]):
-                return "ABAB"
-            elif self._words_rhyme(end_words[0], end_words[1]) and self._words_rhyme(end_words[2], end_words[3]):
-                return "AABB"
+        if count % 2 == 0 and all(labels[i] == labels[i + 1] for i in range(0, count, 2)) \
+                and len(set(labels)) > 1:
+            return "AABB"
+        
+        if count >= 4:
+            patterns = {self._normalized_scheme(labels[i:i + 4]) for i in range(0, count - count % 4, 4)}
+            if len(patterns) == 1:
+                pattern = patterns.pop()
+                if pattern in ("ABAB", "AABB", "ABBA", "ABCB", "AABA"):
+                    return pattern
         
         return "free"
     
-    def _words_rhyme(self, word1, word2):
-        """Simple rhyme detection based on ending sounds"""
-        if len(word1) < 2 or len(word2) < 2:
+    def _normalized_scheme(self, labels):
+        """Relabel a run of lines so its first rhyme is A, e.g. CDCD -> ABAB"""
+        letters = {}
+        return ''.join(letters.setdefault(label, chr(ord('A') + len(letters))) for label in labels)
+    
+    def _is_terza_rima(self, labels):
+        """Interlocking tercets (ABA BCB CDC ...), optionally closed by a line or couplet on the last middle rhyme"""
+        tercets = len(labels) // 3
+        if tercets < 2:
             return False
-        return word1[-2:] == word2[-2:] or word1[-3:] == word2[-3:]
+        middle = None
+        for t in range(tercets):
+            first, next_middle, last = labels[3 * t:3 * t + 3]
+            if first != last or next_middle == first or (middle is not None and first != middle):
+                return False
+            middle = next_middle
+        return all(label == middle for label in labels[tercets * 3:])
     
-    def _detect_literary_devices(self, text):
-        """Detect basic literary devices with explanations"""
-        devices = {
-            "alliteration": {
-                "detected": self._detect_alliteration(text),
-                "explanation": "Alliteration is the repetition of consonant sounds at the beginning of words. In music, this creates rhythmic emphasis through repeated notes or accents.",
-                "musical_impact": "Creates syncopated rhythms and emphasizes certain beats"
-            },
-            "repetition": {
-                "detected": self._detect_repetition(text),
-                "explanation": "Repetition involves repeating words or phrases for emphasis. Musically, this translates to recurring motifs and themes.",
-                "musical_impact": "Generates melodic themes that repeat throughout the composition"
-            },
-            "metaphor_simile": {
-                "detected": self._detect_metaphor_simile(text),
-                "explanation": "Metaphors and similes create vivid imagery by comparing different things. This adds harmonic complexity and tonal color to the music.",
-                "musical_impact": "Introduces chord variations and modulations to different keys"
-            },
-            "imagery": {
-                "detected": self._detect_imagery(text),
-                "explanation": "Vivid imagery appeals to the senses and creates atmosphere. This influences instrumentation choices and dynamic expression.",
-                "musical_impact": "Determines instrument selection and volume changes throughout the piece"
-            },
-            "assonance": {
-                "detected": self._detect_assonance(text),
-                "explanation": "Assonance is the repetition of vowel sounds within words. This creates melodic flow and smooth transitions.",
-                "musical_impact": "Produces legato passages and flowing melodic lines"
-            }
-        }
+    @timed('analyze.literary_devices')
+    def _detect_literary_devices(self, parsed):
+        """
+        Find every literary device in one pass over the shared tokens
+        Each result has "count" occurrences, the "lines" they are on and their "positions"
+        as [line, word, syllable, group] (word and first-syllable index within the line,
+        group indexing "words", the repeated word, shared letter or sound, sensory word or
+        comparison that matched), plus the device explanation.
+        """
+        found = {name: [] for name in LITERARY_DEVICE_INFO}
+        repeated = {}
+        features = {}
+        for line_index, line in enumerate(parsed.lines):
+            words = line.words
+            openings = {}
+            vowels = {}
+            syllable = 0
+            for word_index, word in enumerate(words):
+                position = (line_index, word_index, syllable)
+                syllable += word.syllables
+                feature = features.get(word.text)
+                if feature is None:
+                    feature = features[word.text] = self._device_features(word)
+                opening, vowel, sensory, repeatable, comparable = feature
+                if opening:
+                    openings.setdefault(opening, []).append(position)
+                if vowel:
+                    vowels.setdefault(vowel, []).append(position)
+                if sensory:
+                    found["imagery"].append((position, sensory))
+                if repeatable:
+                    repeated.setdefault(word.text, []).append(position)
+                if comparable:
+                    comparison = self._comparison_at(words, word_index)
+                    if comparison:
+                        found["metaphor_simile"].append((position, comparison))
+            found["alliteration"].extend((position, letter) for letter, positions in openings.items()
+                                         if len(positions) >= ALLITERATION_MIN_WORDS for position in positions)
+            found["assonance"].extend((position, sound) for sound, positions in vowels.items()
+                                      if len(positions) >= ASSONANCE_MIN_WORDS for position in positions)
+        found["repetition"] = [(position, text) for text, positions in repeated.items()
+                               if len(positions) > 1 for position in positions]
+        
+        devices = {name: self._device_result(name, matches) for name, matches in found.items()}
+        # Imagery needs at least two different sensory words
+        if len(devices["imagery"]["words"]) < IMAGERY_MIN_WORDS:
+            devices["imagery"]["detected"] = False
         return devices
     
-    def _detect_alliteration(self, text):
-        """Detect alliteration"""
-        words = re.findall(r'\b\w+\b', text.lower())
-        first_letters = [word[0] for word in words if word]
-        letter_counts = Counter(first_letters)
-        # If any letter appears 3+ times, consider it alliteration
-        return any(count >= 3 for count in letter_counts.values())
-    
-    def _detect_repetition(self, text):
-        """Detect word repetition"""
-        words = re.findall(r'\b\w+\b', text.lower())
-        word_counts = Counter(words)
-        # Exclude common words
-        common_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'can', 'shall', 'must'}
-        significant_repeats = {word: count for word, count in word_counts.items() 
-                             if count > 1 and word not in common_words and len(word) > 2}
-        return len(significant_repeats) > 0
-    
-    def _detect_metaphor_simile(self, text):
-        """Detect metaphors and similes"""
-        text_lower = text.lower()
-        simile_indicators = ['like', 'as', 'similar to', 'resembles']
-        metaphor_indicators = ['is', 'are', 'was', 'were', 'becomes', 'transforms']
-        
-        has_simile = any(indicator in text_lower for indicator in simile_indicators)
-        has_metaphor = any(indicator in text_lower for indicator in metaphor_indicators)
-        
-        return has_simile or has_metaphor
+    def _device_features(self, word):
+        """
+        (alliteration letter, assonance sound, sensory word, repeatable, may start a comparison)
+        of a distinct word, worked out once per poem
+        """
+        text = word.text
+        content = text not in FUNCTION_WORDS and text.isalpha()
+        opening = text[0] if content and text[0] not in 'aeiou' else None
+        vowel = None
+        if content:
+            if word.rhyme:
+                vowel = word.rhyme[0].rstrip('012')  # stressed vowel sound
+            else:
+                match = SPELLING_VOWEL_PATTERN.search(text)
+                vowel = match.group(0) if match else None
+        repeatable = len(text) > 2 and text not in REPETITION_STOP_WORDS
+        return opening, vowel, SENSORY_FORMS.get(text), repeatable, text in COMPARISON_STARTS
     
-    def _detect_imagery(self, text):
-        """Detect vivid imagery and sensory language"""
-        text_lower = text.lower()
-        sensory_words = [
-            # Visual
-            'bright', 'dark', 'colorful', 'shining', 'gleaming', 'shadowy', 'vivid', 'pale', 'golden', 'silver',
-            # Auditory
-            'whisper', 'roar', 'silence', 'echo', 'musical', 'harmony', 'thunder', 'gentle', 'loud', 'quiet',
-            # Tactile
-            'rough', 'smooth', 'soft', 'hard', 'warm', 'cold', 'gentle', 'sharp', 'tender', 'harsh',
-            # Emotional/Atmospheric
-            'peaceful', 'stormy', 'serene', 'turbulent', 'mysterious', 'ethereal', 'haunting', 'joyful'
-        ]
-        
-        imagery_count = sum(1 for word in sensory_words if word in text_lower)
-        return imagery_count >= 2  # At least 2 sensory words
+    def _comparison_at(self, words, index):
+        """The simile or metaphor marker starting at words[index] ("like", "as ... as", "is" + article...), or None"""
+        text = words[index].text
+        following = words[index + 1].text if index + 1 < len(words) else None
+        if text == 'like' and following in COMPARISON_DETERMINERS:
+            return 'like'
+        if text == 'as':
+            if following in ('if', 'though'):
+                return f'as {following}'
+            if index + 2 < len(words) and words[index + 2].text == 'as':
+                return 'as ... as'
+        if text == 'similar' and following == 'to':
+            return 'similar to'
+        if text in RESEMBLANCE_WORDS:
+            return text
+        if text in METAPHOR_VERBS and (following in COMPARISON_DETERMINERS or following == 'into'):
+            # "there is a ..." and "it was the ..." state existence, not identity
+            if index == 0 or words[index - 1].text not in EXISTENTIAL_SUBJECTS:
+                return text
+        return None
     
-    def _detect_assonance(self, text):
-        """Detect assonance (repetition of vowel sounds)"""
-        words = re.findall(r'\b\w+\b', text.lower())
-        vowel_patterns = {}
-        
-        for word in words:
-            if len(word) > 2:
-                vowels = ''.join([char for char in word if char in 'aeiou'])
-                if len(vowels) >= 2:
-                    vowel_patterns[vowels] = vowel_patterns.get(vowels, 0) + 1
-        
-        # Check if any vowel pattern appears multiple times
-        return any(count >= 2 for count in vowel_patterns.values())
+    def _device_result(self, name, matches):
+        """Device dict from (position, key) matches"""
+        groups = {}
+        positions = sorted((line, word, syllable, groups.setdefault(key, len(groups)))
+                           for (line, word, syllable), key in matches)
+        return {
+            "detected": bool(positions),
+            "count": len(positions),
+            "lines": sorted({position[0] for position in positions}),
+            "positions": [list(position) for position in positions],
+            "words": list(groups),
+            **LITERARY_DEVICE_INFO[name]
+        }
     
+    @timed('analyze.suggestions')
     def _generate_musical_suggestions(self, analysis):
         """Generate musical parameters based on analysis"""
         suggestions = {}
@@ -312,21 +779,21 @@ class PoetryAnalyzer:
         # Clamp tempo to reasonable range
         suggestions["tempo_suggestion"] = max(60, min(180, suggestions["tempo_suggestion"]))
         
-        # Key based on sentiment
-        if sentiment["mood"] == "positive":
-            suggestions["key_suggestion"] = "C"  # Major
-        elif sentiment["mood"] == "negative":
-            suggestions["key_suggestion"] = "Am"  # Minor
-        else:
-            suggestions["key_suggestion"] = "C"
+        # Key based on sentiment: mood picks major, minor or dorian, polarity and subjectivity the key signature
+        suggestions["key_suggestion"] = suggest_key(sentiment["mood"], sentiment["polarity"],
+                                                    sentiment.get("subjectivity", 0.5))
         
-        # Time signature based on meter
+        # Time signature based on meter: duple feet in duple time, triple feet in triple time
         meter = analysis["meter"]
-        if meter in ["iambic", "trochaic"]:
+        if meter == "iambic":
             suggestions["time_signature"] = "4/4"
-        elif meter == "free_verse":
-            suggestions["time_signature"] = "4/4"  # Default
+        elif meter == "trochaic":
+            suggestions["time_signature"] = "2/4"
+        elif meter == "anapestic":
+            suggestions["time_signature"] = "6/8"
+        elif meter == "dactylic":
+            suggestions["time_signature"] = "3/4"
         else:
-            suggestions["time_signature"] = "4/4"
+            suggestions["time_signature"] = "4/4"  # Default
         
         return suggestions
@@ -0,0 +1,182 @@
+import os
+import sys
+import mmap
+import struct
+import logging
+import argparse
+
+# Compact, sorted, memory-mapped pronunciation index built from the CMU
+# Pronouncing Dictionary. Every worker maps the same file read-only, so the
+# pages are shared through the OS page cache instead of each process
+# building its own 130k-entry dict.
+#
+# File layout (all integers little-endian):
+#   MAGIC | uint32 count | uint32 offsets[count] | records
+# Each record is b"word\tstress\trhyme\n" where stress is the CMU stress
+# digits (one per syllable) and rhyme is the phonemes from the last stressed
+# vowel onward. Records are sorted by word so lookups are a binary search.
+
+MAGIC = b'PHIDX01\n'
+HEADER = struct.Struct('<I')
+OFFSET = struct.Struct('<I')
+
+DEFAULT_INDEX_PATH = os.environ.get(
+    'PRONUNCIATION_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'pronunciation.idx')
+)
+
+
+def rhyme_tail(phones):
+    """Phonemes from the last stressed vowel to the end of the word"""
+    vowels = [i for i, phone in enumerate(phones) if phone[-1].isdigit()]
+    if not vowels:
+        return tuple(phones)
+    for stress in ('1', '2'):
+        stressed = [i for i in vowels if phones[i][-1] == stress]
+        if stressed:
+            return tuple(phones[stressed[-1]:])
+    return tuple(phones[vowels[-1]:])
+
+
+class PronunciationIndex:
+    """Read-only view over a pronunciation index file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as index_file:
+            self._mm = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"Not a pronunciation index: {path}")
+        self._count = HEADER.unpack_from(self._mm, len(MAGIC))[0]
+        self._offsets_start = len(MAGIC) + HEADER.size
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, word):
+        return self.lookup(word) is not None
+
+    def _record_offset(self, i):
+        return OFFSET.unpack_from(self._mm, self._offsets_start + i * OFFSET.size)[0]
+
+    def _word_at(self, offset):
+        return self._mm[offset:self._mm.find(b'\t', offset)]
+
+    def lookup(self, word):
+        """
+        Look up a lowercase word
+        Returns (syllables, stress, rhyme) or None if the word is not indexed
+        """
+        try:
+            key = word.encode('ascii')
+        except UnicodeEncodeError:
+            return None
+
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word_at(self._record_offset(mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._count:
+            return None
+
+        offset = self._record_offset(lo)
+        end = self._mm.find(b'\n', offset)
+        indexed_word, stress, rhyme = self._mm[offset:end].decode('ascii').split('\t')
+        if indexed_word != word:
+            return None
+        return len(stress), stress, tuple(rhyme.split(' ')) if rhyme else ()
+
+    def close(self):
+        self._mm.close()
+
+
+def build_index(entries, path):
+    """
+    Write an index file from (word, phones) pairs
+    Only the first pronunciation of each purely alphabetic word is kept.
+    Returns the number of indexed words.
+    """
+    records = {}
+    for word, phones in entries:
+        word = word.lower()
+        if word in records or not word.isascii() or not word.isalpha():
+            continue
+        stress = ''.join(phone[-1] for phone in phones if phone[-1].isdigit())
+        records[word] = f"{word}\t{stress}\t{' '.join(rhyme_tail(phones))}\n".encode('ascii')
+
+    words = sorted(records)
+    data_start = len(MAGIC) + HEADER.size + OFFSET.size * len(words)
+    offsets = []
+    position = data_start
+    for word in words:
+        offsets.append(position)
+        position += len(records[word])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Write to a temporary file and rename so concurrent workers never map a partial index
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(MAGIC)
+        index_file.write(HEADER.pack(len(words)))
+        index_file.write(b''.join(OFFSET.pack(offset) for offset in offsets))
+        for word in words:
+            index_file.write(records[word])
+    os.replace(tmp_path, path)
+    return len(words)
+
+
+def build_from_cmudict(path=DEFAULT_INDEX_PATH):
+    """Generate the index from NLTK's copy of the CMU Pronouncing Dictionary"""
+    from nltk.corpus import cmudict
+    count = build_index(cmudict.entries(), path)
+    logging.info(f"Built pronunciation index with {count} words: {path}")
+    return count
+
+
+def load_index(path=DEFAULT_INDEX_PATH, build_missing=True):
+    """
+    Open the pronunciation index, building it from cmudict first if it is missing
+    Returns None when neither the index nor cmudict is available.
+    """
+    if not os.path.exists(path) and build_missing:
+        try:
+            build_from_cmudict(path)
+        except Exception as e:
+            logging.warning(f"Could not build pronunciation index from cmudict: {e}")
+    try:
+        return PronunciationIndex(path)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Pronunciation index not available ({e}). Syllable counting will be approximate.")
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the pronunciation index")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="generate the index from cmudict")
+    build_parser.add_argument('--output', default=DEFAULT_INDEX_PATH)
+    lookup_parser = subparsers.add_parser('lookup', help="look up words in an existing index")
+    lookup_parser.add_argument('words', nargs='+')
+    lookup_parser.add_argument('--index', default=DEFAULT_INDEX_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build_from_cmudict(args.output)
+        print(f"Indexed {count} words into {args.output}")
+        return 0
+
+    index = load_index(args.index, build_missing=False)
+    if index is None:
+        return 1
+    for word in args.words:
+        print(word, index.lookup(word.lower()))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
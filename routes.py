@@ -1,110 +1,406 @@
+import io
 import os
 import json
+import time
 import logging
-from flask import render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import render_template, request, jsonify, send_file, flash, redirect, url_for, Response, stream_with_context, g
 from app import app, db
 from models import Composition
 from poetry_analyzer import PoetryAnalyzer
 from midi_generator import MIDIGenerator
+from composition_cache import CompositionCache, cache_key
+from job_queue import JobQueue
+from midi_store import MidiStore, content_digest, digest_from_filename, file_digest
+from audio_renderer import AudioRenderer, AudioBusy
+from warmup import WarmUp
+import batch
+from composition_search import search_compositions
+from concurrent.futures import TimeoutError as RenderTimeout
+from metrics import timed, collect_timings, timings_ms, render_prometheus, REQUEST_SECONDS
 
 # Initialize components
 analyzer = PoetryAnalyzer()
 midi_gen = MIDIGenerator()
+composition_cache = CompositionCache()
+midi_store = MidiStore()
+audio_renderer = AudioRenderer()
+
+# Content-addressed MIDI never changes, so clients may cache it for a year
+MIDI_MAX_AGE = 365 * 24 * 60 * 60
+
+# How long a play request waits for a render before asking the client to retry
+AUDIO_RENDER_TIMEOUT = float(os.environ.get('AUDIO_RENDER_TIMEOUT', 30))
+AUDIO_RETRY_AFTER = 5
 
 @app.route('/')
 def index():
     """Main page"""
-    recent_compositions = Composition.query.order_by(Composition.created_at.desc()).limit(5).all()
+    recent_compositions = Composition.summaries().order_by(Composition.created_at.desc()).limit(5).all()
     return render_template('index.html', recent_compositions=recent_compositions)
 
-@app.route('/analyze', methods=['POST'])
-def analyze_poem():
-    """Analyze poem and generate MIDI"""
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-        
-        poem_text = data.get('poem_text', '').strip()
-        title = data.get('title', 'Untitled Poem').strip()
-        selected_instruments = data.get('instruments', ['piano'])
-        
-        if not poem_text:
-            return jsonify({'error': 'Please provide poem text'}), 400
-        
-        if not title:
-            title = 'Untitled Poem'
-        
-        # Validate instruments
-        valid_instruments = ['piano', 'acoustic_guitar', 'electric_guitar', 'strings', 'violin', 'cello', 'flute', 'clarinet', 'drums']
-        instruments = [inst for inst in selected_instruments if inst in valid_instruments]
-        if not instruments:
-            instruments = ['piano']
-        
+VALID_INSTRUMENTS = ['piano', 'acoustic_guitar', 'electric_guitar', 'strings', 'violin', 'cello', 'flute', 'clarinet', 'drums']
+
+# Started per worker by gunicorn_config.py's post_worker_init, or by the first readiness probe
+warm_up = WarmUp(app, analyzer, midi_gen, VALID_INSTRUMENTS)
+
+class PoemAnalysisError(ValueError):
+    """The poem could not be analyzed"""
+
+def _parse_poem_request(data):
+    """Validate an /analyze payload; returns (params, error message)"""
+    poem_text = data.get('poem_text')
+    title = data.get('title')
+    selected_instruments = data.get('instruments')
+    seed = data.get('seed')
+    
+    # Missing and null fields take their defaults; anything else of the wrong type is rejected
+    if poem_text is not None and not isinstance(poem_text, str):
+        return None, 'Poem text must be a string'
+    if title is not None and not isinstance(title, str):
+        return None, 'Title must be a string'
+    if selected_instruments is not None and not isinstance(selected_instruments, list):
+        return None, 'Instruments must be a list'
+    
+    poem_text = (poem_text or '').strip()
+    title = (title or 'Untitled Poem').strip()
+    selected_instruments = selected_instruments if selected_instruments is not None else ['piano']
+    
+    if not poem_text:
+        return None, 'Please provide poem text'
+    
+    if not title:
+        title = 'Untitled Poem'
+    
+    # numpy's SeedSequence only takes non-negative integers
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+        return None, 'Seed must be a non-negative integer'
+    
+    return {'title': title, 'poem_text': poem_text, 'instruments': _valid_instruments(selected_instruments), 'seed': seed}, None
+
+def _valid_instruments(selected_instruments):
+    """Drop unknown instruments, defaulting to piano"""
+    instruments = [inst for inst in selected_instruments if isinstance(inst, str) and inst in VALID_INSTRUMENTS]
+    return instruments or ['piano']
+
+def create_composition(title, poem_text, instruments, seed=None):
+    """Analyze a poem, render its MIDI and persist the composition; returns (composition, analysis)"""
+    # Repeated poems skip analysis and rendering entirely
+    key = cache_key(poem_text, instruments, seed)
+    with timed('cache.lookup'):
+        cached = composition_cache.get(key)
+    
+    if cached:
+        logging.info(f"Cache hit for poem: {title}")
+        analysis, midi_data = cached
+    else:
         logging.info(f"Analyzing poem: {title}")
         
         # Analyze the poem
-        analysis = analyzer.analyze_poem(poem_text)
+        with timed('analyze.total'):
+            analysis = analyzer.analyze_poem(poem_text)
         
         if 'error' in analysis:
-            return jsonify({'error': analysis['error']}), 400
+            raise PoemAnalysisError(analysis['error'])
         
         logging.info(f"Analysis completed. Generating MIDI with instruments: {instruments}")
         
         # Generate MIDI
-        midi_filename = midi_gen.generate_composition(
-            analysis, 
-            title=title, 
-            instruments=instruments
-        )
-        
-        # Save to database
-        composition = Composition(
-            title=title,
-            poem_text=poem_text,
-            midi_filename=midi_filename,
-            analysis_data=json.dumps(analysis),
-            instruments=','.join(instruments),
-            tempo=analysis.get('tempo_suggestion', 120),
-            key_signature=analysis.get('key_suggestion', 'C'),
-            time_signature=analysis.get('time_signature', '4/4')
-        )
-        
+        midi_data = midi_gen.render_midi(analysis, instruments=instruments, seed=seed)
+        with timed('cache.store'):
+            composition_cache.put(key, analysis, midi_data)
+    
+    return _save_composition(title, poem_text, instruments, midi_data, analysis), analysis
+
+job_queue = JobQueue(app, lambda payload: create_composition(**payload)[0])
+
+def _save_composition(title, poem_text, instruments, midi_data, analysis):
+    """Store the MIDI and insert the composition row"""
+    # Stored under its content hash: repeats cost no disk write and titles never collide
+    with timed('store.midi_write'):
+        midi_filename = midi_store.filename(midi_store.put(midi_data))
+    
+    composition = Composition.from_analysis(title, poem_text, instruments, midi_filename, analysis)
+    
+    with timed('db.commit'):
         db.session.add(composition)
         db.session.commit()
+    
+    logging.info(f"Composition saved with ID: {composition.id}")
+    return composition
+
+def _flag(data, name):
+    """A boolean option from the JSON body or the query string"""
+    flag = data.get(name, request.args.get(name, False))
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+def _wants_async(data):
+    return _flag(data, 'async')
+
+@app.before_request
+def _start_job_queue():
+    # No-op once started; covers servers without the gunicorn hook
+    job_queue.start()
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_SECONDS.observe(request.endpoint or 'unmatched', time.perf_counter() - started)
+    return response
+
+@app.route('/analyze', methods=['POST'])
+def analyze_poem():
+    """Analyze poem and generate MIDI"""
+    try:
+        data = request.get_json()
         
-        logging.info(f"Composition saved with ID: {composition.id}")
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        
+        params, error = _parse_poem_request(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Async mode: hand the work to the job queue and return immediately
+        if _wants_async(data):
+            job_id = job_queue.submit(params)
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': url_for('job_status', job_id=job_id)
+            }), 202
         
-        return jsonify({
+        started = time.perf_counter()
+        with collect_timings() as breakdown:
+            composition, analysis = create_composition(**params)
+        
+        result = {
             'success': True,
             'composition_id': composition.id,
             'analysis': analysis,
-            'midi_filename': midi_filename,
+            'midi_filename': composition.midi_filename,
+            'audio_url': url_for('serve_audio', composition_id=composition.id),
             'message': 'Poem analyzed and music generated successfully!'
-        })
+        }
+        # Optional per-stage breakdown in milliseconds (track stages are summed across threads)
+        if _flag(data, 'timings'):
+            result['timings'] = timings_ms(breakdown)
+            result['timings']['total'] = round((time.perf_counter() - started) * 1000, 3)
+        return jsonify(result)
         
+    except PoemAnalysisError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error in analyze_poem: {str(e)}")
         return jsonify({'error': f'An error occurred while processing your poem: {str(e)}'}), 500
 
+BATCH_MAX_POEMS = int(os.environ.get('BATCH_MAX_POEMS', 10000))
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze many poems at once and stream one JSON result per line as each is saved
+    Accepts {"poems": [...], "instruments": [...]} or a JSONL body of poem objects.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('poems'), list):
+            return jsonify({'error': 'Expected {"poems": [...]}'}), 400
+        default_instruments = data.get('instruments', ['piano'])
+        records = [(index, poem, None) for index, poem in enumerate(data['poems'])]
+    else:
+        default_instruments = request.args.get('instruments', 'piano').split(',')
+        records = list(batch.read_jsonl(request.get_data(as_text=True).splitlines()))
+    
+    if not records:
+        return jsonify({'error': 'No poems provided'}), 400
+    if len(records) > BATCH_MAX_POEMS:
+        return jsonify({'error': f'Batch is limited to {BATCH_MAX_POEMS} poems'}), 400
+    
+    items = []
+    rejected = []
+    for index, record, error in records:
+        if error is None and not isinstance(record, dict):
+            error = 'Each poem must be a JSON object'
+        if error is None:
+            if record.get('instruments') is None:
+                record['instruments'] = default_instruments
+            params, error = _parse_poem_request(record)
+        if error:
+            rejected.append({'index': index, 'success': False, 'error': error})
+        else:
+            items.append((index, params))
+    
+    logging.info(f"Batch analysis of {len(items)} poems ({len(rejected)} rejected)")
+    
+    def generate():
+        for result in rejected:
+            yield json.dumps(result) + '\n'
+        try:
+            for result in batch.run_batch(items, batch.get_shared_pool(), midi_store=midi_store):
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            logging.error(f"Error in analyze_batch: {str(e)}")
+            db.session.rollback()
+            yield json.dumps({'success': False, 'error': f'Batch aborted: {str(e)}'}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """
+    Analyze a long poem stanza by stanza, streaming one JSON object per line
+    Accepts the /analyze JSON body, or the poem itself as a text/plain body with
+    title, instruments and seed in the query string. Each stanza's analysis is sent
+    as soon as it is ready; the MIDI is built alongside and saved at the end.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        params, error = _parse_poem_request(data)
+        if error:
+            return jsonify({'error': error}), 400
+        title, instruments, seed = params['title'], params['instruments'], params['seed']
+        source = iter(params['poem_text'].split('\n'))
+    else:
+        title = request.args.get('title', '').strip() or 'Untitled Poem'
+        instruments = _valid_instruments(request.args.get('instruments', 'piano').split(','))
+        seed = request.args.get('seed')
+        if seed is not None:
+            try:
+                seed = int(seed)
+            except ValueError:
+                seed = -1
+            if seed < 0:
+                return jsonify({'error': 'Seed must be a non-negative integer'}), 400
+        source = io.TextIOWrapper(request.stream, encoding='utf-8', errors='replace')
+    
+    logging.info(f"Streaming analysis of poem: {title}")
+    
+    def generate():
+        received = []
+        
+        def read_lines():
+            for line in source:
+                line = line.rstrip('\r\n')
+                received.append(line)
+                yield line
+        
+        midi_stream = midi_gen.stream(instruments, seed=seed)
+        try:
+            for result in analyzer.analyze_stream(read_lines()):
+                summary = result.get('summary')
+                if summary is None:
+                    midi_stream.add_stanza(result)
+                    yield json.dumps({
+                        'type': 'stanza',
+                        'lines_processed': result['first_line'] + result['line_count'],
+                        'analysis': result
+                    }) + '\n'
+                    continue
+                
+                if 'error' in summary:
+                    yield json.dumps({'type': 'error', 'error': summary['error']}) + '\n'
+                    return
+                
+                midi_data = midi_stream.finish(summary.get('tempo_suggestion', 120))
+                composition = _save_composition(title, '\n'.join(received).strip(), instruments, midi_data, summary)
+                yield json.dumps({
+                    'type': 'complete',
+                    'composition_id': composition.id,
+                    'midi_filename': composition.midi_filename,
+                    'summary': summary
+                }) + '\n'
+        except Exception as e:
+            logging.error(f"Error in analyze_stream: {str(e)}")
+            db.session.rollback()
+            yield json.dumps({'type': 'error', 'error': f'An error occurred while processing your poem: {str(e)}'}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status of an async analysis job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    result = {
+        'job_id': job.id,
+        'status': job.status,
+        'composition_id': job.composition_id,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None
+    }
+    if job.status == 'done':
+        result['composition_url'] = url_for('view_composition', composition_id=job.composition_id)
+        result['download_url'] = url_for('download_midi', composition_id=job.composition_id)
+    elif job.status == 'failed':
+        result['error'] = job.error
+    return jsonify(result)
+
+def _send_midi(filename, as_attachment=False, download_name=None, immutable=False):
+    """
+    Build a MIDI response from memory or via sendfile; None if the file is missing
+    The content hash is sent as a strong ETag along with Last-Modified, so send_file
+    answers If-None-Match / If-Modified-Since with 304 and Range requests with 206.
+    immutable marks a content-addressed file as never changing at this URL (hash-named routes only).
+    """
+    digest = digest_from_filename(filename)
+    if digest is None:
+        # Legacy title-named files written to static/midi can be overwritten, so
+        # clients revalidate them on every use
+        midi_path = os.path.abspath(os.path.join('static', 'midi', filename))
+        try:
+            etag = file_digest(midi_path)
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+        response = send_file(midi_path, mimetype='audio/midi', as_attachment=as_attachment,
+                             download_name=download_name, etag=etag)
+        response.cache_control.no_cache = True
+        return response
+    
+    data = midi_store.get_cached(digest)
+    if data is not None:
+        source = io.BytesIO(data)
+    elif midi_store.exists(digest):
+        source = midi_store.path(digest)  # sent with the server's file wrapper (sendfile)
+    else:
+        return None
+    response = send_file(
+        source,
+        mimetype='audio/midi',
+        as_attachment=as_attachment,
+        download_name=download_name or filename,
+        etag=digest,
+        last_modified=midi_store.last_modified(digest),
+        max_age=MIDI_MAX_AGE
+    )
+    response.cache_control.immutable = immutable
+    return response
+
 @app.route('/download/<int:composition_id>')
 def download_midi(composition_id):
     """Download MIDI file"""
     try:
         composition = Composition.query.get_or_404(composition_id)
-        midi_path = os.path.join('static', 'midi', composition.midi_filename)
+        response = _send_midi(
+            composition.midi_filename,
+            as_attachment=True,
+            download_name=f"{composition.title}.mid"
+        )
         
-        if not os.path.exists(midi_path):
+        if response is None:
             flash('MIDI file not found.', 'error')
             return redirect(url_for('index'))
         
-        return send_file(
-            midi_path,
-            as_attachment=True,
-            download_name=f"{composition.title}.mid",
-            mimetype='audio/midi'
-        )
+        return response
         
     except Exception as e:
         logging.error(f"Error downloading MIDI: {str(e)}")
@@ -114,28 +410,135 @@ def download_midi(composition_id):
 @app.route('/composition/<int:composition_id>')
 def view_composition(composition_id):
     """View composition details"""
-    composition = Composition.query.get_or_404(composition_id)
-    
-    try:
-        analysis_data = json.loads(composition.analysis_data) if composition.analysis_data else {}
-    except:
-        analysis_data = {}
-    
-    return render_template('composition.html', composition=composition, analysis=analysis_data)
+    composition = Composition.with_content().filter_by(id=composition_id).first_or_404()
+    return render_template('composition.html', composition=composition, analysis=composition.analysis)
 
 @app.route('/api/midi/<filename>')
 def serve_midi(filename):
     """Serve MIDI file for playback"""
     try:
-        midi_path = os.path.join('static', 'midi', filename)
-        if os.path.exists(midi_path):
-            return send_file(midi_path, mimetype='audio/midi')
-        else:
+        response = _send_midi(filename, immutable=True)
+        if response is None:
             return jsonify({'error': 'File not found'}), 404
+        return response
     except Exception as e:
         logging.error(f"Error serving MIDI: {str(e)}")
         return jsonify({'error': 'Error serving file'}), 500
 
+def _midi_bytes(filename):
+    """(content hash, MIDI bytes) of a stored MIDI file; bytes are None if it is missing"""
+    digest = digest_from_filename(filename)
+    if digest is not None:
+        return digest, midi_store.get(digest)
+    # Legacy title-named files written to static/midi
+    try:
+        with open(os.path.join('static', 'midi', filename), 'rb') as input_file:
+            data = input_file.read()
+    except (FileNotFoundError, IsADirectoryError):
+        return None, None
+    return content_digest(data), data
+
+@app.route('/api/audio/<int:composition_id>')
+def serve_audio(composition_id):
+    """Serve a composition rendered to WAV, rendering it on first play"""
+    composition = db.session.get(Composition, composition_id)
+    if composition is None:
+        return jsonify({'error': 'Composition not found'}), 404
+    
+    digest = digest_from_filename(composition.midi_filename)
+    path = audio_renderer.cached_path(digest) if digest else None
+    if path is None:
+        digest, midi_data = _midi_bytes(composition.midi_filename)
+        if midi_data is None:
+            return jsonify({'error': 'MIDI file not found'}), 404
+        try:
+            with timed('audio.render'):
+                path = audio_renderer.render(midi_data, digest, timeout=AUDIO_RENDER_TIMEOUT)
+        except (AudioBusy, RenderTimeout):
+            # The render (if queued) carries on; the retry finds it in progress or cached
+            response = jsonify({'error': 'Audio is being rendered, try again shortly'})
+            response.headers['Retry-After'] = str(AUDIO_RETRY_AFTER)
+            return response, 503
+        except Exception as e:
+            logging.error(f"Error rendering audio: {str(e)}")
+            return jsonify({'error': 'Error rendering audio'}), 500
+    
+    audio_filename = audio_renderer.filename(digest)
+    if composition.audio_filename != audio_filename:
+        composition.audio_filename = audio_filename
+        db.session.commit()
+    
+    # Sent from disk in chunks, with Range support so players can seek
+    return send_file(path, mimetype='audio/wav', conditional=True,
+                     etag=f"{digest}-{audio_renderer.version}", max_age=MIDI_MAX_AGE)
+
+@app.route('/api/compositions')
+def list_compositions():
+    """
+    Browse and search saved compositions, newest first
+    Filters: q (full text over title and poem), key, mood, instrument, tempo_min, tempo_max.
+    Pass next_cursor back as cursor for the following page.
+    """
+    try:
+        compositions, next_cursor = search_compositions(
+            search=request.args.get('q'),
+            key_signature=request.args.get('key'),
+            mood=request.args.get('mood'),
+            instrument=request.args.get('instrument'),
+            tempo_min=request.args.get('tempo_min', type=int),
+            tempo_max=request.args.get('tempo_max', type=int),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', 20, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'compositions': [{
+            'id': composition.id,
+            'title': composition.title,
+            'created_at': composition.created_at.isoformat() if composition.created_at else None,
+            'key_signature': composition.key_signature,
+            'tempo': composition.tempo,
+            'time_signature': composition.time_signature,
+            'mood': composition.mood,
+            'instruments': composition.instruments.split(',') if composition.instruments else [],
+            'midi_filename': composition.midi_filename,
+            'url': url_for('view_composition', composition_id=composition.id)
+        } for composition in compositions],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of stage and request latency histograms and cache counters"""
+    gauges, counters = {}, {}
+    for prefix, source in (('poetry_composition_cache_', composition_cache), ('poetry_audio_', audio_renderer)):
+        for name, value in source.stats().items():
+            if isinstance(value, (int, float)):
+                (counters if name in source.COUNTERS else gauges)[prefix + name] = value
+    gauges['poetry_worker_ready'] = int(warm_up.ready)
+    if warm_up.ready:
+        gauges['poetry_worker_warmup_seconds'] = warm_up.seconds
+    return Response(render_prometheus(gauges, counters), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz/live')
+def healthz_live():
+    """Liveness: the worker is up and answering requests"""
+    return jsonify({'status': 'live'})
+
+@app.route('/healthz/ready')
+def healthz_ready():
+    """Readiness: 200 once this worker has warmed up, 503 while it is warming (or the warm-up failed)"""
+    status = warm_up.status()
+    warm_up.start()  # no-op once started; covers servers without the gunicorn hook, and retries a failure
+    return jsonify(status), 200 if status['status'] == 'ready' else 503
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Composition cache hit, miss and eviction counters"""
+    return jsonify(composition_cache.stats())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
@@ -0,0 +1,234 @@
+import os
+import re
+import sys
+import logging
+import argparse
+import importlib.util
+import numpy as np
+
+# Lexicon sentiment scoring without TextBlob at request time. TextBlob's
+# default analyzer parses the pattern lexicon (en-sentiment.xml) and walks the
+# text word by word in Python; here the lexicon is compiled once into parallel
+# arrays (instance/sentiment_lexicon.npz) and every line of a poem, or of many
+# poems, is scored together with array operations. The rules follow pattern's:
+# only known words count, an adverb directly before a known word scales it by
+# the adverb's intensity, and a negation before it flips and halves it.
+# Negations before a chain of adverbs, exclamation marks and emoticons are
+# not modelled.
+
+DEFAULT_LEXICON_PATH = os.environ.get(
+    'SENTIMENT_LEXICON',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'sentiment_lexicon.npz')
+)
+
+# As in TextBlob, whose tokenizer keeps "don't" whole, contractions are not negations
+NEGATIONS = ('no', 'not', 'never')
+MODIFIER_POS = 'RB'
+
+
+def textblob_lexicon_path():
+    """Path of the en-sentiment.xml shipped with TextBlob, or None if TextBlob is not installed"""
+    spec = importlib.util.find_spec('textblob')
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return os.path.join(list(spec.submodule_search_locations)[0], 'en', 'en-sentiment.xml')
+
+
+def _average(rows):
+    return [sum(column) / len(column) for column in zip(*rows)]
+
+
+def compile_lexicon(xml_path, path=DEFAULT_LEXICON_PATH):
+    """Compile a pattern sentiment XML lexicon into the array file used by SentimentLexicon"""
+    import xml.etree.ElementTree as ElementTree
+
+    senses = {}
+    for element in ElementTree.parse(xml_path).getroot().findall('word'):
+        word = element.attrib.get('form')
+        if not word:
+            continue
+        scores = (float(element.attrib.get('polarity', 0.0)),
+                  float(element.attrib.get('subjectivity', 0.0)),
+                  float(element.attrib.get('intensity', 1.0)))
+        senses.setdefault(word, {}).setdefault(element.attrib.get('pos'), []).append(scores)
+
+    # Average the senses of each part of speech, then the parts of speech, as pattern does
+    words = {word: {pos: _average(rows) for pos, rows in by_pos.items()} for word, by_pos in senses.items()}
+    entries = {word: (_average(list(by_pos.values())), MODIFIER_POS in by_pos) for word, by_pos in words.items()}
+    # pattern's English lexicon also scores adverbs derived from adjectives ("terrible" -> "terribly")
+    for word, by_pos in words.items():
+        if 'JJ' in by_pos:
+            stem = word[:-1] + 'i' if word.endswith('y') else word
+            stem = stem[:-2] if stem.endswith('le') else stem
+            entries[stem + 'ly'] = (by_pos['JJ'], True)
+
+    ordered = sorted(entries)
+    scores = np.array([entries[word][0] for word in ordered], dtype=np.float64).reshape(-1, 3)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(temporary, words=np.array(ordered), polarity=scores[:, 0], subjectivity=scores[:, 1],
+             intensity=scores[:, 2], modifier=np.array([entries[word][1] for word in ordered], dtype=bool))
+    os.replace(temporary, path)  # atomic, so concurrent workers never read a partial file
+    logging.info(f"Compiled sentiment lexicon with {len(ordered)} words to {path}")
+    return path
+
+
+class SentimentLexicon:
+    """
+    Word -> (polarity, subjectivity, intensity) table plus a vectorized line scorer
+    Words are looked up once with code(); the scorers take arrays of those codes.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            words = data['words'].tolist()
+            polarity, subjectivity = data['polarity'], data['subjectivity']
+            intensity, modifier = data['intensity'], data['modifier']
+        self.path = path
+        self.word_count = len(words)
+        self._codes = {word: code for code, word in enumerate(words)}
+
+        # Extra rows after the lexicon: negations it lacks, then unknown one-letter,
+        # two-letter and longer words
+        extra = [word for word in NEGATIONS if word not in self._codes]
+        for word in extra:
+            self._codes[word] = len(self._codes)
+        self.short_code = len(self._codes)
+        self.two_letter_code = self.short_code + 1
+        self.unknown_code = self.short_code + 2
+        padding = len(extra) + 3
+        self.polarity = np.concatenate([polarity, np.zeros(padding)])
+        self.subjectivity = np.concatenate([subjectivity, np.zeros(padding)])
+        self.intensity = np.concatenate([intensity, np.ones(padding)])
+        self.modifier = np.concatenate([modifier, np.zeros(padding, dtype=bool)])
+        self.known = np.concatenate([np.ones(len(words), dtype=bool), np.zeros(padding, dtype=bool)])
+        self.negation = np.zeros(len(self.known), dtype=bool)
+        self.negation[[self._codes[word] for word in NEGATIONS]] = True
+        self.short = np.zeros(len(self.known), dtype=bool)
+        self.short[self.short_code] = True
+        self.small = self.short.copy()
+        self.small[self.two_letter_code] = True
+        self.ly = np.array([word.endswith('ly') for word in words] + [False] * padding, dtype=bool)
+
+    def __len__(self):
+        return self.word_count
+
+    def code(self, word):
+        """Row of a lowercase word token; unknown words share a row per length (1, 2, longer)"""
+        code = self._codes.get(word)
+        if code is not None:
+            return code
+        if len(word) <= 2:
+            return self.short_code if len(word) == 1 else self.two_letter_code
+        return self.unknown_code
+
+    def score_lines(self, codes, line_lengths):
+        """
+        Sentiment sums of every line from the concatenated word codes of all lines
+        Returns (polarity_sum, subjectivity_sum, count) arrays, one entry per line, where
+        count is the number of scored words; a line's scores are the sums over count.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        line_lengths = np.asarray(line_lengths, dtype=np.int64)
+        line_count = len(line_lengths)
+        if not len(codes):
+            return np.zeros(line_count), np.zeros(line_count), np.zeros(line_count, dtype=np.int64)
+        line = np.repeat(np.arange(line_count), line_lengths)
+
+        known = self.known[codes]
+
+        def previous(flags, steps=1):
+            """flags of the word `steps` places earlier on the same line (False where there is none)"""
+            shifted = np.zeros(len(flags), dtype=bool)
+            shifted[steps:] = flags[:-steps] & (line[steps:] == line[:-steps])
+            return shifted
+
+        # "not good", and "not a good": a negation carries across one one-letter word
+        negation = self.negation[codes]
+        negated = previous(negation) | (previous(negation, 2) & previous(self.short[codes]))
+        # "very good", "very so good": a known adverb before a known word, possibly across
+        # an unknown word of one or two letters, is scored together with that word
+        adverb = known & self.modifier[codes]
+        distance = np.where(previous(adverb), 1, np.where(previous(adverb, 2) & previous(self.small[codes]), 2, 0))
+        distance[~known] = 0
+        # "really not good": an -ly adverb before a negation still modifies the word, which is negated
+        across = known & (distance == 0) & previous(negation) & previous(adverb & self.ly[codes], 2)
+        distance[across] = 2
+        modified = distance > 0
+        modifier = np.arange(len(codes)) - distance
+        absorbed = np.zeros(len(codes), dtype=bool)
+        absorbed[modifier[modified]] = True
+
+        scored = known & ~absorbed
+        scale = np.where(modified, self.intensity[codes[modifier]], 1.0)
+        # "not very good": the negation applies to the pair and inverts the adverb's intensity
+        modifier_negated = modified & ~across & negated[modifier]
+        scale = np.where(modifier_negated, 1.0 / scale, scale)
+        negated = np.where(modified, modifier_negated | across, negated)
+
+        polarity = np.clip(self.polarity[codes] * scale, -1.0, 1.0)
+        polarity = np.where(negated, polarity * -0.5, polarity)
+        subjectivity = np.clip(self.subjectivity[codes] * scale, -1.0, 1.0)
+
+        scored_line = line[scored]
+        return (np.bincount(scored_line, weights=polarity[scored], minlength=line_count),
+                np.bincount(scored_line, weights=subjectivity[scored], minlength=line_count),
+                np.bincount(scored_line, minlength=line_count))
+
+    def score_batch(self, poems):
+        """
+        score_lines for many poems in one pass
+        poems is a list of (codes, line_lengths); returns one (polarity_sum, subjectivity_sum, count) per poem.
+        """
+        if not poems:
+            return []
+        codes = np.concatenate([np.asarray(poem_codes, dtype=np.int64) for poem_codes, _ in poems])
+        line_lengths = np.concatenate([np.asarray(lengths, dtype=np.int64) for _, lengths in poems])
+        sums = self.score_lines(codes, line_lengths)
+        boundaries = np.cumsum([len(lengths) for _, lengths in poems])[:-1]
+        return list(zip(*(np.split(values, boundaries) for values in sums)))
+
+
+def load_lexicon(path=DEFAULT_LEXICON_PATH, build_missing=True):
+    """Open the compiled lexicon, compiling it from TextBlob's en-sentiment.xml if missing; None if unavailable"""
+    if not os.path.exists(path):
+        xml_path = textblob_lexicon_path()
+        if not build_missing or not xml_path or not os.path.exists(xml_path):
+            logging.warning(f"Sentiment lexicon not found at {path} and TextBlob's lexicon is unavailable")
+            return None
+        compile_lexicon(xml_path, path)
+    return SentimentLexicon(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile or query the sentiment lexicon")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="compile a pattern sentiment XML lexicon")
+    build_parser.add_argument('--xml', default=textblob_lexicon_path())
+    build_parser.add_argument('--output', default=DEFAULT_LEXICON_PATH)
+    score_parser = subparsers.add_parser('score', help="score each line read from stdin")
+    score_parser.add_argument('--lexicon', default=DEFAULT_LEXICON_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'build':
+        if not args.xml:
+            parser.error("TextBlob is not installed; pass --xml")
+        compile_lexicon(args.xml, args.output)
+        return 0
+
+    lexicon = load_lexicon(args.lexicon)
+    if lexicon is None:
+        return 1
+    lines = [line.rstrip('\n') for line in sys.stdin]
+    words = [re.findall(r'\w+', line.lower()) for line in lines]
+    polarity, subjectivity, count = lexicon.score_lines(
+        [lexicon.code(word) for line_words in words for word in line_words], [len(line_words) for line_words in words]
+    )
+    for text, p, s, n in zip(lines, polarity, subjectivity, count):
+        print(f"{p / max(n, 1):+.3f}\t{s / max(n, 1):.3f}\t{text}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
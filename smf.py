@@ -0,0 +1,186 @@
+import struct
+import numpy as np
+
+# Standard MIDI File encoder for NoteEvents tracks. The output is laid out the
+# way midiutil writes a format 1 file (tempo track first, the same event
+# ordering, duplicate removal and note de-interleaving), so the two can be
+# compared byte for byte, but the per-event work is done on whole arrays.
+
+TICKS_PER_QUARTER = 960
+END_OF_TRACK = b'\x00\xff\x2f\x00'
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+PROGRAM_CHANGE = 0xC0
+
+
+def _chunk(data):
+    return b'MTrk' + struct.pack('>L', len(data)) + data
+
+
+def _variable_length_rows(values):
+    """MIDI variable-length quantities as a (n, 4) byte matrix plus a mask of used bytes"""
+    values = values.astype(np.int64)
+    rows = np.stack([
+        (values >> 21) & 0x7F | 0x80,
+        (values >> 14) & 0x7F | 0x80,
+        (values >> 7) & 0x7F | 0x80,
+        values & 0x7F,
+    ], axis=1).astype(np.uint8)
+    mask = np.stack([values >= 1 << 21, values >= 1 << 14, values >= 1 << 7, np.ones(len(values), dtype=bool)], axis=1)
+    return rows, mask
+
+
+def _deinterleave(tick, kind, order, pitch, channel):
+    """
+    Mirror midiutil's handling of overlapping notes on the same pitch and channel:
+    a note-off met while another note is still sounding is moved to that note's start
+    """
+    tick = tick.copy()
+    sounding = {}
+    for i in order.tolist():
+        key = (int(pitch[i]), int(channel[i]))
+        starts = sounding.setdefault(key, [])
+        if kind[i]:
+            starts.append(int(tick[i]))
+        elif len(starts) > 1:
+            tick[i] = starts.pop()
+        elif starts:
+            starts.pop()
+    return tick
+
+
+def encode_track(events, program=None, ticks_per_quarter=TICKS_PER_QUARTER):
+    """Serialize one NoteEvents track (with an optional program change on channel 0) to MTrk data"""
+    prefix = b'' if program is None else bytes([0, PROGRAM_CHANGE, program])
+    count = len(events)
+    if not count:
+        return prefix + END_OF_TRACK
+
+    on_tick = np.trunc(events.start * ticks_per_quarter).astype(np.int64)
+    off_tick = on_tick + np.trunc(events.duration * ticks_per_quarter).astype(np.int64)
+    insertion = np.arange(count)
+
+    tick = np.concatenate([on_tick, off_tick])
+    kind = np.concatenate([np.ones(count, dtype=np.int64), np.zeros(count, dtype=np.int64)])  # note-offs sort first
+    order_key = np.concatenate([insertion, insertion])
+    pitch = np.concatenate([events.pitch, events.pitch]).astype(np.int64)
+    channel = np.concatenate([events.channel, events.channel]).astype(np.int64)
+    velocity = np.concatenate([events.velocity, events.velocity]).astype(np.int64)
+
+    # Only walk the events in Python if some pitch is re-struck while still sounding (rare)
+    by_note = np.lexsort((on_tick, events.channel, events.pitch))
+    same_note = ((events.pitch[by_note][1:] == events.pitch[by_note][:-1])
+                 & (events.channel[by_note][1:] == events.channel[by_note][:-1]))
+    interleaved = bool(np.any(same_note & (on_tick[by_note][1:] < off_tick[by_note][:-1])))
+
+    # Drop duplicate note-ons/offs (same tick, pitch and channel), keeping the first added
+    identity = ((kind << 40 | tick) << 7 | pitch) << 4 | channel
+    _, keep = np.unique(identity, return_index=True)
+    keep.sort()
+    tick, kind, order_key, pitch, channel, velocity = (
+        column[keep] for column in (tick, kind, order_key, pitch, channel, velocity)
+    )
+
+    order = np.lexsort((order_key, kind, tick))
+    if interleaved:
+        tick = _deinterleave(tick, kind, order, pitch, channel)
+        order = np.lexsort((order_key, kind, tick))
+
+    tick, kind, pitch, channel, velocity = (column[order] for column in (tick, kind, pitch, channel, velocity))
+    delta = np.diff(tick, prepend=0)
+    rows, mask = _variable_length_rows(delta)
+    status = np.where(kind == 1, NOTE_ON, NOTE_OFF) | channel
+    body = np.concatenate([rows, np.stack([status, pitch, velocity], axis=1).astype(np.uint8)], axis=1)
+    body_mask = np.concatenate([mask, np.ones((len(delta), 3), dtype=bool)], axis=1)
+    return prefix + body[body_mask].tobytes() + END_OF_TRACK
+
+
+def assemble_smf(track_data, tempo, ticks_per_quarter=TICKS_PER_QUARTER):
+    """
+    Build a format 1 Standard MIDI File from MTrk bodies encoded by encode_track
+    The tempo track (tempo in beats per minute) comes first. Tracks are encoded
+    separately so each can be serialized on the thread that rendered it.
+    """
+    header = b'MThd' + struct.pack('>LHHH', 6, 1, len(track_data) + 1, ticks_per_quarter)
+    microseconds = int(60000000 / tempo)
+    tempo_track = _chunk(b'\x00\xff\x51\x03' + microseconds.to_bytes(3, 'big') + END_OF_TRACK)
+    return header + tempo_track + b''.join(_chunk(data) for data in track_data)
+
+
+def _read_variable_length(data, offset):
+    value = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, offset
+
+
+def read_smf(data):
+    """
+    Parse a Standard MIDI File into its notes
+    Returns (ticks_per_quarter, tempo_bpm, tracks, programs) where each track is a list of
+    (channel, pitch, start_tick, end_tick, velocity) tuples ordered by start, and programs
+    holds each track's first program change (None if it has none).
+    Only the first tempo event is honored.
+    """
+    if data[:4] != b'MThd':
+        raise ValueError("Not a Standard MIDI File")
+    header_length, _, track_count, division = struct.unpack_from('>LHHH', data, 4)
+    offset = 8 + header_length
+    tempo_bpm = 120.0
+    tempo_seen = False
+    tracks = []
+    programs = []
+
+    for _ in range(track_count):
+        if data[offset:offset + 4] != b'MTrk':
+            raise ValueError("Malformed track chunk")
+        length = struct.unpack_from('>L', data, offset + 4)[0]
+        position, end = offset + 8, offset + 8 + length
+        offset = end
+        tick = 0
+        status = 0
+        sounding = {}
+        notes = []
+        program = None
+        while position < end:
+            delta, position = _read_variable_length(data, position)
+            tick += delta
+            if data[position] & 0x80:
+                status = data[position]
+                position += 1
+            if status == 0xFF:
+                meta_type = data[position]
+                meta_length, position = _read_variable_length(data, position + 1)
+                if meta_type == 0x51 and not tempo_seen:
+                    tempo_bpm = 60000000 / int.from_bytes(data[position:position + 3], 'big')
+                    tempo_seen = True
+                position += meta_length
+                continue
+            if status in (0xF0, 0xF7):
+                sysex_length, position = _read_variable_length(data, position)
+                position += sysex_length
+                continue
+            kind, channel = status & 0xF0, status & 0x0F
+            if kind in (0xC0, 0xD0):
+                if kind == 0xC0 and program is None:
+                    program = data[position]
+                position += 1
+                continue
+            first, second = data[position], data[position + 1]
+            position += 2
+            if kind == NOTE_ON and second > 0:
+                sounding.setdefault((channel, first), []).append((tick, second))
+            elif kind in (NOTE_ON, NOTE_OFF):
+                starts = sounding.get((channel, first))
+                if starts:
+                    start_tick, velocity = starts.pop(0)
+                    notes.append((channel, first, start_tick, tick, velocity))
+        notes.sort(key=lambda note: (note[2], note[0], note[1]))
+        tracks.append(notes)
+        programs.append(program)
+
+    return division, tempo_bpm, tracks, programs
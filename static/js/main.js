@@ -190,6 +190,7 @@ class PoetryToMusic {
                     </div>
                     <div class="analysis-item">
                         <strong>Rhyme Scheme:</strong> ${analysis.rhyme_scheme || 'Free'}
+                        ${analysis.rhyme_pattern ? `<code class="d-block">${analysis.rhyme_pattern}</code>` : ''}
                         <small class="text-muted d-block">${this.getRhymeExplanation(analysis.rhyme_scheme)}</small>
                     </div>
                 </div>
@@ -233,7 +234,8 @@ class PoetryToMusic {
                 detectedDevices.push({
                     name: this.formatDeviceName(deviceKey),
                     explanation: device.explanation,
-                    musical_impact: device.musical_impact
+                    musical_impact: device.musical_impact,
+                    occurrences: this.formatDeviceOccurrences(device)
                 });
             }
         });
@@ -257,6 +259,7 @@ class PoetryToMusic {
                                  data-bs-parent="#literaryDevicesAccordion">
                                 <div class="accordion-body">
                                     <p><strong>What it is:</strong> ${device.explanation}</p>
+                                    ${device.occurrences}
                                     <p class="text-info mb-0"><strong>Musical Translation:</strong> ${device.musical_impact}</p>
                                 </div>
                             </div>
@@ -307,6 +310,8 @@ class PoetryToMusic {
         const explanations = {
             'iambic': 'Creates steady, marching rhythm (da-DUM da-DUM)',
             'trochaic': 'Creates falling rhythm (DUM-da DUM-da)',
+            'anapestic': 'Creates galloping rhythm in triple time (da-da-DUM)',
+            'dactylic': 'Creates waltzing rhythm in triple time (DUM-da-da)',
             'free_verse': 'Allows flexible, experimental rhythms',
             'regular': 'Produces consistent, structured musical phrases'
         };
@@ -317,6 +322,13 @@ class PoetryToMusic {
         const explanations = {
             'ABAB': 'Creates alternating harmonic patterns',
             'AABB': 'Produces paired harmonic progressions',
+            'ABBA': 'Frames each stanza with returning harmonies',
+            'ABCB': 'Resolves harmony on every second line, like a ballad',
+            'AABA': 'Builds a repeated phrase with a contrasting bridge',
+            'monorhyme': 'Holds one harmonic center throughout',
+            'terza rima': 'Chains interlocking progressions from stanza to stanza',
+            'Shakespearean sonnet': 'Alternating progressions resolved by a closing couplet',
+            'Petrarchan sonnet': 'Contrasts an enclosed octave with a turning sestet',
             'free': 'Allows varied harmonic exploration',
             'none': 'Focuses on melodic rather than harmonic structure'
         };
@@ -333,15 +345,11 @@ class PoetryToMusic {
     }
 
     getKeyExplanation(key) {
-        const explanations = {
-            'C': 'Major key - bright, optimistic sound',
-            'Am': 'Minor key - contemplative, melancholic sound',
-            'G': 'Major key - warm, uplifting character',
-            'Em': 'Minor key - gentle, introspective mood',
-            'F': 'Major key - peaceful, stable feeling',
-            'Dm': 'Minor key - serious, dramatic tone'
-        };
-        return explanations[key] || 'Sets the emotional foundation';
+        if (!key) return 'Sets the emotional foundation';
+        const [tonic, mode] = key.split(' ');
+        if (mode) return `${mode.charAt(0).toUpperCase()}${mode.slice(1)} mode - poised between major and minor, reflective`;
+        if (tonic.endsWith('m')) return 'Minor key - contemplative, melancholic sound';
+        return 'Major key - bright, optimistic sound';
     }
 
     getTempoExplanation(tempo) {
@@ -380,7 +388,8 @@ class PoetryToMusic {
                             <div class="card-body">
                                 <p><strong>Emotional polarity:</strong> ${this.formatPolarity(analysis.sentiment?.polarity)}</p>
                                 <p><strong>Subjectivity:</strong> ${this.formatSubjectivity(analysis.sentiment?.subjectivity)}</p>
-                                <small class="text-muted">These values determine musical key choices and dynamic expression</small>
+                                ${this.formatStanzaArc(analysis.sentiment?.stanza_arc)}
+                                <small class="text-muted">These values determine musical key choices and dynamic expression; each line's polarity sets its loudness and each stanza's mood its key</small>
                             </div>
                         </div>
                     </div>
@@ -396,6 +405,25 @@ class PoetryToMusic {
         return `Neutral (${polarity.toFixed(2)})`;
     }
 
+    formatDeviceOccurrences(device) {
+        if (!device.count || !device.lines) return '';
+        const lines = device.lines.map(line => line + 1).join(', ');
+        const words = (device.words || []).map(word => this.escapeHtml(String(word))).join(', ');
+        return `<p><strong>Found:</strong> ${device.count} time${device.count === 1 ? '' : 's'} on line${device.lines.length === 1 ? '' : 's'} ${lines}${words ? ` (${words})` : ''}</p>`;
+    }
+
+    escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    formatStanzaArc(stanzaArc) {
+        if (!stanzaArc || stanzaArc.length < 2) return '';
+        const moods = stanzaArc.map(polarity => polarity > 0.1 ? 'positive' : polarity < -0.1 ? 'negative' : 'neutral');
+        return `<p><strong>Stanza moods:</strong> ${moods.join(' → ')}</p>`;
+    }
+
     formatSubjectivity(subjectivity) {
         if (subjectivity === undefined) return 'Balanced';
         if (subjectivity > 0.7) return `Highly subjective (${subjectivity.toFixed(2)})`;
@@ -431,14 +459,45 @@ class PoetryToMusic {
         window.location.href = `/download/${compositionId}`;
     }
 
-    handlePlay() {
+    async handlePlay() {
         if (!this.currentComposition) return;
-        
-        const midiFilename = this.currentComposition.midi_filename;
-        this.showMessage('MIDI playback in browser is limited. Please download the file to play in your preferred music software.', 'info');
-        
-        // For now, we'll show a message since MIDI playback in browsers is complex
-        // In a full implementation, you'd use Web Audio API or a MIDI library
+
+        const audioUrl = this.currentComposition.audio_url || `/api/audio/${this.currentComposition.composition_id}`;
+        const player = document.getElementById('audioPlayer');
+        const playBtn = document.getElementById('playBtn');
+        if (!player) return;
+
+        if (player.dataset.src === audioUrl) {
+            player.play();
+            return;
+        }
+
+        if (playBtn) playBtn.disabled = true;
+        try {
+            // The first play renders the audio on the server; a one-byte request waits for
+            // the render (retrying while the render queue is full) without downloading it
+            for (let attempt = 0; ; attempt++) {
+                const response = await fetch(audioUrl, { headers: { 'Range': 'bytes=0-0' } });
+                if (response.ok) break;
+                if (response.status !== 503 || attempt >= 5) {
+                    const result = await response.json().catch(() => ({}));
+                    throw new Error(result.error || 'Audio preview is unavailable');
+                }
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 5;
+                this.showMessage(`Preparing audio preview, retrying in ${retryAfter}s...`, 'info');
+                await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+            }
+
+            player.src = audioUrl;
+            player.dataset.src = audioUrl;
+            player.style.display = 'block';
+            await player.play();
+        } catch (error) {
+            console.error('Error:', error);
+            this.showMessage(`${error.message}. Please download the MIDI file to play it in your preferred music software.`, 'warning');
+        } finally {
+            if (playBtn) playBtn.disabled = false;
+        }
     }
 
     showMessage(message, type = 'info') {
@@ -0,0 +1,35 @@
+import os
+import sys
+import shutil
+import tempfile
+import pytest
+
+# The app reads its database and storage locations from the environment when it
+# is imported, so point them at a scratch directory before any test imports it.
+# The pronunciation index and sentiment lexicon stay at their defaults (instance/).
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix='poetry-tests-')
+os.environ.setdefault('POETRY_OFFLINE', '1')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'test.db')}"
+os.environ['MIDI_STORE_DIR'] = os.path.join(SCRATCH_DIR, 'midi_store')
+os.environ['COMPOSITION_CACHE_PATH'] = os.path.join(SCRATCH_DIR, 'composition_cache.db')
+os.environ['AUDIO_CACHE_DIR'] = os.path.join(SCRATCH_DIR, 'audio_cache')
+os.environ['BATCH_WORKERS'] = '2'
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
@@ -0,0 +1,31 @@
+import pytest
+from analysis_codec import FORMAT_JSON, FORMAT_ZLIB_JSON, pack_analysis, unpack_analysis
+
+POEM = "The sea is calm tonight\nThe tide is full"
+
+
+def test_round_trip_compressed():
+    analysis = {'lines': POEM.split('\n'), 'meter': 'iambic', 'padding': 'x' * 4000}
+    blob = pack_analysis(analysis, POEM)
+    assert blob[0] == FORMAT_ZLIB_JSON
+    assert unpack_analysis(blob, POEM) == analysis
+
+
+@pytest.mark.parametrize('blob', [
+    b'',
+    bytes([FORMAT_ZLIB_JSON]) + b'not zlib data',
+    bytes([FORMAT_JSON]) + b'{"truncated',
+    bytes([FORMAT_JSON]) + b'[1, 2]',
+    bytes([99]) + b'{}',
+])
+def test_undecodable_blobs_raise_value_error(blob):
+    with pytest.raises(ValueError):
+        unpack_analysis(blob, POEM)
+
+
+def test_corrupt_blob_falls_back_to_empty_analysis(app):
+    from models import Composition
+
+    composition = Composition(title='Corrupt', poem_text=POEM, instruments='piano', midi_filename='x.mid',
+                              analysis_blob=bytes([FORMAT_ZLIB_JSON]) + b'\x00garbage')
+    assert composition.analysis == {}
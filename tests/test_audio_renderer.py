@@ -0,0 +1,43 @@
+import os
+import time
+from audio_renderer import AudioRenderer
+
+DIGESTS = [f"{n:02x}" * 32 for n in range(4)]
+
+
+def _cached_file(renderer, digest, age):
+    path = renderer.path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as output:
+        output.write(b'\0' * 100)
+    then = time.time() - age
+    os.utime(path, (then, then))
+    return path
+
+
+def test_evicts_least_recently_played_first(tmp_path):
+    renderer = AudioRenderer(root=str(tmp_path), max_bytes=250)
+    paths = [_cached_file(renderer, digest, age) for digest, age in zip(DIGESTS, (1000, 900, 800, 700))]
+
+    assert renderer.cached_path(DIGESTS[0]) == paths[0]  # played again: now the most recent
+    assert renderer.evict() == 200
+    assert [os.path.exists(path) for path in paths] == [True, False, False, True]
+    assert renderer.stats()['evictions'] == 2
+
+
+def test_recently_played_files_are_kept_over_the_limit(tmp_path):
+    renderer = AudioRenderer(root=str(tmp_path), max_bytes=100)
+    paths = [_cached_file(renderer, digest, 0) for digest in DIGESTS[:3]]
+
+    assert renderer.evict() == 300
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_index_tracks_files_removed_elsewhere(tmp_path):
+    renderer = AudioRenderer(root=str(tmp_path), max_bytes=1000)
+    path = _cached_file(renderer, DIGESTS[0], 1000)
+    assert renderer.evict() == 100
+
+    os.remove(path)
+    assert renderer.cached_path(DIGESTS[0]) is None
+    assert renderer.evict() == 0
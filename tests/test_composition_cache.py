@@ -0,0 +1,51 @@
+import sqlite3
+from composition_cache import CompositionCache
+
+ANALYSIS = {'lines': ['a line'], 'meter': 'iambic'}
+
+
+def _summed(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries').fetchone()
+
+
+def test_totals_follow_inserts_replacements_and_clear(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = CompositionCache(path=path, memory_entries=0)
+    cache.put('a', ANALYSIS, b'x' * 100)
+    cache.put('b', ANALYSIS, b'y' * 200)
+    cache.put('a', ANALYSIS, b'z' * 50)  # replaced in place
+
+    stats = cache.stats()
+    assert (stats['disk_entries'], stats['disk_bytes']) == _summed(path)
+    assert stats['disk_entries'] == 2
+
+    cache.clear()
+    stats = cache.stats()
+    assert (stats['disk_entries'], stats['disk_bytes']) == (0, 0)
+
+
+def test_evicts_least_recently_used_past_the_limit(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = CompositionCache(path=path, memory_entries=0, max_disk_bytes=1000)
+    for key in 'abcdef':
+        cache.put(key, ANALYSIS, b'm' * 300)
+        cache.get('a')  # keep 'a' recently used
+
+    stats = cache.stats()
+    assert stats['disk_bytes'] <= 1000
+    assert (stats['disk_entries'], stats['disk_bytes']) == _summed(path)
+    assert stats['disk_evictions'] == 6 - stats['disk_entries']
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+
+
+def test_totals_are_seeded_for_an_existing_cache_file(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE cache_entries (key TEXT PRIMARY KEY, analysis TEXT NOT NULL,'
+                     ' midi BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        conn.execute("INSERT INTO cache_entries VALUES ('old', '{}', x'00', 123, 0)")
+
+    stats = CompositionCache(path=path).stats()
+    assert (stats['disk_entries'], stats['disk_bytes']) == (1, 123)
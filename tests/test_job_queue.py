@@ -0,0 +1,46 @@
+import json
+from datetime import datetime, timedelta
+
+PAYLOAD = {'title': 'Recovered', 'poem_text': 'The night is still\nUpon the hill', 'instruments': ['piano']}
+
+
+def _add_job(db, AnalysisJob, job_id, status, updated_at):
+    db.session.add(AnalysisJob(id=job_id, status=status, payload=json.dumps(PAYLOAD), updated_at=updated_at))
+    db.session.commit()
+
+
+def test_start_resumes_queued_and_stale_running_jobs(app):
+    from app import db
+    from models import AnalysisJob
+    from routes import create_composition
+    from job_queue import JobQueue
+
+    queue = JobQueue(app, lambda payload: create_composition(**payload)[0], max_workers=1, timeout=60)
+    now = datetime.utcnow()
+    with app.app_context():
+        _add_job(db, AnalysisJob, 'recover-queued', 'queued', now)
+        _add_job(db, AnalysisJob, 'recover-stale', 'running', now - timedelta(minutes=5))
+        _add_job(db, AnalysisJob, 'recover-live', 'running', now)
+
+    queue.start()
+    queue._pool.shutdown(wait=True)
+
+    with app.app_context():
+        statuses = {job_id: db.session.get(AnalysisJob, job_id).status
+                    for job_id in ('recover-queued', 'recover-stale', 'recover-live')}
+    assert statuses == {'recover-queued': 'done', 'recover-stale': 'done', 'recover-live': 'running'}
+
+
+def test_claim_records_the_claim_time(app):
+    from app import db
+    from models import AnalysisJob
+    from job_queue import JobQueue
+
+    queue = JobQueue(app, lambda payload: None)
+    old = datetime.utcnow() - timedelta(hours=1)
+    with app.app_context():
+        _add_job(db, AnalysisJob, 'claim-time', 'queued', old)
+        started = datetime.utcnow()
+        assert queue._claim('claim-time')
+        db.session.expire_all()
+        assert db.session.get(AnalysisJob, 'claim-time').updated_at >= started
@@ -0,0 +1,33 @@
+from metrics import STAGE_SECONDS, collect_timings
+from poetry_analyzer import PoetryAnalyzer
+
+POEM = "Roses are red,\nViolets are blue,\n\nSugar is sweet,\nAnd so are you."
+
+
+def _stage_count(stage):
+    with STAGE_SECONDS._lock:
+        series = STAGE_SECONDS._series.get(stage)
+        return series[1] if series else 0
+
+
+def test_each_stage_is_observed_once_per_analysis():
+    analyzer = PoetryAnalyzer()
+    analyzer.analyze_poem(POEM)  # lazy loads out of the way
+    stages = ('analyze.parse', 'analyze.sentiment', 'analyze.meter', 'analyze.rhyme',
+              'analyze.literary_devices', 'analyze.suggestions')
+    before = {stage: _stage_count(stage) for stage in stages}
+    with collect_timings() as breakdown:
+        analyzer.analyze_poem(POEM)
+    assert {stage: _stage_count(stage) - before[stage] for stage in stages} == dict.fromkeys(stages, 1)
+    assert set(stages) <= set(breakdown)
+
+
+def test_metrics_types_counters_and_gauges(client):
+    text = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE poetry_composition_cache_misses_total counter' in text
+    assert '# TYPE poetry_composition_cache_evictions_total counter' in text
+    assert '# TYPE poetry_audio_renders_total counter' in text
+    assert '# TYPE poetry_composition_cache_memory_entries gauge' in text
+    assert '# TYPE poetry_audio_pending gauge' in text
+    assert '# TYPE poetry_worker_ready gauge' in text
+    assert 'poetry_composition_cache_misses ' not in text
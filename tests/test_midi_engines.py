@@ -0,0 +1,64 @@
+import pytest
+from poetry_analyzer import PoetryAnalyzer
+from midi_generator import MIDIGenerator
+
+# midiutil is kept as the reference encoder: the NumPy engine must produce the
+# very same Standard MIDI File bytes, whether tracks render inline or on the pool
+
+POEM = """Whose woods these are I think I know.
+His house is in the village though;
+He will not see me stopping here
+To watch his woods fill up with snow.
+
+My little horse must think it queer
+To stop without a farmhouse near
+Between the woods and frozen lake
+The darkest evening of the year.
+
+The woods are lovely, dark and deep,
+Her voice is like a silver bell,
+And miles to go before I sleep,
+And miles to go before I sleep."""
+
+INSTRUMENTS = ['piano', 'acoustic_guitar', 'electric_guitar', 'strings', 'violin', 'cello', 'flute', 'clarinet', 'drums']
+SEED = 20240615
+
+
+@pytest.fixture(scope='module')
+def analysis():
+    return PoetryAnalyzer().analyze_poem(POEM)
+
+
+@pytest.mark.parametrize('track_workers', [1, 4], ids=['inline', 'thread_pool'])
+@pytest.mark.parametrize('instruments', [['piano'], ['piano', 'strings', 'drums'], INSTRUMENTS],
+                         ids=['piano', 'trio', 'all'])
+def test_numpy_engine_matches_midiutil(analysis, instruments, track_workers):
+    numpy_smf = MIDIGenerator(engine='numpy', track_workers=track_workers).render_midi(
+        analysis, instruments=instruments, seed=SEED)
+    midiutil_smf = MIDIGenerator(engine='midiutil', track_workers=track_workers).render_midi(
+        analysis, instruments=instruments, seed=SEED)
+    assert numpy_smf[:4] == b'MThd'
+    assert numpy_smf == midiutil_smf
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'midiutil'])
+def test_thread_pool_does_not_change_output(analysis, engine):
+    inline = MIDIGenerator(engine=engine, track_workers=1).render_midi(analysis, instruments=INSTRUMENTS, seed=SEED)
+    pooled = MIDIGenerator(engine=engine, track_workers=4).render_midi(analysis, instruments=INSTRUMENTS, seed=SEED)
+    assert inline == pooled
+
+
+def test_stanza_stream_matches_midiutil():
+    """MIDIStream renders stanza by stanza; both engines must agree there too"""
+    analyzer = PoetryAnalyzer()
+    outputs = []
+    for engine in ('numpy', 'midiutil'):
+        stream = MIDIGenerator(engine=engine).stream(INSTRUMENTS, seed=SEED)
+        stanzas = 0
+        for result in analyzer.analyze_stream(POEM.splitlines()):
+            if 'summary' not in result:
+                stream.add_stanza(result)
+                stanzas += 1
+        assert stanzas == 3
+        outputs.append(stream.finish(result['summary']['tempo_suggestion']))
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,42 @@
+import pytest
+from poetry_analyzer import PoetryAnalyzer
+
+# Sonnet 18, with a curly apostrophe in "ow’st" as many printed texts have it
+SONNET_18 = """Shall I compare thee to a summer's day?
+Thou art more lovely and more temperate:
+Rough winds do shake the darling buds of May,
+And summer's lease hath all too short a date;
+Sometime too hot the eye of heaven shines,
+And often is his gold complexion dimm'd;
+And every fair from fair sometime declines,
+By chance or nature's changing course untrimm'd;
+But thy eternal summer shall not fade,
+Nor lose possession of that fair thou ow’st;
+Nor shall death brag thou wander'st in his shade,
+When in eternal lines to time thou grow'st:
+So long as men can breathe or eyes can see,
+So long lives this, and this gives life to thee."""
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return PoetryAnalyzer()
+
+
+def test_elided_words_rhyme_as_whole_words(analyzer):
+    # dimm'd/untrimm'd and ow'st/grow'st rhyme; temperate/date do not, as the
+    # pronunciation dictionary stresses "temperate" on its first syllable
+    assert analyzer.analyze_poem(SONNET_18)['rhyme_pattern'] == 'ABACDEDEFGFGHH'
+
+
+def test_elision_fragment_is_not_a_rhyme(analyzer):
+    poem = "The lamp was dimm'd\nThe night was cold\nThe wick untrimm'd\nThe story told"
+    assert analyzer.analyze_poem(poem)['rhyme_pattern'] == 'ABAB'
+    # A split "kill" + "d" would rhyme the letter D with "see"
+    poem = "The fire was kill'd\nAnd all could see"
+    assert analyzer.analyze_poem(poem)['rhyme_pattern'] == 'AB'
+
+
+def test_apostrophes_keep_words_whole(analyzer):
+    parsed = analyzer.parse_poem("O'er summer's fields thou wander’st")
+    assert [word.text for word in parsed.lines[0].words] == ["o'er", "summer's", 'fields', 'thou', "wander'st"]
@@ -0,0 +1,85 @@
+import json
+import pytest
+
+POEM = "The woods are lovely, dark and deep,\nBut I have promises to keep."
+
+
+def _ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+@pytest.mark.parametrize('payload, error', [
+    ({'poem_text': 42}, 'Poem text must be a string'),
+    ({'poem_text': POEM, 'title': 5}, 'Title must be a string'),
+    ({'poem_text': POEM, 'instruments': 'piano'}, 'Instruments must be a list'),
+    ({'poem_text': '   '}, 'Please provide poem text'),
+    ({'poem_text': POEM, 'seed': -1}, 'Seed must be a non-negative integer'),
+    ({'poem_text': POEM, 'seed': '7'}, 'Seed must be a non-negative integer'),
+])
+def test_analyze_rejects_invalid_fields(client, payload, error):
+    response = client.post('/analyze', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+
+@pytest.mark.parametrize('seed', ['-1', 'seven'])
+def test_stream_rejects_invalid_query_seed(client, seed):
+    response = client.post(f'/analyze/stream?seed={seed}', data=POEM, content_type='text/plain')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Seed must be a non-negative integer'
+
+
+def test_analyze_accepts_zero_seed(client):
+    response = client.post('/analyze', json={'poem_text': POEM, 'seed': 0})
+    assert response.status_code == 200
+
+
+def test_analyze_defaults_null_fields(app, client):
+    from app import db
+    from models import Composition
+
+    response = client.post('/analyze', json={'poem_text': POEM, 'title': None, 'instruments': None})
+    assert response.status_code == 200
+    with app.app_context():
+        composition = db.session.get(Composition, response.get_json()['composition_id'])
+        assert composition.title == 'Untitled Poem'
+        assert composition.instruments == 'piano'
+
+
+def test_batch_rejects_malformed_records_and_saves_the_rest(client):
+    poems = [
+        {'title': 'First', 'poem_text': POEM},
+        {'title': 5, 'poem_text': POEM},
+        {'title': 'Third', 'poem_text': POEM, 'instruments': 'piano'},
+        'not an object',
+        {'title': 'Fifth', 'poem_text': "Roses are red,\nViolets are blue.", 'instruments': ['strings', 7]},
+    ]
+    response = client.post('/analyze/batch', json={'poems': poems, 'instruments': ['piano']})
+    assert response.status_code == 200
+
+    results = {result['index']: result for result in _ndjson(response)}
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert results[1] == {'index': 1, 'success': False, 'error': 'Title must be a string'}
+    assert results[2] == {'index': 2, 'success': False, 'error': 'Instruments must be a list'}
+    assert results[3] == {'index': 3, 'success': False, 'error': 'Each poem must be a JSON object'}
+    for index in (0, 4):
+        assert results[index]['success'], results[index]
+        assert results[index]['composition_id']
+
+
+def test_batch_jsonl_rejects_malformed_lines(client):
+    lines = [
+        json.dumps({'title': 'Good', 'poem_text': POEM}),
+        json.dumps({'title': 'Bad', 'poem_text': ['not', 'text']}),
+        '{not json',
+        json.dumps({'title': 'Also good', 'poem_text': "Roses are red,\nViolets are blue."}),
+    ]
+    response = client.post('/analyze/batch?instruments=piano,flute', data='\n'.join(lines),
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+
+    results = {result['index']: result for result in _ndjson(response)}
+    assert sorted(results) == [0, 1, 2, 3]
+    assert not results[1]['success'] and results[1]['error'] == 'Poem text must be a string'
+    assert not results[2]['success']
+    assert results[0]['success'] and results[3]['success']
@@ -0,0 +1,96 @@
+import os
+import time
+import logging
+import threading
+from sqlalchemy import text
+from app import db
+from poetry_analyzer import preload_models
+
+# Worker warm-up. A fresh worker's first /analyze pays for loading the
+# pronunciation index and sentiment lexicon, compiling regexes, starting the
+# MIDI track threads and opening a database connection. WarmUp does all of
+# that with a canned poem in a background thread when the worker starts;
+# /healthz/ready reports ready only once it has finished, so a load balancer
+# routes traffic to hot workers only.
+
+WARMUP_TITLE = "Warm-up"
+WARMUP_POEM = """Whose woods these are I think I know.
+His house is in the village though;
+He will not see me stopping here
+To watch his woods fill up with snow.
+
+My little horse must think it queer
+To stop without a farmhouse near
+Between the woods and frozen lake
+The darkest evening of the year."""
+
+
+class WarmUp:
+    """
+    Runs the warm-up once per process, in a background thread, and reports its state
+    State is kept per process id, so a warm-up that ran before fork is redone in
+    each worker. A failed warm-up is retried on the next start().
+    """
+
+    def __init__(self, app, analyzer, generator, instruments):
+        self.app = app
+        self.analyzer = analyzer
+        self.generator = generator
+        self.instruments = list(instruments)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.seconds = None
+        self.error = None
+
+    def start(self):
+        """Begin warming up in the background unless it is running or done in this process"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = None
+                self._ready = threading.Event()
+                self.seconds = None
+                self.error = None
+            if self._ready.is_set() or (self._thread is not None and self._thread.is_alive()):
+                return
+            self.error = None
+            self._thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """Warm up in the calling thread; returns True on success"""
+        started = time.perf_counter()
+        try:
+            preload_models(self.analyzer)
+            analysis = self.analyzer.analyze_poem(WARMUP_POEM)
+            # Rendered in memory rather than with generate_composition, which writes to static/midi
+            self.generator.render_midi(analysis, instruments=self.instruments)
+            with self.app.app_context():
+                db.session.execute(text('SELECT 1'))
+                db.session.remove()
+        except Exception as e:
+            self.error = str(e)
+            logging.error(f"Warm-up failed: {e}")
+            return False
+        self.seconds = time.perf_counter() - started
+        self._ready.set()
+        logging.info(f"Worker {os.getpid()} warmed up in {self.seconds * 1000:.0f} ms")
+        return True
+
+    @property
+    def ready(self):
+        return self._pid == os.getpid() and self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Block until this process has warmed up; returns whether it has"""
+        return self._pid == os.getpid() and self._ready.wait(timeout)
+
+    def status(self):
+        if self.ready:
+            return {'status': 'ready', 'warmup_ms': round(self.seconds * 1000, 1)}
+        running = self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+        if not running and self._pid == os.getpid() and self.error is not None:
+            return {'status': 'failed', 'error': self.error}
+        return {'status': 'warming'}